@@ -0,0 +1,236 @@
+"""同步（Flask/WSGI）與非同步（ASGI）任務API的基準測試
+
+在暫存SQLite資料庫中建立任務，以相同的並行數分別呼叫兩種入口，
+比較吞吐量與延遲分位數；最後開啟大量閒置的SSE連線，比較佔用的執行緒數。
+計時前先確認兩種入口對每個端點返回相同的回應標頭（CORS、Server-Timing等）。
+同步路徑以固定大小的執行緒池模擬WSGI worker執行緒，非同步路徑在單一事件迴圈中
+直接呼叫ASGI應用（不經過網路）。
+
+    python benchmarks/async_api.py [任務筆數] [並行數 ...]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+TEMP_DIR = tempfile.mkdtemp()
+os.environ.pop('DATABASE_URL', None)
+
+from src.database import db  # noqa: E402
+
+db.db_path = os.path.join(TEMP_DIR, 'bench.db')
+
+from src.importer import TaskImporter  # noqa: E402
+from src.asgi import app as asgi_app, async_db  # noqa: E402
+from src.main import app as flask_app  # noqa: E402
+
+PHRASES = ('取得市府許可', '贊助名單建置', '主視覺曝光', '交通管制計畫', '場地進場與圍設',
+           '彩排與安全簡報', '媒體投遞', '物料到貨', '居民通知單', '記者會')
+
+# (名稱, 路徑, 查詢字串)；搜尋每次都查詢資料庫，統計在版本不變時命中快取
+ENDPOINTS = (
+    ('search', '/api/tasks/search', 'q=交通&limit=20'),
+    ('list', '/api/tasks', 'limit=50&sort=end_date'),
+    ('stats', '/api/tasks/stats', ''),
+)
+
+# 比較回應標頭時送出的跨域請求標頭
+ORIGIN = 'http://frontend.example'
+
+# 每次請求都不同、比較時只確認存在的標頭
+VOLATILE_HEADERS = {'server-timing', 'content-length', 'date'}
+
+# 同步路徑的worker執行緒數（相當於gunicorn的 --threads）
+SYNC_THREADS = 8
+
+
+def seed(count):
+    rng = random.Random(count)
+    items = [{
+        '階段': f'階段{i % 8}',
+        '里程碑': f'{rng.choice(PHRASES)} {i}',
+        '開始日': f'2025-{i % 12 + 1:02d}-01',
+        '結束日': f'2025-{i % 12 + 1:02d}-20',
+        '內容說明': '；'.join(rng.sample(PHRASES, 3)),
+        '負責人': f'負責人{i % 20}',
+    } for i in range(count)]
+    TaskImporter(batch_size=2000).run(items)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run_sync(path, query, concurrency, total, pool):
+    """以固定並行數的客戶端呼叫Flask應用；請求由大小固定的執行緒池處理，延遲包含排隊時間"""
+    client = flask_app.test_client()
+    url = f'{path}?{query}' if query else path
+    loop = asyncio.get_running_loop()
+    return await drive(concurrency, total, lambda: loop.run_in_executor(pool, lambda: client.get(url).status_code))
+
+
+async def asgi_get(path, query, headers=()):
+    return (await asgi_request(path, query, headers))['status']
+
+
+async def asgi_request(path, query, headers=()):
+    """直接呼叫ASGI應用，返回狀態碼與回應標頭；SSE串流在收到標頭後即斷線"""
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query.encode('utf-8'),
+             'headers': list(headers), 'http_version': '1.1', 'scheme': 'http', 'server': ('bench', 80)}
+    messages = [{'type': 'http.request', 'body': b''}]
+    result = {}
+
+    started = asyncio.Event()
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await started.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            result['status'] = message['status']
+            result['headers'] = {name.decode('latin-1'): value.decode('latin-1')
+                                 for name, value in message['headers']}
+            started.set()
+
+    await asgi_app(scope, receive, send)
+    return result
+
+
+async def compare_headers():
+    """以相同的跨域請求呼叫兩種入口，返回回應標頭不一致的端點"""
+    client = flask_app.test_client()
+    cases = [(name, path, query) for name, path, query in ENDPOINTS]
+    cases += [('stream', '/api/tasks/stream', ''), ('bad query', '/api/tasks/search', 'limit=x'),
+              ('no event', '/api/events/999/tasks', ''), ('bridged', '/api/tasks/graph', '')]
+    loop = asyncio.get_running_loop()
+    mismatches = []
+    for name, path, query in cases:
+        url = f'{path}?{query}' if query else path
+
+        def wsgi_headers():
+            response = client.get(url, headers={'Origin': ORIGIN}, buffered=False)
+            response.close()
+            return response.status_code, {key.lower(): value for key, value in response.headers.items()}
+
+        sync_status, sync_headers = await loop.run_in_executor(None, wsgi_headers)
+        result = await asgi_request(path, query, [(b'origin', ORIGIN.encode('latin-1'))])
+        async_headers = result['headers']
+        differing = sorted(key for key in set(sync_headers) | set(async_headers)
+                           if key not in VOLATILE_HEADERS and sync_headers.get(key) != async_headers.get(key))
+        differing += sorted(key for key in VOLATILE_HEADERS - {'date'}
+                            if (key in sync_headers) != (key in async_headers))
+        if sync_status != result['status'] or differing:
+            mismatches.append((name, sync_status, result['status'], differing))
+    return mismatches
+
+
+async def run_async(path, query, concurrency, total):
+    """以固定並行數的客戶端呼叫ASGI應用"""
+    return await drive(concurrency, total, lambda: asgi_get(path, query))
+
+
+async def drive(concurrency, total, request):
+    """concurrency個客戶端各自連續送出請求，共total個；返回 (每秒請求數, 延遲列表)"""
+    latencies = []
+    remaining = iter(range(total))
+
+    async def client():
+        for _ in remaining:
+            started = time.perf_counter()
+            status = await request()
+            assert status == 200, status
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return total / (time.perf_counter() - started), latencies
+
+
+async def idle_streams(count):
+    """開啟count條SSE連線，寫入一次後確認每條連線都收到事件，返回期間的執行緒數"""
+    received = [0] * count
+    closing = asyncio.Event()
+    delivered = asyncio.Event()
+
+    async def open_stream(index):
+        messages = [{'type': 'http.request', 'body': b''}]
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await closing.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if b'event: task.updated' in message.get('body', b''):
+                received[index] += 1
+                if all(received):
+                    delivered.set()
+
+        scope = {'type': 'http', 'method': 'GET', 'path': '/api/tasks/stream', 'query_string': b'',
+                 'headers': [], 'server': ('bench', 80)}
+        await asgi_app(scope, receive, send)
+
+    streams = [asyncio.ensure_future(open_stream(index)) for index in range(count)]
+    await asyncio.sleep(0.5)
+    threads = threading.active_count()
+    client = flask_app.test_client()
+    await asyncio.get_running_loop().run_in_executor(None, client.put, '/api/tasks/1/toggle-complete')
+    await asyncio.wait_for(delivered.wait(), 30)
+    closing.set()
+    await asyncio.gather(*streams)
+    return threads
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    levels = [int(value) for value in sys.argv[2:]] or [1, 8, 64, 256]
+    db.init_db()
+    seed(size)
+    print(f"{size} tasks, sync path uses {SYNC_THREADS} worker threads, "
+          f"async path uses asyncpg={async_db.native}, {db.async_threads} db threads")
+
+    loop = asyncio.new_event_loop()
+    mismatches = loop.run_until_complete(compare_headers())
+    for name, sync_status, async_status, headers in mismatches:
+        print(f"header mismatch on {name}: sync {sync_status}, async {async_status}, differing {headers}")
+    if mismatches:
+        sys.exit(1)
+    print("sync and async paths return the same response headers")
+    print(f"{'endpoint':<8} {'conc':>5} {'sync rps':>9} {'p50 ms':>7} {'p99 ms':>7} "
+          f"{'async rps':>9} {'p50 ms':>7} {'p99 ms':>7}")
+
+    sync_pool = ThreadPoolExecutor(max_workers=SYNC_THREADS)
+    for name, path, query in ENDPOINTS:
+        for concurrency in levels:
+            total = max(200, concurrency * 4)
+            sync_rps, sync_latencies = loop.run_until_complete(
+                run_sync(path, query, concurrency, total, sync_pool))
+            async_rps, async_latencies = loop.run_until_complete(run_async(path, query, concurrency, total))
+            print(f"{name:<8} {concurrency:>5} {sync_rps:>9.0f} "
+                  f"{percentile(sync_latencies, 0.5) * 1000:>7.2f} {percentile(sync_latencies, 0.99) * 1000:>7.2f} "
+                  f"{async_rps:>9.0f} "
+                  f"{percentile(async_latencies, 0.5) * 1000:>7.2f} {percentile(async_latencies, 0.99) * 1000:>7.2f}")
+
+    for count in (100, 1000):
+        before = threading.active_count()
+        threads = loop.run_until_complete(idle_streams(count))
+        print(f"{count} idle SSE streams on the async path: {threads} threads "
+              f"(was {before}); the sync path needs one worker thread per stream")
+    sync_pool.shutdown()
+    loop.run_until_complete(async_db.close())
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""多活動資料量下進行中活動的延遲基準測試（SQLite）
+
+進行中的活動固定為每場的任務數，之後逐步加入過去的活動（各自匯入同樣筆數後封存），
+每一輪量測進行中活動的分頁列表、統計、全文搜尋與單筆寫入的延遲，並以不限定活動的
+相同查詢作為對照。依活動分開的查詢延遲應不隨過去活動的累積而增加。最後量測封存、
+還原與刪除一場活動的耗時。
+
+    python benchmarks/event_partitions.py [每場筆數] [過去活動數 ...]    # 預設 10k 0 4 16
+"""
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.abspath(ROOT))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+STATS_TODAY = '2026-01-15'
+
+
+def parse_size(text):
+    multiplier = {'k': 1000, 'm': 1000000}.get(text[-1].lower(), 1)
+    return int(float(text.rstrip('kKmM')) * multiplier)
+
+
+def average_ms(func, repeat=20):
+    func()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def timed_ms(func):
+    started = time.perf_counter()
+    func()
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    size = parse_size(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rounds = sorted(int(arg) for arg in sys.argv[2:]) or [0, 4, 16]
+    os.environ.pop('DATABASE_URL', None)
+
+    with tempfile.TemporaryDirectory() as directory:
+        from src.database import db
+        db.db_path = os.path.join(directory, 'tasks.db')
+        db.ensure_schema()
+        from src.importer import TaskImporter
+        from src.models.event import Event, DEFAULT_EVENT_ID
+        from src.models.task import Task
+        from src.search import task_search
+        from api_load import synthetic_rows
+
+        def seed(event_id):
+            TaskImporter(batch_size=5000, event_id=event_id).run(synthetic_rows(size))
+
+        seed(DEFAULT_EVENT_ID)
+        task_id = db.fetch_one("SELECT MIN(id) AS id FROM tasks")['id']
+        stage = db.fetch_one("SELECT stage FROM tasks WHERE id = ?", (task_id,))['stage']
+
+        # 進行中活動的查詢（不經過回應快取），以及不限定活動的對照查詢
+        scoped = (
+            ('list', lambda: Task.query(DEFAULT_EVENT_ID, stage=stage, limit=100)),
+            ('stats', lambda: Task.stats(DEFAULT_EVENT_ID, STATS_TODAY)),
+            ('search', lambda: task_search.search(DEFAULT_EVENT_ID, '交通', 20)),
+            ('write', lambda: Task.toggle_completed(DEFAULT_EVENT_ID, task_id)),
+        )
+        unscoped = (
+            ('list', lambda: db.execute_query(
+                "SELECT * FROM tasks WHERE stage = ? ORDER BY start_date, id LIMIT 101", (stage,))),
+            ('stats', lambda: db.execute_query(
+                "SELECT stage, COUNT(*) AS total, SUM(CASE WHEN completed THEN 1 ELSE 0 END) AS completed "
+                "FROM tasks GROUP BY stage")),
+        )
+
+        print(f"{size} tasks per event; ms per call")
+        print(f"{'past':>5} {'rows':>9} " + ' '.join(f'{name:>8}' for name, _ in scoped)
+              + ' ' + ' '.join(f"{'all ' + name:>10}" for name, _ in unscoped))
+        past = []
+        for count in rounds:
+            while len(past) < count:
+                event = Event.create(f'past {len(past) + 1}')
+                seed(event.id)
+                Event.archive(event.id)
+                past.append(event.id)
+            rows = db.fetch_one("SELECT COUNT(*) AS n FROM tasks")['n']
+            print(f"{count:>5} {rows:>9} "
+                  + ' '.join(f'{average_ms(func):>8.2f}' for _, func in scoped) + ' '
+                  + ' '.join(f'{average_ms(func, 5):>10.2f}' for _, func in unscoped))
+
+        event = Event.create('lifecycle')
+        seed(event.id)
+        print(f"archive {timed_ms(lambda: Event.archive(event.id)):.1f} ms, "
+              f"restore {timed_ms(lambda: Event.restore(event.id)):.1f} ms")
+        Event.archive(event.id)
+        print(f"drop {timed_ms(lambda: Event.drop(event.id)):.1f} ms")
+        db.close_pool()
+
+
+if __name__ == '__main__':
+    main()
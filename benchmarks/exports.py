@@ -0,0 +1,71 @@
+"""CSV／XLSX／iCalendar匯出的基準測試（SQLite）
+
+播種不同筆數的合成任務後，以串流方式讀完每種匯出格式的回應，報告輸出大小、
+耗時與Python配置的記憶體峰值（tracemalloc，另外執行一次）。串流匯出的記憶體峰值
+應與筆數無關。
+
+    python benchmarks/exports.py [筆數 ...]     # 預設 10k 100k
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from itertools import islice
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.abspath(ROOT))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+FORMATS = ('csv', 'xlsx', 'ics')
+
+
+def parse_size(text):
+    multiplier = {'k': 1000, 'm': 1000000}.get(text[-1].lower(), 1)
+    return int(float(text.rstrip('kKmM')) * multiplier)
+
+
+def export(client, fmt):
+    """讀完一次匯出回應，返回位元組數"""
+    response = client.get(f'/api/tasks/export.{fmt}', buffered=False)
+    assert response.status_code == 200, response.status_code
+    size = sum(len(chunk) for chunk in response.response)
+    response.close()
+    return size
+
+
+def main():
+    sizes = [parse_size(arg) for arg in sys.argv[1:]] or [10000, 100000]
+    os.environ.pop('DATABASE_URL', None)
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+    with tempfile.TemporaryDirectory() as directory:
+        from src.database import db
+        db.db_path = os.path.join(directory, 'tasks.db')
+        from src.main import create_app
+        from src.importer import TaskImporter
+        from api_load import synthetic_rows
+
+        app = create_app({'DB_INIT': 'startup'})
+        client = app.test_client()
+        seeded = 0
+        print(f"{'tasks':>8} {'format':<6} {'MB':>8} {'seconds':>8} {'rows/s':>9} {'peak MB':>8}")
+        for size in sorted(sizes):
+            TaskImporter(batch_size=5000).run(islice(synthetic_rows(size), seeded, None))
+            seeded = size
+            for fmt in FORMATS:
+                started = time.perf_counter()
+                length = export(client, fmt)
+                seconds = time.perf_counter() - started
+
+                tracemalloc.start()
+                export(client, fmt)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                print(f"{size:>8} {fmt:<6} {length / 1e6:>8.1f} {seconds:>8.2f} {size / seconds:>9.0f} "
+                      f"{peak / 1e6:>8.2f}")
+        db.close_pool()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""應用啟動時間的基準測試（SQLite）
+
+每種模式各啟動數個新的Python行程，量測匯入、建立應用、資料庫結構檢查或初始化（schema）
+與第一個請求完成的時間（取中位數）：
+
+    eager    匯入時無條件執行所有建表語句（先前的行為）
+    startup  建立應用時檢查待執行的遷移，都已套用時略過
+    lazy     建立應用時不連接資料庫，第一個請求時才檢查
+
+    python benchmarks/startup.py [每種模式的次數]
+"""
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+PROBE = '''
+import json, os, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+os.environ['DB_INIT'] = 'skip'
+from src.database import db
+db.db_path = {db_path!r}
+from src.main import create_app
+mode = {mode!r}
+imported = time.perf_counter()
+if mode == 'eager':
+    app = create_app({{'DB_INIT': 'skip'}})
+    schema_started = time.perf_counter()
+    from src.migrations import migrator
+    for migration in migrator.migrations:
+        with db.transaction() as conn:
+            migrator.run(migration, conn.cursor())
+    schema = time.perf_counter() - schema_started
+else:
+    app = create_app({{'DB_INIT': mode}})
+created = time.perf_counter()
+response = app.test_client().get('/api/tasks?limit=1')
+assert response.status_code == 200, response.data
+finished = time.perf_counter()
+if mode != 'eager':
+    schema = db.schema_status['seconds']
+print(json.dumps({{'import': imported - started, 'create': created - imported, 'schema': schema,
+                  'first_request': finished - created, 'total': finished - started}}))
+'''
+
+
+def probe(mode, db_path):
+    code = PROBE.format(root=os.path.abspath(ROOT), db_path=db_path, mode=mode)
+    env = dict(os.environ, SECRET_KEY='benchmark')
+    env.pop('DATABASE_URL', None)
+    output = subprocess.run([sys.executable, '-c', code], env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, 'tasks.db')
+        shutil.copy(os.path.join(ROOT, 'tasks.db'), db_path)
+        # 先初始化一次，之後的啟動都面對已是最新版本的結構
+        probe('startup', db_path)
+
+        print(f"{'mode':<8} {'import ms':>10} {'create ms':>10} {'schema ms':>10} "
+              f"{'first req ms':>13} {'total ms':>9}")
+        for mode in ('eager', 'startup', 'lazy'):
+            results = [probe(mode, db_path) for _ in range(runs)]
+            medians = {key: statistics.median(result[key] for result in results) * 1000 for key in results[0]}
+            print(f"{mode:<8} {medians['import']:>10.1f} {medians['create']:>10.1f} {medians['schema']:>10.2f} "
+                  f"{medians['first_request']:>13.1f} {medians['total']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""任務相依圖的基準測試
+
+以合成資料建立相依圖（不經過資料庫），量測完整建立、單筆增量更新、
+拓撲排序、循環檢查、要徑與影響分析的耗時。
+
+    python benchmarks/task_graph.py [任務數]
+"""
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.graph import DependencyGraph  # noqa: E402
+from src.models.task import Task  # noqa: E402
+
+STAGES = ('法規/許可', '贊助', '設計', '行銷', '交通', '場地')
+WORDS = ('場地', '路權', '物料', '主視覺', '媒體', '贊助', '彩排', '安全', '簽約', '設計', '規格', '名單')
+
+
+def make_tasks(count, seed=42):
+    """產生以名稱或ID互相參照的任務"""
+    rng = random.Random(seed)
+    base = date(2025, 1, 1)
+    tasks = []
+    for task_id in range(1, count + 1):
+        start = base + timedelta(days=task_id // 20)
+        milestone = f"{rng.choice(WORDS)}{rng.choice(WORDS)} 里程碑{task_id}"
+        references = []
+        for _ in range(rng.randint(0, 3)):
+            if task_id > 1:
+                pred = rng.randint(max(1, task_id - 200), task_id - 1)
+                references.append(f"#{pred}" if rng.random() < 0.5 else f"里程碑{pred}完成")
+        tasks.append(Task(id=task_id, stage=rng.choice(STAGES), milestone=milestone,
+                          start_date=start.isoformat(),
+                          end_date=(start + timedelta(days=rng.randint(0, 10))).isoformat(),
+                          dependencies='、'.join(references) or '—', change_seq=task_id))
+    return tasks
+
+
+def timed(label, func):
+    started = time.perf_counter()
+    result = func()
+    print(f"  {label:<28} {(time.perf_counter() - started) * 1000:8.2f} ms")
+    return result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    tasks = make_tasks(count)
+    graph = DependencyGraph()
+    print(f"{count} tasks")
+
+    timed('full build', lambda: graph.apply(tasks, []))
+    print(f"  {'edges':<28} {len(graph.edges()):8d}")
+    timed('topological order', graph.topological_order)
+    timed('cycles', graph.cycles)
+    timed('critical path', graph.critical_path)
+    timed('impact (first task, +5d)', lambda: graph.impact(1, 5))
+
+    changed = tasks[count // 2]
+    moved = Task(id=changed.id, stage=changed.stage, milestone=changed.milestone + ' v2',
+                 start_date=changed.start_date, end_date=changed.end_date,
+                 dependencies=f"#{changed.id - 1}", change_seq=count + 1)
+    timed('incremental update (1 task)', lambda: graph.apply([moved], []))
+    timed('topological order (after)', graph.topological_order)
+    timed('critical path (after)', graph.critical_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""區間索引的基準測試
+
+比較區間樹與逐筆掃描在時間窗查詢與「某日進行中」查詢的耗時。
+
+    python benchmarks/task_intervals.py [任務數]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.intervals import IntervalTree  # noqa: E402
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rng = random.Random(7)
+    intervals = []
+    for item_id in range(count):
+        start = rng.randint(0, 3650)
+        intervals.append((start, start + rng.randint(0, 30), item_id))
+
+    tree = IntervalTree(seed=7)
+    started = time.perf_counter()
+    for start, end, item_id in intervals:
+        tree.insert(start, end, item_id)
+    print(f"{count} intervals, build {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    windows = [(day, day + width) for day, width in
+               ((rng.randint(0, 3650), rng.choice((0, 7, 30))) for _ in range(200))]
+    for label, query in (
+        ('interval tree', lambda low, high: tree.overlapping(low, high)),
+        ('linear scan', lambda low, high: [item for item in intervals if item[0] <= high and item[1] >= low]),
+    ):
+        started = time.perf_counter()
+        for low, high in windows:
+            query(low, high)
+        elapsed = (time.perf_counter() - started) / len(windows)
+        print(f"  {label:<14} {elapsed * 1000:8.3f} ms/query")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""並行寫入同一批任務時的遺失更新與樂觀並行控制（version / If-Match）的基準測試
+
+多個寫入者同時對少數幾個任務做「讀取 → 修改 → 寫回」（將description視為計數器加一），
+讀取與寫回是兩個獨立的請求：
+
+    blind    寫回時不帶版本號（先前的行為），同時寫入會互相覆蓋
+    occ      寫回時帶If-Match，收到409時以回應中的目前任務重新計算後重試
+
+每種模式報告寫入吞吐量、每次成功加一的延遲（含重試）、衝突次數與遺失的更新數。
+預設使用tasks.db的暫存複本；設定 BENCH_DATABASE_URL 時改用該PostgreSQL資料庫，
+測試任務在結束時刪除。
+
+    python benchmarks/task_occ.py [--writers 8] [--increments 50] [--tasks 1]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.abspath(ROOT))
+
+MODES = ('blind', 'occ')
+
+
+def run_mode(app, mode, writers, increments, tasks):
+    """以writers個執行緒對tasks個任務各做increments次加一，返回統計結果"""
+    from src.models.event import DEFAULT_EVENT_ID
+    from src.models.task import Task
+
+    client = app.test_client()
+    ids = []
+    for index in range(tasks):
+        response = client.post('/api/tasks', json={
+            'stage': 'benchmark', 'milestone': f'occ-{mode}-{index}', 'startDate': '2025-01-01',
+            'endDate': '2025-01-02', 'description': '0'})
+        assert response.status_code == 201, response.data
+        ids.append(response.get_json()['id'])
+
+    latencies = []
+    counters = {'conflicts': 0, 'errors': 0}
+    lock = threading.Lock()
+    start = threading.Barrier(writers + 1)
+
+    def writer(number):
+        client = app.test_client()
+        task_id = ids[number % tasks]
+        conflicts = errors = 0
+        timings = []
+        start.wait()
+        for _ in range(increments):
+            began = time.perf_counter()
+            current = Task.get_by_id(DEFAULT_EVENT_ID, task_id).to_dict()
+            while True:
+                data = {'description': str(int(current['description']) + 1)}
+                headers = {'If-Match': f'"{current["version"]}"'} if mode == 'occ' else {}
+                response = client.patch(f'/api/tasks/{task_id}', json=data, headers=headers)
+                if response.status_code == 409:
+                    conflicts += 1
+                    current = response.get_json()['current']
+                    continue
+                if response.status_code != 200:
+                    errors += 1
+                break
+            timings.append(time.perf_counter() - began)
+        with lock:
+            latencies.extend(timings)
+            counters['conflicts'] += conflicts
+            counters['errors'] += errors
+
+    threads = [threading.Thread(target=writer, args=(number,)) for number in range(writers)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+
+    applied = 0
+    for task_id in ids:
+        applied += int(Task.get_by_id(DEFAULT_EVENT_ID, task_id).content)
+        client.delete(f'/api/tasks/{task_id}')
+
+    latencies.sort()
+    expected = writers * increments - counters['errors']
+    return {
+        'writes_per_second': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        'conflicts': counters['conflicts'],
+        'errors': counters['errors'],
+        'lost': expected - applied,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=8, help="並行寫入者數量")
+    parser.add_argument('--increments', type=int, default=50, help="每個寫入者的加一次數")
+    parser.add_argument('--tasks', type=int, default=1, help="被寫入的任務數量，越少衝突越多")
+    args = parser.parse_args()
+
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    directory = None
+    if os.getenv('BENCH_DATABASE_URL'):
+        os.environ['DATABASE_URL'] = os.environ['BENCH_DATABASE_URL']
+    else:
+        os.environ.pop('DATABASE_URL', None)
+        directory = tempfile.mkdtemp()
+        shutil.copy(os.path.join(ROOT, 'tasks.db'), os.path.join(directory, 'tasks.db'))
+
+    from src.database import db
+    if directory is not None:
+        db.db_path = os.path.join(directory, 'tasks.db')
+    from src.main import create_app
+
+    try:
+        app = create_app({'DB_INIT': 'startup'})
+        print(f"{args.writers} writers × {args.increments} increments on {args.tasks} task(s), "
+              f"{'postgresql' if not db.use_sqlite else 'sqlite'}")
+        print(f"{'mode':<6} {'writes/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'conflicts':>10} "
+              f"{'errors':>7} {'lost':>6}")
+        for mode in MODES:
+            result = run_mode(app, mode, args.writers, args.increments, args.tasks)
+            print(f"{mode:<6} {result['writes_per_second']:>9.1f} {result['p50_ms']:>8.2f} "
+                  f"{result['p95_ms']:>8.2f} {result['conflicts']:>10} {result['errors']:>7} "
+                  f"{result['lost']:>6}")
+    finally:
+        db.close_pool()
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Task 資料列轉換的微基準測試
+
+比較舊版（__dict__ 物件 + from_dict/to_dict）與目前（__slots__ + 預先編譯的
+欄位對應）每筆資料列的轉換時間與物件佔用的記憶體。
+
+    python benchmarks/task_serialization.py [筆數]
+"""
+import os
+import sqlite3
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.models.task import Task, TASK_COLUMNS  # noqa: E402
+
+
+class LegacyTask:
+    """改版前的Task：一般類別、別名查詢與逐欄位型別檢查"""
+
+    def __init__(self, id=None, stage=None, milestone=None, start_date=None,
+                 end_date=None, content=None, holiday_impact=None,
+                 dependencies=None, responsible=None, risks=None,
+                 completed=None, created_at=None, updated_at=None, change_seq=None):
+        self.id = id
+        self.stage = stage
+        self.milestone = milestone
+        self.start_date = start_date
+        self.end_date = end_date
+        self.content = content
+        self.holiday_impact = holiday_impact
+        self.dependencies = dependencies
+        self.responsible = responsible
+        self.risks = risks
+        self.completed = completed
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.change_seq = change_seq
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'stage': self.stage,
+            'milestone': self.milestone,
+            'startDate': self.start_date,
+            'endDate': self.end_date,
+            'description': self.content,
+            'holidayImpact': self.holiday_impact,
+            'dependencies': self.dependencies,
+            'responsible': self.responsible,
+            'risks': self.risks,
+            'isCompleted': self.completed,
+            'created_at': self.created_at.isoformat() if isinstance(self.created_at, datetime) else self.created_at,
+            'updated_at': self.updated_at.isoformat() if isinstance(self.updated_at, datetime) else self.updated_at,
+            'changeSeq': self.change_seq
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            id=data.get('id'),
+            stage=data.get('stage'),
+            milestone=data.get('milestone'),
+            start_date=data.get('start_date') or data.get('startDate'),
+            end_date=data.get('end_date') or data.get('endDate'),
+            content=data.get('content') or data.get('description'),
+            holiday_impact=data.get('holiday_impact') or data.get('holidayImpact'),
+            dependencies=data.get('dependencies'),
+            responsible=data.get('responsible'),
+            risks=data.get('risks'),
+            completed=data.get('completed'),
+            created_at=data.get('created_at'),
+            updated_at=data.get('updated_at'),
+            change_seq=data.get('change_seq')
+        )
+
+
+def load_rows(count):
+    """在記憶體資料庫中建立測試資料並以sqlite3.Row取回"""
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"CREATE TABLE tasks ({', '.join(TASK_COLUMNS)})")
+    conn.executemany(
+        f"INSERT INTO tasks VALUES ({', '.join('?' for _ in TASK_COLUMNS)})",
+        [(i, f'階段{i % 7}', f'里程碑{i}', '2025-01-01', '2025-02-01', '內容說明' * 4,
+          '無', f'里程碑{i - 1}', '負責單位', '風險', i % 2 == 0,
+          '2025-01-01 00:00:00', '2025-01-02 00:00:00', i, 1, 1)
+         for i in range(count)])
+    return conn.execute("SELECT * FROM tasks").fetchall()
+
+
+def per_row_microseconds(func, rows, repeat=5):
+    """以整批轉換計時，取多次執行中最快的一次，換算為每筆微秒"""
+    best = min(timeit.repeat(lambda: func(rows), number=1, repeat=repeat))
+    return best / len(rows) * 1e6
+
+
+def retained_bytes(factory, rows):
+    """建立所有物件後仍佔用的記憶體"""
+    tracemalloc.start()
+    objects = factory(rows)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return size
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rows = load_rows(count)
+
+    cases = [
+        ('legacy row -> dict -> Task -> wire', lambda batch: [LegacyTask.from_dict(dict(row)).to_dict() for row in batch]),
+        ('slots  row -> Task -> wire', lambda batch: [task.to_dict() for task in Task.from_rows(batch)]),
+        ('mapper row -> wire', Task.rows_to_wire),
+    ]
+    print(f"{count} rows")
+    for label, func in cases:
+        print(f"  {label:<36} {per_row_microseconds(func, rows):6.2f} us/row")
+
+    legacy = retained_bytes(lambda batch: [LegacyTask.from_dict(dict(row)) for row in batch], rows)
+    slots = retained_bytes(Task.from_rows, rows)
+    print(f"  {'legacy Task objects':<36} {legacy / count:6.0f} bytes/row")
+    print(f"  {'slots Task objects':<36} {slots / count:6.0f} bytes/row")
+
+
+if __name__ == '__main__':
+    main()
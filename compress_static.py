@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+預先壓縮靜態檔案：為 static/ 中可壓縮的檔案產生 .gz（以及安裝 brotli 時的 .br）
+"""
+
+import gzip
+import mimetypes
+import os
+import sys
+
+# 添加專案路徑
+sys.path.insert(0, os.path.dirname(__file__))
+
+from src.static_files import ENCODINGS, is_compressible
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 太小的檔案壓縮後節省有限
+MIN_SIZE = 1024
+
+def compress_file(path):
+    """產生壓縮版本，只保留比原檔小的結果；返回產生的副檔名列表"""
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    compressors = {'.gz': lambda content: gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressors['.br'] = lambda content: brotli.compress(content, quality=11)
+
+    written = []
+    for suffix, compress in compressors.items():
+        compressed = compress(data)
+        target = path + suffix
+        if len(compressed) < len(data):
+            with open(target, 'wb') as f:
+                f.write(compressed)
+            written.append(f"{suffix} {len(data)} → {len(compressed)}")
+        elif os.path.exists(target):
+            os.remove(target)
+    return written
+
+def compress_static(root):
+    """壓縮目錄中所有可壓縮的檔案"""
+    suffixes = tuple(suffix for _, suffix in ENCODINGS)
+    for directory, _, names in os.walk(root):
+        for name in sorted(names):
+            if name.endswith(suffixes):
+                continue
+            path = os.path.join(directory, name)
+            if os.path.getsize(path) < MIN_SIZE or not is_compressible(mimetypes.guess_type(name)[0]):
+                continue
+            for line in compress_file(path):
+                print(f"  {os.path.relpath(path, root)} {line}")
+
+if __name__ == "__main__":
+    root = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), 'static')
+    if brotli is None:
+        print("未安裝 brotli，只產生 .gz 檔案")
+    compress_static(root)
+    print("壓縮完成！")
@@ -3,36 +3,28 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(__file__))
 
-from src.main import app, db
+from src.database import db
+from src.models.event import DEFAULT_EVENT_ID
 from src.models.task import Task
+from src.importer import TaskImporter
 
 def init_database():
-    with app.app_context():
-        # 清空現有資料
-        Task.query.delete()
-        
-        # 讀取初始資料
-        with open('excel_data.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # 插入初始資料
-        for item in data:
-            task = Task(
-                stage=item.get('階段', ''),
-                startDate=item.get('開始日', ''),
-                endDate=item.get('結束日', ''),
-                milestone=item.get('里程碑', ''),
-                description=item.get('內容說明', ''),
-                holidayImpact=item.get('假期影響', ''),
-                dependencies=item.get('相依關係', ''),
-                responsible=item.get('負責單位/人', ''),
-                risks=item.get('風險/備註', '')
-            )
-            db.session.add(task)
-        
-        db.session.commit()
-        print(f"成功初始化 {len(data)} 筆資料")
+    db.ensure_schema()
+
+    with db.transaction():
+        # 清空預設活動現有的資料
+        task_ids = [row['id'] for row in db.execute_query(
+            f"SELECT id FROM tasks WHERE event_id = {db.placeholder}", (DEFAULT_EVENT_ID,))]
+        if task_ids:
+            Task.apply_bulk(DEFAULT_EVENT_ID, [{'op': 'delete', 'id': task_id} for task_id in task_ids])
+
+        # 讀取並插入初始資料
+        with open(os.path.join(os.path.dirname(__file__), 'excel_data.json'), 'r', encoding='utf-8') as f:
+            result = TaskImporter().import_file(f)
+
+    for error in result['errors']:
+        print(f"✗ 第 {error['row']} 筆 {error['milestone'] or 'Unknown'} - {error['error']}")
+    print(f"成功初始化 {result['imported']} 筆資料")
 
 if __name__ == '__main__':
     init_database()
-
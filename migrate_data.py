@@ -3,16 +3,16 @@
 資料遷移腳本：將現有的SQLite資料遷移到新的資料庫結構
 """
 
-import json
 import os
 import sys
-from datetime import datetime
 
 # 添加專案路徑
 sys.path.insert(0, os.path.dirname(__file__))
 
-from src.database import db
+from src.database import db, ROLLUP_DIMENSIONS
+from src.models.event import DEFAULT_EVENT_ID
 from src.models.task import Task
+from src.importer import TaskImporter
 
 def migrate_from_json():
     """從JSON檔案遷移資料"""
@@ -22,61 +22,48 @@ def migrate_from_json():
         print(f"找不到資料檔案: {json_file}")
         return
     
-    with open(json_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    print(f"開始遷移 {len(data)} 筆資料...")
+    print("開始遷移資料...")
     
     # 初始化資料庫
     db.init_db()
     
-    migrated_count = 0
+    # 串流讀取並批次寫入，整個匯入在同一個交易中完成
+    with open(json_file, 'r', encoding='utf-8') as f:
+        result = TaskImporter().import_file(f)
     
-    for item in data:
-        try:
-            # 創建新任務
-            task = Task(
-                stage=item.get('階段', ''),
-                milestone=item.get('里程碑', ''),
-                start_date=item.get('開始日期', ''),
-                end_date=item.get('結束日期', ''),
-                content=item.get('內容說明', ''),
-                holiday_impact=item.get('假期影響', ''),
-                dependencies=item.get('相依關係', ''),
-                responsible=item.get('負責單位/人', ''),
-                risks=item.get('風險/備註', '')
-            )
-            
-            # 保存任務
-            saved_task = task.save()
-            if saved_task:
-                migrated_count += 1
-                print(f"✓ 遷移成功: {task.milestone}")
-            else:
-                print(f"✗ 遷移失敗: {task.milestone}")
-                
-        except Exception as e:
-            print(f"✗ 遷移錯誤: {item.get('里程碑', 'Unknown')} - {str(e)}")
+    for error in result['errors']:
+        print(f"✗ 遷移錯誤: 第 {error['row']} 筆 {error['milestone'] or 'Unknown'} - {error['error']}")
     
-    print(f"\n遷移完成！成功遷移 {migrated_count} 筆資料")
+    print(f"\n遷移完成！共 {result['total']} 筆資料："
+          f"新增 {result['inserted']} 筆、更新 {result['updated']} 筆、未變更 {result['unchanged']} 筆")
+    print(f"耗時 {result['elapsed_seconds']} 秒（{result['rows_per_second']} 筆/秒）")
 
 def verify_migration():
     """驗證遷移結果"""
     print("\n驗證遷移結果...")
     
     try:
-        tasks = Task.get_all()
-        print(f"資料庫中共有 {len(tasks)} 筆任務")
-        
-        # 按階段統計
-        stage_counts = {}
-        for task in tasks:
-            stage = task.stage
-            stage_counts[stage] = stage_counts.get(stage, 0) + 1
+        stats = Task.stats(DEFAULT_EVENT_ID)
+        print(f"資料庫中共有 {stats['total']} 筆任務")
         
+        # 按階段統計（讀取彙總表）
         print("\n各階段任務數量:")
-        for stage, count in stage_counts.items():
-            print(f"  {stage}: {count} 筆")
+        for group in stats['byStage']:
+            print(f"  {group['stage']}: {group['total']} 筆")
+        
+        # 彙總表應與直接GROUP BY的結果一致
+        for dimension in ROLLUP_DIMENSIONS:
+            expected = Task.group_counts(dimension)
+            actual = {(row['event_id'], row['group_key']): (row['total'], row['completed'])
+                      for row in db.execute_query(
+                          f"SELECT event_id, group_key, total, completed FROM task_rollups "
+                          f"WHERE dimension = {db.placeholder}", (dimension,))}
+            if actual != expected:
+                print(f"✗ 彙總表（{dimension}）與任務資料不一致，重新計算")
+                db.rebuild_rollups()
+                break
+        else:
+            print("\n彙總表與任務資料一致")
             
     except Exception as e:
         print(f"驗證失敗: {str(e)}")
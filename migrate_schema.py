@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+結構遷移腳本：套用src/migrations.py中尚未執行的資料庫結構遷移
+
+    python migrate_schema.py             # 套用所有待執行的遷移
+    python migrate_schema.py --to 3      # 只套用到第3版
+    python migrate_schema.py status      # 列出已套用與待執行的遷移
+"""
+
+import argparse
+import os
+import sys
+
+# 添加專案路徑
+sys.path.insert(0, os.path.dirname(__file__))
+
+from src.migrations import migrator
+
+def show_status():
+    """列出每個遷移的狀態"""
+    applied = migrator.applied()
+    for migration in migrator.migrations:
+        row = applied.get(migration.version)
+        if row:
+            print(f"  ✓ {migration.version:04d} {migration.name}（{row['applied_at']}，{row['duration_ms']} ms）")
+        else:
+            print(f"  · {migration.version:04d} {migration.name}（待執行）")
+
+def migrate(target):
+    """套用待執行的遷移"""
+    pending = migrator.pending(target)
+    if not pending:
+        print("資料庫結構已是最新版本")
+        return
+
+    print(f"待執行 {len(pending)} 個遷移...")
+    for migration in migrator.migrate(target):
+        print(f"✓ {migration.version:04d} {migration.name}")
+    print("\n遷移完成！")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Wonder Charge 活動管理系統 - 結構遷移工具")
+    parser.add_argument('command', nargs='?', choices=('up', 'status'), default='up')
+    parser.add_argument('--to', type=int, help="只套用到指定版本")
+    args = parser.parse_args()
+
+    print("Wonder Charge 活動管理系統 - 結構遷移工具")
+    print("=" * 50)
+
+    if args.command == 'status':
+        show_status()
+    else:
+        migrate(args.to)
@@ -0,0 +1,581 @@
+"""
+任務API的非同步（ASGI）入口
+
+    uvicorn src.asgi:app --workers 2
+
+路由沿用Flask應用的url_map；只有四個讀取量大的GET端點（任務列表、搜尋、統計與SSE串流，
+含 /api/events/<event_id>/ 下的相同路由）以非同步方式處理，等待資料庫時不佔用執行緒；
+其餘端點（包括所有寫入）在ASGI_WSGI_THREADS個執行緒中交給原本的WSGI應用處理，
+行為與同步版本一致。PostgreSQL時使用asyncpg連接池（requirements.txt已列入），
+SQLite的資料庫呼叫在執行緒池中執行。
+"""
+
+import asyncio
+import contextvars
+import io
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from flask import g
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import RequestRedirect
+from werkzeug.wrappers import Request
+from .database import db, Statement
+from .metrics import metrics
+from .models.event import Event, EventUnavailable, SELECT_EVENT, SELECT_EVENT_VERSION
+from .models.task import Task, DEFAULT_PAGE_SIZE, SELECT_ROLLUPS, SELECT_OVERDUE_COUNTS
+from .events import task_events, HEARTBEAT_SECONDS, RETRY_MILLISECONDS
+from .search import task_search
+from .routes import task as task_routes
+from .main import app as flask_app
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+logger = logging.getLogger(__name__)
+
+# 交給WSGI應用處理的請求使用的執行緒數
+WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS') or 16)
+
+# 非同步請求的讀取副本狀態：None表示查詢使用主資料庫，否則為記錄請求所選副本的字典
+replica_read = contextvars.ContextVar('replica_read', default=None)
+
+# 副本發生這些錯誤時改由主資料庫重試，並在一段時間內不再選用該副本
+ASYNC_REPLICA_ERRORS = (OSError, asyncio.TimeoutError) + (
+    (asyncpg.PostgresConnectionError, asyncpg.InterfaceError) if asyncpg is not None else ())
+
+# 任務路由註冊的藍圖名稱：/api/tasks... 與 /api/events/<event_id>/tasks...
+TASK_BLUEPRINTS = ('task_bp', 'event_task_bp')
+
+
+def numbered(query):
+    """將psycopg2的 %s 佔位符轉換為asyncpg的 $1, $2, ..."""
+    parts = query.split('%s')
+    return ''.join(part + (f'${index + 1}' if index < len(parts) - 1 else '')
+                   for index, part in enumerate(parts)).replace('%%', '%')
+
+
+def _encode_date(value):
+    return value if isinstance(value, str) else value.isoformat()
+
+
+def _on_replica(pinned, func, *args):
+    """在執行緒池中以請求選用的副本執行同步查詢"""
+    with db.replica_reads(pinned):
+        return func(*args)
+
+
+async def _init_connection(conn):
+    """日期以文字格式傳遞：參數可直接使用 YYYY-MM-DD 字串，結果與psycopg2相同為date物件"""
+    await conn.set_type_codec('date', schema='pg_catalog', format='text',
+                              encoder=_encode_date, decoder=date.fromisoformat)
+
+
+class AsyncDatabase:
+    """非同步請求使用的資料庫存取
+
+    PostgreSQL且安裝了asyncpg時，查詢在asyncpg連接池上執行，等待中的查詢不佔用執行緒；
+    其餘情況在執行緒池中呼叫同步的db方法。語句沿用Statement與Task產生的SQL。
+    請求設定了replica_read時，唯讀查詢與同步路徑相同地由讀取副本執行，
+    副本的選擇與健康狀態共用db.replicas。
+    """
+
+    def __init__(self):
+        # 主資料庫的連接池鍵為None，讀取副本為其在db.replica_targets中的索引
+        self._pools = {}
+        self._pool_lock = None
+        self._executor = None
+
+    @property
+    def native(self):
+        """是否使用asyncpg"""
+        return not db.use_sqlite and asyncpg is not None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=db.async_threads, thread_name_prefix='async-db')
+        return self._executor
+
+    async def run(self, func, *args):
+        """在資料庫執行緒池中執行同步函式；沿用目前的context，查詢計入發起的請求"""
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.executor, context.run, func, *args)
+
+    async def pool(self, replica=None):
+        """取得主資料庫或指定讀取副本的asyncpg連接池（延遲建立）
+
+        副本的連接池建立時不連線，副本無法使用時不影響其他請求。
+        """
+        if replica not in self._pools:
+            if self._pool_lock is None:
+                self._pool_lock = asyncio.Lock()
+            async with self._pool_lock:
+                if replica not in self._pools:
+                    self._pools[replica] = await asyncpg.create_pool(
+                        db.database_url if replica is None else db.replica_targets[replica],
+                        min_size=db.pool_min_size if replica is None else 0,
+                        max_size=db.async_pool_max_size,
+                        max_inactive_connection_lifetime=db.pool_max_lifetime,
+                        init=_init_connection,
+                    )
+        return self._pools[replica]
+
+    def choose_replica(self, query):
+        """請求可使用副本且為唯讀查詢時選擇副本（優先沿用請求已選的副本），否則返回None"""
+        pinned = replica_read.get()
+        if pinned is None:
+            return None
+        if metrics.operation(str(query.sql if isinstance(query, Statement) else query)) != 'select':
+            return None
+        pinned['replica'] = db.replicas.choose(pinned.get('replica'))
+        return pinned['replica']
+
+    async def fetch_all(self, query, params=None):
+        """執行查詢並返回字典列表；query可為Statement或以目前資料庫佔位符撰寫的SQL"""
+        replica = self.choose_replica(query)
+        if not self.native:
+            func = db.fetch_all if isinstance(query, Statement) else db.execute_query
+            if replica is None:
+                return await self.run(func, query, params)
+            return await self.run(_on_replica, replica_read.get(), func, query, params)
+
+        # asyncpg在每條連接上自動準備並快取語句
+        sql = query.numeric_sql if isinstance(query, Statement) else numbered(query)
+        if replica is not None:
+            try:
+                rows = await self._fetch(await self.pool(replica), sql, params)
+            except ASYNC_REPLICA_ERRORS as e:
+                # 與同步路徑相同：主資料庫也失敗時視為查詢本身的錯誤，不標記副本失效
+                rows = await self._fetch(await self.pool(), sql, params)
+                db.replicas.mark_down(replica, e)
+                replica_read.get()['replica'] = None
+                return rows
+            db.replicas.record_read(replica)
+            return rows
+        return await self._fetch(await self.pool(), sql, params)
+
+    async def _fetch(self, pool, sql, params):
+        async with pool.acquire() as conn:
+            started = time.perf_counter()
+            rows = await conn.fetch(sql, *(params or ()))
+            metrics.observe_query(sql, time.perf_counter() - started, len(rows))
+        return [dict(row) for row in rows]
+
+    async def fetch_one(self, query, params=None):
+        """執行查詢並返回第一筆結果，沒有結果時返回None"""
+        rows = await self.fetch_all(query, params)
+        return rows[0] if rows else None
+
+    async def event_version(self, event_id):
+        """活動最後一次變更的序號"""
+        row = await self.fetch_one(SELECT_EVENT_VERSION, (event_id,))
+        return row['version'] if row else 0
+
+    async def close(self):
+        """關閉連接池與執行緒池"""
+        pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            await pool.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+# 全域非同步資料庫實例
+async_db = AsyncDatabase()
+
+
+def wsgi_environ(scope, body):
+    """由ASGI的scope建立WSGI environ"""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = name if name == 'CONTENT_TYPE' else f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+class AsyncTaskApp:
+    """包裝Flask應用的ASGI應用
+
+    依Flask的url_map比對路由；有非同步處理函式的端點直接處理，
+    其餘請求（寫入、索引類端點、靜態檔案、錯誤頁）在執行緒池中交給WSGI應用。
+    """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        handlers = {
+            'get_tasks': self.get_tasks,
+            'search_tasks': self.search_tasks,
+            'get_task_stats': self.get_task_stats,
+        }
+        self.handlers = {f'{blueprint}.{name}': handler
+                         for blueprint in TASK_BLUEPRINTS for name, handler in handlers.items()}
+        self.stream_endpoints = {f'{blueprint}.stream_tasks' for blueprint in TASK_BLUEPRINTS}
+        self._wsgi_executor = None
+
+    @property
+    def wsgi_executor(self):
+        if self._wsgi_executor is None:
+            self._wsgi_executor = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix='asgi-wsgi')
+        return self._wsgi_executor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.extend(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+
+        environ = wsgi_environ(scope, bytes(body))
+        rule, args = self.match(environ)
+        endpoint = rule.endpoint if rule is not None else None
+        # 未指定活動的舊版路由使用預設活動
+        event_id = args.get('event_id', self.flask_app.config['DEFAULT_EVENT_ID'])
+        if endpoint in self.stream_endpoints:
+            replica_read.set(None)
+            if self.flask_app.config['DB_INIT'] == 'lazy' and not db.schema_ready:
+                await async_db.run(db.ensure_schema)
+            await self.stream_tasks(Request(environ), event_id, receive, send)
+            return
+        handler = self.handlers.get(endpoint)
+        response = None
+        if handler is not None:
+            if self.flask_app.config['DB_INIT'] == 'lazy' and not db.schema_ready:
+                await async_db.run(db.ensure_schema)
+            started = time.perf_counter()
+            metrics.begin_request('GET', environ['PATH_INFO'])
+            request = Request(environ)
+            # 與同步路徑相同地由讀取副本執行唯讀查詢；SSE串流補送事件時使用主資料庫，
+            # 避免副本落後時跳過尚未複製的變更
+            replica_read.set({} if db.wants_replica_reads(request.method, request.cookies) else None)
+            response = await self.call_handler(handler, request, event_id)
+        if response is None:
+            # 交給WSGI應用的請求由Flask的中介層計時
+            await self.call_wsgi(environ, send)
+        else:
+            await self.send_response(self.process_response(response, environ, started), send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if not db.use_sqlite and asyncpg is None:
+                    logger.warning("asyncpg is not installed: async handlers run PostgreSQL queries on "
+                                   "the DB_ASYNC_THREADS thread pool (pip install -r requirements.txt)")
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await async_db.close()
+                if self._wsgi_executor is not None:
+                    self._wsgi_executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def match(self, environ):
+        """以Flask的url_map比對路由規則，返回 (規則, 網址參數)；只處理GET，其他情況規則為None交給WSGI應用"""
+        if environ['REQUEST_METHOD'] != 'GET':
+            return None, {}
+        try:
+            return self.flask_app.url_map.bind_to_environ(environ).match(return_rule=True)
+        except (HTTPException, RequestRedirect):
+            return None, {}
+
+    async def load_event(self, event_id):
+        """載入可讀取的活動；不存在或已封存時拋出EventUnavailable"""
+        return Event.available(await async_db.fetch_one(SELECT_EVENT, (event_id,)), event_id)
+
+    async def call_handler(self, handler, request, event_id):
+        """載入活動後執行非同步處理函式，錯誤回應格式與Flask路由相同"""
+        try:
+            return await handler(request, await self.load_event(event_id))
+        except EventUnavailable as e:
+            return self.event_unavailable(e)
+        except ValueError as e:
+            return self.json_response({"error": str(e)}, 400)
+        except Exception as e:
+            logger.exception("async handler failed")
+            return self.json_response({"error": str(e)}, 500)
+
+    def process_response(self, response, environ, started):
+        """在請求情境中執行Flask的after_request（CORS、Server-Timing與請求計時），
+        非同步處理的回應標頭與交給WSGI應用的路由一致"""
+        with self.flask_app.request_context(environ):
+            g.request_started = started
+            return self.flask_app.process_response(response)
+
+    def encode(self, payload):
+        return (self.flask_app.json.dumps(payload) + "\n").encode("utf-8")
+
+    def json_response(self, payload, status=200):
+        """與jsonify相同的JSON回應"""
+        response = self.flask_app.json.response(payload)
+        response.status_code = status
+        return response
+
+    def event_unavailable(self, error):
+        """與Flask路由相同：活動不存在時404，已封存時409"""
+        return self.json_response({"error": str(error)}, 404 if error.status is None else 409)
+
+    def cached_response(self, entry):
+        response = self.flask_app.response_class(entry.body, mimetype="application/json")
+        response.set_etag(entry.etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    def not_modified(self, etag):
+        response = self.flask_app.response_class(status=304)
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    async def get_tasks(self, request, event):
+        """GET /tasks：快取與ETag與同步版本共用"""
+        args = request.args
+        if task_routes.parse_bool(args.get("stream")) and "limit" not in args:
+            # 串流列表以伺服器端游標逐批讀取，交給WSGI應用
+            return None
+        cache_key = task_routes.task_list_key(args)
+        version = event.version
+        cache = task_routes.task_list_cache.for_event(event.id)
+
+        etag = cache.etag(cache_key, version)
+        if request.if_none_match.contains_weak(etag):
+            return self.not_modified(etag)
+
+        entry = cache.get(cache_key, version)
+        if entry is None:
+            paginate = "limit" in args or "cursor" in args
+            limit = task_routes.parse_limit(args.get("limit"), DEFAULT_PAGE_SIZE if paginate else None)
+            filters = task_routes.task_filters(args)
+            query, params = Task.select_query(event.id, limit=limit, **filters)
+            tasks, next_cursor = Task.page(await async_db.fetch_all(query, params), filters["sort"], limit)
+            payload = task_routes.task_list_payload(tasks, next_cursor, paginate)
+            entry = cache.put(cache_key, version, self.encode(payload))
+        return self.cached_response(entry)
+
+    async def search_tasks(self, request, event):
+        """GET /tasks/search"""
+        text, limit, offset = task_routes.parse_search(request.args)
+        query, params = task_search.search_query(event.id, text, limit, offset)
+        rows = await async_db.fetch_all(query, params)
+        return self.json_response(task_routes.search_payload(rows[:limit], len(rows) > limit, offset))
+
+    async def get_task_stats(self, request, event):
+        """GET /tasks/stats：彙總表與逾期數量的兩個查詢同時執行"""
+        today = task_routes.parse_today(request.args)
+        version = event.version
+        cache = task_routes.task_stats_cache.for_event(event.id)
+
+        etag = cache.etag(today, version)
+        if request.if_none_match.contains_weak(etag):
+            return self.not_modified(etag)
+
+        entry = cache.get(today, version)
+        if entry is None:
+            rollups, overdue = await asyncio.gather(
+                async_db.fetch_all(SELECT_ROLLUPS, (event.id,)),
+                async_db.fetch_all(SELECT_OVERDUE_COUNTS, (event.id, today, False)))
+            body = self.encode(Task.stats_from_rows(rollups, overdue, today))
+            entry = cache.put(today, version, body)
+        return self.cached_response(entry)
+
+    async def stream_tasks(self, request, event_id, receive, send):
+        """GET /tasks/stream：SSE串流，只推送活動的變更
+
+        閒置連線只在事件迴圈上等待廣播器的喚醒，不佔用執行緒；
+        補送事件時才在執行緒池中讀取資料庫。
+        """
+        started = time.perf_counter()
+        metrics.begin_request('GET', request.path)
+        last_event_id = request.headers.get("Last-Event-ID") or request.args.get("lastEventId")
+        if last_event_id is not None:
+            try:
+                last_event_id = int(last_event_id)
+            except ValueError:
+                response = self.json_response({"error": f"Invalid Last-Event-ID: {last_event_id}"}, 400)
+                await self.send_response(self.process_response(response, request.environ, started), send)
+                return
+        try:
+            await self.load_event(event_id)
+        except EventUnavailable as e:
+            await self.send_response(self.process_response(self.event_unavailable(e), request.environ, started), send)
+            return
+
+        # 與WSGI路徑相同，串流回應只計時到開始送出為止
+        response = self.flask_app.response_class(mimetype="text/event-stream")
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Accel-Buffering"] = "no"
+        response = self.process_response(response, request.environ, started)
+
+        loop = asyncio.get_running_loop()
+        woken = asyncio.Event()
+        disconnected = asyncio.Event()
+
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+
+        async def write(text):
+            if not text:
+                return
+            await send({'type': 'http.response.body', 'body': text.encode('utf-8'), 'more_body': True})
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': self.header_list(response)})
+            await async_db.run(task_events.ensure_listener)
+            broker = task_events.broker(event_id)
+            with broker.waker(lambda: loop.call_soon_threadsafe(woken.set)):
+                await async_db.run(task_events.mark_published, event_id)
+                await write(f"retry: {RETRY_MILLISECONDS}\n\n")
+
+                if last_event_id is None:
+                    last_seq = await async_db.event_version(event_id)
+                else:
+                    messages, last_seq = await async_db.run(task_events.replay, event_id, last_event_id)
+                    await write(''.join(messages))
+
+                while not disconnected.is_set():
+                    # 先清除喚醒旗標再檢查緩衝，避免漏掉檢查後才發布的事件
+                    woken.clear()
+                    events = broker.events_after(last_seq, 0)
+                    if events is None:
+                        # 連線落後太多，緩衝中的事件已不完整，改從資料庫補送
+                        messages, last_seq = await async_db.run(task_events.replay, event_id, last_seq)
+                        await write(''.join(messages))
+                    elif events:
+                        await write(''.join(message for _, message in events))
+                        last_seq = events[-1][0]
+                    else:
+                        waiters = [asyncio.ensure_future(woken.wait()), asyncio.ensure_future(disconnected.wait())]
+                        done, pending = await asyncio.wait(
+                            waiters, timeout=HEARTBEAT_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+                        for waiter in pending:
+                            waiter.cancel()
+                        if not done:
+                            await write(": keep-alive\n\n")
+        except OSError:
+            # 客戶端已斷線
+            pass
+        finally:
+            watcher.cancel()
+
+    async def send_response(self, response, send):
+        """送出已完整產生的werkzeug回應"""
+        await send({'type': 'http.response.start', 'status': response.status_code,
+                    'headers': self.header_list(response)})
+        await send({'type': 'http.response.body', 'body': response.get_data()})
+
+    @staticmethod
+    def header_list(response):
+        """werkzeug回應的標頭轉換為ASGI格式"""
+        return [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in response.headers.to_wsgi_list()]
+
+    async def call_wsgi(self, environ, send):
+        """在執行緒池中執行WSGI應用，回應內容經由有上限的佇列逐段送出
+
+        同一個回應固定在一個執行緒中產生（SQLite連接不可跨執行緒使用），
+        佇列已滿時該執行緒會等待，串流回應不會一次堆積在記憶體中。
+        """
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue(maxsize=8)
+        cancelled = threading.Event()
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = headers
+
+        def put(item):
+            asyncio.run_coroutine_threadsafe(chunks.put(item), loop).result()
+
+        def run():
+            result = None
+            try:
+                result = self.flask_app(environ, start_response)
+                put(dict(started))
+                for chunk in result:
+                    if cancelled.is_set():
+                        break
+                    if chunk:
+                        put(chunk)
+            except Exception as e:
+                put(e)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+                put(None)
+
+        worker = loop.run_in_executor(self.wsgi_executor, run)
+        try:
+            while True:
+                item = await chunks.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                if isinstance(item, dict):
+                    await send({
+                        'type': 'http.response.start',
+                        'status': item['status'],
+                        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                    for name, value in item['headers']],
+                    })
+                else:
+                    await send({'type': 'http.response.body', 'body': item, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            # 提前結束（例如客戶端斷線）時通知執行緒停止，並清空佇列讓它不再等待
+            cancelled.set()
+            while not worker.done():
+                while not chunks.empty():
+                    chunks.get_nowait()
+                await asyncio.sleep(0.01)
+
+
+def create_asgi_app(flask_app):
+    """以Flask應用建立ASGI應用"""
+    return AsyncTaskApp(flask_app)
+
+
+app = create_asgi_app(flask_app)
@@ -0,0 +1,172 @@
+import abc
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
+# 已編碼的回應內容與其對應的資料表版本與ETag
+CachedResponse = namedtuple('CachedResponse', ['version', 'body', 'etag'])
+
+
+def make_etag(prefix, version, key=''):
+    """由資料表版本與請求鍵值產生強ETag（不含引號）"""
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+    return f"{prefix}-{version}-{digest}"
+
+
+class ResponseCache:
+    """以資料表版本為依據的行程內回應快取（LRU）
+
+    快取項目只在資料表版本與寫入時相同時有效，版本號存於資料庫，
+    因此多個worker行程之間不需要互相通知即可保持正確。
+    """
+
+    def __init__(self, prefix, max_entries=64):
+        self.prefix = prefix
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def etag(self, key, version):
+        """取得指定請求與版本的ETag"""
+        return make_etag(self.prefix, version, key)
+
+    def get(self, key, version):
+        """取得仍有效的快取內容，版本不符時視為未命中"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry
+            self._stats['misses'] += 1
+            return None
+
+    def put(self, key, version, body):
+        """存入已編碼的回應內容"""
+        entry = CachedResponse(version, body, self.etag(key, version))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        """清空快取"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """快取命中統計"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        return stats
+
+
+class PerEvent:
+    """每個活動各自一份的行程內快取或索引（LRU）
+
+    factory(event_id) 建立活動的實例；最久未使用的活動超過max_events個時移除，
+    封存或刪除活動時以discard立即釋放。
+    """
+
+    def __init__(self, factory, max_events=8):
+        self.factory = factory
+        self.max_events = max_events
+        self._instances = OrderedDict()
+        self._lock = threading.Lock()
+
+    def for_event(self, event_id):
+        """取得活動的實例，不存在時建立"""
+        with self._lock:
+            instance = self._instances.get(event_id)
+            if instance is None:
+                instance = self._instances[event_id] = self.factory(event_id)
+                while len(self._instances) > self.max_events:
+                    self._instances.popitem(last=False)
+            else:
+                self._instances.move_to_end(event_id)
+            return instance
+
+    def discard(self, event_id):
+        """移除活動的實例"""
+        with self._lock:
+            self._instances.pop(event_id, None)
+
+    def stats(self):
+        """各活動實例的統計"""
+        with self._lock:
+            instances = list(self._instances.items())
+        return {str(event_id): instance.stats() for event_id, instance in instances}
+
+
+class SyncedTaskIndex(abc.ABC):
+    """依活動版本同步的行程內索引基底類別
+
+    第一次使用時載入活動任務的完整快照，之後活動版本變更時只讀取增量變更
+    （Task.get_changes）並交給子類別的apply更新；變更太多時改為重建。
+    子類別實作reset()與apply(tasks, deleted_ids)。
+    """
+
+    def __init__(self, event_id=None, rebuild_threshold=2000):
+        self.event_id = event_id
+        self.rebuild_threshold = rebuild_threshold
+        self._lock = threading.RLock()
+        self._version = None
+        self._stats = {'rebuilds': 0, 'incremental_updates': 0}
+
+    @abc.abstractmethod
+    def reset(self):
+        """清空索引內容"""
+
+    @abc.abstractmethod
+    def apply(self, tasks, deleted_ids):
+        """套用新增/更新的任務與已刪除的任務ID"""
+
+    @property
+    def version(self):
+        """索引目前對應的活動版本"""
+        return self._version
+
+    def sync(self):
+        """與資料庫同步，返回同步後的版本"""
+        from .models.task import Task
+
+        version = Task.table_version(self.event_id)
+        with self._lock:
+            if self._version == version:
+                return version
+            if self._version is not None and version < self._version:
+                # 讀取副本的進度落後於索引，沿用較新的索引
+                return self._version
+            if self._version is not None and self._version < version:
+                tasks, deleted, cursor, has_more = Task.get_changes(self.event_id, self._version,
+                                                                    self.rebuild_threshold)
+                if not has_more:
+                    self.apply(tasks, deleted)
+                    self._version = cursor
+                    self._stats['incremental_updates'] += 1
+                    return cursor
+            tasks, _, cursor, _ = Task.get_changes(self.event_id)
+            self.reset()
+            self.apply(tasks, [])
+            self._version = cursor
+            self._stats['rebuilds'] += 1
+            return cursor
+
+    @contextmanager
+    def current(self):
+        """同步後在鎖內使用索引，期間不會被其他執行緒更新"""
+        with self._lock:
+            self.sync()
+            yield self
+
+    def stats(self):
+        """同步統計"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['version'] = self._version
+        return stats
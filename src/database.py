@@ -1,157 +1,1094 @@
+import json
+import logging
+import math
 import os
+import sqlite3
+import threading
+import time
+import weakref
+from itertools import count
+from contextlib import contextmanager
+from urllib.parse import quote
 import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
+from .metrics import metrics
 
 # 載入環境變數
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name, default):
+    """讀取整數型環境變數"""
+    value = os.getenv(name)
+    return int(value) if value not in (None, '') else default
+
+
+def _env_float(name, default):
+    """讀取浮點數型環境變數"""
+    value = os.getenv(name)
+    return float(value) if value not in (None, '') else default
+
+
+def _env_list(name):
+    """讀取以逗號分隔的環境變數，忽略空白項目"""
+    return [item.strip() for item in os.getenv(name, '').split(',') if item.strip()]
+
+
+# task_rollups彙總表維護的維度
+ROLLUP_DIMENSIONS = ('all', 'stage', 'responsible', 'week')
+
+# 任務的日期區間（閉區間）；結束日早於開始日時視為單日
+TASK_DATE_RANGE = "daterange(start_date, GREATEST(start_date, end_date), '[]')"
+
+# 記錄客戶端最近寫入時間的cookie，期限內該客戶端的讀取不使用讀取副本
+READ_PRIMARY_COOKIE = 'db_read_primary_until'
+
+# 讀取副本發生這些錯誤時改由主資料庫重試
+REPLICA_ERRORS = (sqlite3.OperationalError, psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+class PoolTimeout(Exception):
+    """在等待時間內無法從連接池取得連接"""
+
+
+class Statement:
+    """只定義一次的SQL語句，依資料庫產生對應的參數格式
+
+    SQL以 ? 作為參數佔位符撰寫（字串常值中的 ? 不受影響）。
+    prepare為True時，PostgreSQL會在每條連接上以PREPARE準備一次，
+    之後以EXECUTE執行；SQLite則使用連接內建的語句快取。
+    """
+
+    _registry = {}
+
+    def __init__(self, name, sql, prepare=True):
+        if name in Statement._registry:
+            raise ValueError(f"Duplicate statement name: {name}")
+        Statement._registry[name] = self
+        self.name = name
+        self.sql = ' '.join(sql.split())
+        self.prepare = prepare
+        self._returning = None
+        self._parts = self._split(self.sql)
+        self.param_count = len(self._parts) - 1
+        placeholders = ', '.join('%s' for _ in range(self.param_count))
+        self.execute_sql = f"EXECUTE {name} ({placeholders})" if self.param_count else f"EXECUTE {name}"
+        self.qmark_sql = self.sql
+        self.format_sql = '%s'.join(part.replace('%', '%%') for part in self._parts)
+        self.numeric_sql = ''.join(
+            part + (f'${index + 1}' if index < self.param_count else '')
+            for index, part in enumerate(self._parts))
+
+    def returning(self):
+        """同一語句加上 RETURNING * 的版本"""
+        if self._returning is None:
+            self._returning = Statement(f"{self.name}_returning", f"{self.sql} RETURNING *", self.prepare)
+        return self._returning
+
+    @staticmethod
+    def _split(sql):
+        """以字串常值以外的 ? 切割SQL"""
+        parts = []
+        current = []
+        quoted = False
+        for char in sql:
+            if char == "'":
+                quoted = not quoted
+            if char == '?' and not quoted:
+                parts.append(''.join(current))
+                current = []
+            else:
+                current.append(char)
+        parts.append(''.join(current))
+        return parts
+
+    @classmethod
+    def source_sql(cls, sql):
+        """EXECUTE語句對應的原始SQL，其他語句原樣返回"""
+        if isinstance(sql, str) and sql.startswith('EXECUTE '):
+            statement = cls._registry.get(sql.split()[1])
+            if statement is not None:
+                return statement.sql
+        return sql
+
+    def __repr__(self):
+        return f"<Statement {self.name}>"
+
+
+class TimedCursor:
+    """記錄每個語句的執行時間與筆數並回報給metrics的游標（mixin）
+
+    時間包含執行與之後讀取結果的時間（SQLite在讀取時才逐步執行查詢）；
+    讀完結果、執行下一個語句、關閉或游標被回收時，該語句才算結束。
+    筆數為讀取的資料列數，未讀取結果的寫入語句使用rowcount。
+    """
+
+    _timed_sql = None
+
+    def execute(self, sql, params=None):
+        self._finish_statement()
+        started = time.perf_counter()
+        try:
+            result = super().execute(sql) if params is None else super().execute(sql, params)
+        except BaseException:
+            self._start_statement(sql, started)
+            self._finish_statement()
+            raise
+        self._start_statement(sql, started)
+        return result
+
+    def executemany(self, sql, seq_of_params):
+        self._finish_statement()
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_params)
+        finally:
+            self._start_statement(sql, started)
+            self._finish_statement()
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, 0 if row is None else 1, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany() if size is None else super().fetchmany(size)
+        self._fetched(started, len(rows), not rows)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows), True)
+        return rows
+
+    def close(self):
+        self._finish_statement()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish_statement()
+        except Exception:
+            pass
+
+    def _start_statement(self, sql, started):
+        self._timed_sql = sql
+        self._timed_seconds = time.perf_counter() - started
+        self._timed_rows = None
+
+    def _fetched(self, started, count, exhausted):
+        if self._timed_sql is None:
+            return
+        self._timed_seconds += time.perf_counter() - started
+        self._timed_rows = (self._timed_rows or 0) + count
+        if exhausted:
+            self._finish_statement()
+
+    def _finish_statement(self):
+        sql = self._timed_sql
+        if sql is None:
+            return
+        self._timed_sql = None
+        rows = self._timed_rows if self._timed_rows is not None else max(self.rowcount, 0)
+        metrics.observe_query(Statement.source_sql(sql), self._timed_seconds, rows)
+
+
+class TimedDictCursor(TimedCursor, RealDictCursor):
+    """PostgreSQL連接池使用的游標"""
+
+
+class TimedSQLiteCursor(TimedCursor, sqlite3.Cursor):
+    """SQLite連接使用的游標"""
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """記錄建立與使用時間的PostgreSQL連接，供連接池判斷回收與健康檢查"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        # 已在這條連接上PREPARE的語句名稱
+        self.prepared_statements = set()
+        self.discard_on_release = False
+
+
+class SQLiteConnection(sqlite3.Connection):
+    """可被弱參考追蹤的SQLite連接"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 已在這條連接上編譯過的語句名稱（由sqlite3的語句快取保存）
+        self.prepared_statements = set()
+
+    def cursor(self, factory=None):
+        # Connection.execute也經由此方法建立游標
+        return super().cursor(factory or TimedSQLiteCursor)
+
+
+class ConnectionPool:
+    """有上限且執行緒安全的PostgreSQL連接池"""
+
+    def __init__(self, dsn, min_size=1, max_size=10, timeout=30.0,
+                 max_lifetime=1800.0, health_check_interval=30.0):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self.pid = os.getpid()
+
+        self._idle = []
+        self._size = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            'connections_created': 0,
+            'connections_closed': 0,
+            'connections_recycled': 0,
+            'health_check_failures': 0,
+            'acquired': 0,
+            'waits': 0,
+            'timeouts': 0,
+        }
+
+        for _ in range(min_size):
+            with self._cond:
+                self._size += 1
+            self._idle.append(self._connect())
+
+    def _connect(self):
+        """建立新的資料庫連接"""
+        try:
+            conn = psycopg2.connect(self.dsn, connection_factory=PooledConnection,
+                                    cursor_factory=TimedDictCursor)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats['connections_created'] += 1
+        return conn
+
+    def _close(self, conn, recycled=False):
+        """關閉連接並釋放連接池名額"""
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats['connections_closed'] += 1
+            if recycled:
+                self._stats['connections_recycled'] += 1
+            self._cond.notify()
+
+    def _is_healthy(self, conn):
+        """檢查閒置連接是否仍然可用"""
+        if conn.closed:
+            return False
+        if time.monotonic() - conn.last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except Exception:
+            with self._cond:
+                self._stats['health_check_failures'] += 1
+            return False
+
+    def acquire(self):
+        """從連接池取得連接，必要時等待其他執行緒歸還"""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn = None
+            with self._cond:
+                waited = False
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(
+                            f"無法在 {self.timeout} 秒內取得資料庫連接（上限 {self.max_size}）")
+                    if not waited:
+                        self._stats['waits'] += 1
+                        waited = True
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn = self._idle.pop()
+                else:
+                    self._size += 1
+
+            if conn is None:
+                conn = self._connect()
+            elif time.monotonic() - conn.created_at > self.max_lifetime:
+                self._close(conn, recycled=True)
+                continue
+            elif not self._is_healthy(conn):
+                self._close(conn)
+                continue
+
+            with self._cond:
+                self._stats['acquired'] += 1
+            return conn
+
+    def release(self, conn, discard=False):
+        """歸還連接；斷線或交易狀態異常的連接會被關閉"""
+        discard = discard or conn.discard_on_release
+        if not discard and not conn.closed:
+            try:
+                if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+        if discard or conn.closed:
+            self._close(conn)
+            return
+
+        conn.last_used = time.monotonic()
+        if conn.last_used - conn.created_at > self.max_lifetime:
+            self._close(conn, recycled=True)
+            return
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def close_all(self):
+        """關閉所有閒置連接"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._close(conn)
+
+    def stats(self):
+        """連接池使用統計"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'backend': 'postgresql',
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+            })
+        return stats
+
+
+class SQLiteConnections:
+    """每個執行緒一條長期保持的SQLite連接（WAL模式）"""
+
+    def __init__(self, db_path, busy_timeout_ms=5000, statement_cache_size=256, read_only=False):
+        self.db_path = db_path
+        self.busy_timeout_ms = busy_timeout_ms
+        self.statement_cache_size = statement_cache_size
+        # 唯讀模式（讀取副本）不會建立不存在的檔案，也不變更日誌模式
+        self.read_only = read_only
+        self.pid = os.getpid()
+        self._local = threading.local()
+        self._open = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._stats = {
+            'connections_created': 0,
+            'connections_closed': 0,
+            'acquired': 0,
+        }
+
+    def _connect(self):
+        """建立新的SQLite連接並設定WAL與busy_timeout"""
+        if self.read_only:
+            conn = sqlite3.connect(f'file:{quote(os.path.abspath(self.db_path))}?mode=ro', uri=True,
+                                   timeout=self.busy_timeout_ms / 1000.0, factory=SQLiteConnection,
+                                   cached_statements=self.statement_cache_size)
+        else:
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout_ms / 1000.0,
+                                   factory=SQLiteConnection,
+                                   cached_statements=self.statement_cache_size)
+        conn.row_factory = sqlite3.Row
+        if not self.read_only:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        with self._lock:
+            self._open.add(conn)
+            self._stats['connections_created'] += 1
+        return conn
+
+    def acquire(self):
+        """取得目前執行緒專屬的連接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        with self._lock:
+            self._stats['acquired'] += 1
+        return conn
+
+    def release(self, conn, discard=False):
+        """歸還連接；連接保留給同一執行緒重複使用"""
+        if conn.in_transaction:
+            conn.rollback()
+        if discard:
+            self._local.conn = None
+            conn.close()
+            with self._lock:
+                self._open.discard(conn)
+                self._stats['connections_closed'] += 1
+
+    def close_all(self):
+        """關閉目前執行緒的連接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self.release(conn, discard=True)
+
+    def stats(self):
+        """連接使用統計"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'backend': 'sqlite',
+                'open': len(self._open),
+                'busy_timeout_ms': self.busy_timeout_ms,
+            })
+        return stats
+
+
+class ReplicaSet:
+    """讀取副本的連接池、輪流選擇與健康狀態
+
+    每個副本有自己的連接池。取得連接或執行查詢時發生連線錯誤的副本，
+    在retry_interval秒內不再被選用，之後再試；沒有可用副本時由呼叫端改用主資料庫。
+    """
+
+    def __init__(self, pools, retry_interval=30.0):
+        self.pools = list(pools)
+        self.retry_interval = retry_interval
+        self.pid = os.getpid()
+        self._next = 0
+        self._down_until = [0.0] * len(self.pools)
+        self._lock = threading.Lock()
+        self._stats = [{'reads': 0, 'failures': 0} for _ in self.pools]
+        self._stats_primary = {'fallbacks': 0}
+
+    def choose(self, preferred=None):
+        """選擇一個目前可用的副本，返回其索引；preferred可用時優先使用，都不可用時返回None"""
+        now = time.monotonic()
+        with self._lock:
+            if preferred is not None and self._down_until[preferred] <= now:
+                return preferred
+            for _ in range(len(self.pools)):
+                index = self._next
+                self._next = (self._next + 1) % len(self.pools)
+                if self._down_until[index] <= now:
+                    return index
+            self._stats_primary['fallbacks'] += 1
+        return None
+
+    def acquire(self, index):
+        """從指定副本取得連接，返回 (索引, 連接)
+
+        連線失敗時標記該副本失效並改用下一個可用的副本；都無法使用時返回 (None, None)。
+        """
+        while index is not None:
+            try:
+                conn = self.pools[index].acquire()
+            except REPLICA_ERRORS as e:
+                self.mark_down(index, e)
+                index = self.choose()
+                continue
+            self.record_read(index)
+            return index, conn
+        return None, None
+
+    def record_read(self, index):
+        """記錄一次由副本執行的讀取"""
+        with self._lock:
+            self._stats[index]['reads'] += 1
+
+    def release(self, index, conn, discard=False):
+        self.pools[index].release(conn, discard=discard)
+
+    def mark_down(self, index, error):
+        """在retry_interval秒內不再選用此副本"""
+        logger.warning("read replica %d unavailable for %.0fs: %s", index, self.retry_interval, error)
+        with self._lock:
+            self._down_until[index] = time.monotonic() + self.retry_interval
+            self._stats[index]['failures'] += 1
+
+    def close_all(self):
+        for pool in self.pools:
+            pool.close_all()
+
+    def stats(self):
+        """各副本的讀取次數、失效次數與連接池統計"""
+        now = time.monotonic()
+        with self._lock:
+            replicas = [dict(stats, healthy=self._down_until[index] <= now)
+                        for index, stats in enumerate(self._stats)]
+            fallbacks = self._stats_primary['fallbacks']
+        for stats, pool in zip(replicas, self.pools):
+            stats['pool'] = pool.stats()
+        return {'replicas': replicas, 'primary_fallbacks': fallbacks}
+
+
 class Database:
     def __init__(self):
         # 從環境變數獲取資料庫連接資訊
         self.database_url = os.getenv('DATABASE_URL')
-        
+
         # 如果沒有設定DATABASE_URL，使用本地SQLite作為後備
         if not self.database_url:
-            import sqlite3
             self.use_sqlite = True
             self.db_path = os.path.join(os.path.dirname(__file__), '..', 'tasks.db')
         else:
             self.use_sqlite = False
-    
+
+        # 讀取副本：PostgreSQL為DSN，SQLite為資料庫檔案路徑；未設定時所有查詢都使用主資料庫
+        self.replica_targets = _env_list('SQLITE_REPLICA_PATHS' if self.use_sqlite else 'DATABASE_REPLICA_URLS')
+        # 副本連線失敗後暫停使用的秒數
+        self.replica_retry_interval = _env_float('DB_REPLICA_RETRY_INTERVAL', 30.0)
+        # 客戶端寫入後繼續讀取主資料庫的秒數，應大於副本的複製延遲
+        self.read_your_writes_seconds = _env_float('DB_READ_YOUR_WRITES_SECONDS', 5.0)
+
+        # 連接池設定
+        self.pool_min_size = _env_int('DB_POOL_MIN_SIZE', 1)
+        self.pool_max_size = _env_int('DB_POOL_MAX_SIZE', 10)
+        self.pool_timeout = _env_float('DB_POOL_TIMEOUT', 30.0)
+        self.pool_max_lifetime = _env_float('DB_POOL_MAX_LIFETIME', 1800.0)
+        self.pool_health_check_interval = _env_float('DB_POOL_HEALTH_CHECK_INTERVAL', 30.0)
+        self.sqlite_busy_timeout_ms = _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)
+        self.sqlite_statement_cache_size = _env_int('SQLITE_STATEMENT_CACHE_SIZE', 256)
+        # 串流查詢每次從資料庫取回的筆數
+        self.stream_batch_size = _env_int('DB_STREAM_BATCH_SIZE', 500)
+        # 非同步（ASGI）路徑的asyncpg連接池上限與SQLite執行緒數
+        self.async_pool_max_size = _env_int('DB_ASYNC_POOL_MAX_SIZE', 50)
+        self.async_threads = _env_int('DB_ASYNC_THREADS', 8)
+
+        # 各語句在連接上的快取命中統計
+        self._statement_stats = {}
+        self._statement_lock = threading.Lock()
+
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._replicas = None
+        # fork後不可關閉父行程的連接，只保留參考避免被回收
+        self._orphaned_pools = []
+        self._local = threading.local()
+        self._stream_ids = count(1)
+
+        # 資料庫結構只在每個行程第一次需要時檢查一次
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+        self.schema_status = {'action': None, 'seconds': None}
+
     def get_connection(self):
-        """獲取資料庫連接"""
+        """獲取獨立（不經過連接池）的資料庫連接"""
         if self.use_sqlite:
-            import sqlite3
             conn = sqlite3.connect(self.db_path)
             conn.row_factory = sqlite3.Row
             return conn
         else:
             return psycopg2.connect(self.database_url, cursor_factory=RealDictCursor)
-    
+
+    @property
+    def supports_returning(self):
+        """是否支援 INSERT/UPDATE ... RETURNING（SQLite 3.35以上）"""
+        return not self.use_sqlite or sqlite3.sqlite_version_info >= (3, 35, 0)
+
+    @property
+    def supports_update_from(self):
+        """是否支援 UPDATE ... FROM（SQLite 3.33以上）"""
+        return not self.use_sqlite or sqlite3.sqlite_version_info >= (3, 33, 0)
+
+    @property
+    def placeholder(self):
+        """目前資料庫使用的參數佔位符"""
+        return '?' if self.use_sqlite else '%s'
+
+    def any_of(self, column, values):
+        """產生「欄位值屬於清單」的條件與參數，清單長度不受參數數量上限影響"""
+        if self.use_sqlite:
+            return f"{column} IN (SELECT value FROM json_each(?))", (json.dumps(list(values)),)
+        return f"{column} = ANY(%s)", (list(values),)
+
+    def date_overlap(self, window_from, window_to):
+        """任務日期區間與 [window_from, window_to] 重疊的條件，返回 (SQL片段, 參數)"""
+        if self.use_sqlite:
+            return 'start_date <= ? AND MAX(start_date, end_date) >= ?', (window_to, window_from)
+        return f"{TASK_DATE_RANGE} && daterange(%s::date, %s::date, '[]')", (window_from, window_to)
+
+    @property
+    def pool(self):
+        """取得目前行程的連接池（延遲建立，fork後自動重建）"""
+        pool = self._pool
+        if pool is not None and pool.pid == os.getpid():
+            return pool
+        with self._pool_lock:
+            if self._pool is not None and self._pool.pid != os.getpid():
+                self._orphaned_pools.append(self._pool)
+                self._pool = None
+            if self._pool is None:
+                if self.use_sqlite:
+                    self._pool = SQLiteConnections(self.db_path, self.sqlite_busy_timeout_ms,
+                                                   self.sqlite_statement_cache_size)
+                else:
+                    self._pool = ConnectionPool(
+                        self.database_url,
+                        min_size=self.pool_min_size,
+                        max_size=self.pool_max_size,
+                        timeout=self.pool_timeout,
+                        max_lifetime=self.pool_max_lifetime,
+                        health_check_interval=self.pool_health_check_interval,
+                    )
+            return self._pool
+
+    @property
+    def replicas(self):
+        """取得目前行程的讀取副本（延遲建立，fork後自動重建）；未設定副本時為None"""
+        if not self.replica_targets:
+            return None
+        replicas = self._replicas
+        if replicas is not None and replicas.pid == os.getpid():
+            return replicas
+        with self._pool_lock:
+            if self._replicas is None or self._replicas.pid != os.getpid():
+                if self.use_sqlite:
+                    pools = [SQLiteConnections(path, self.sqlite_busy_timeout_ms,
+                                               self.sqlite_statement_cache_size, read_only=True)
+                             for path in self.replica_targets]
+                else:
+                    # 建立時不連線，副本無法使用時不影響啟動
+                    pools = [ConnectionPool(
+                        url,
+                        min_size=0,
+                        max_size=self.pool_max_size,
+                        timeout=self.pool_timeout,
+                        max_lifetime=self.pool_max_lifetime,
+                        health_check_interval=self.pool_health_check_interval,
+                    ) for url in self.replica_targets]
+                self._replicas = ReplicaSet(pools, self.replica_retry_interval)
+            return self._replicas
+
+    def pool_stats(self):
+        """連接池統計，供監控使用"""
+        return self.pool.stats()
+
+    def replica_stats(self):
+        """讀取副本統計；未設定副本時為None"""
+        replicas = self.replicas
+        return replicas.stats() if replicas is not None else None
+
+    def close_pool(self):
+        """關閉連接池中的連接"""
+        if self._pool is not None and self._pool.pid == os.getpid():
+            self._pool.close_all()
+        if self._replicas is not None and self._replicas.pid == os.getpid():
+            self._replicas.close_all()
+
+    @contextmanager
+    def replica_reads(self, pinned=None):
+        """在此範圍內，交易以外的唯讀查詢改由讀取副本執行
+
+        同一範圍內的查詢固定使用同一個副本，避免讀到不同進度的資料；
+        副本失效或沒有設定副本時使用主資料庫。查詢分散在多個執行緒上的請求
+        （非同步請求）傳入共用的pinned字典，選用的副本記錄在pinned['replica']。
+        """
+        previous = getattr(self._local, 'replica_reads', False)
+        self._local.replica_reads = True
+        if pinned is not None:
+            self._local.replica = pinned.get('replica')
+        try:
+            yield
+        finally:
+            if pinned is not None:
+                pinned['replica'] = getattr(self._local, 'replica', None)
+            self._local.replica_reads = previous
+            if not previous:
+                self._local.replica = None
+
+    def wants_replica_reads(self, method, cookies):
+        """請求的唯讀查詢是否應由副本執行：設定了副本的GET/HEAD請求，
+        且客戶端不在寫入後的read_your_writes_seconds秒內"""
+        if not self.replica_targets or method not in ('GET', 'HEAD'):
+            return False
+        try:
+            primary_until = float(cookies.get(READ_PRIMARY_COOKIE, 0))
+        except ValueError:
+            primary_until = 0
+        return primary_until <= time.time()
+
+    def _read_replica(self, sql):
+        """決定唯讀查詢要使用的副本索引；應使用主資料庫時返回None"""
+        if not getattr(self._local, 'replica_reads', False) or getattr(self._local, 'conn', None) is not None:
+            return None
+        replicas = self.replicas
+        if isinstance(sql, Statement):
+            sql = sql.sql
+        if replicas is None or metrics.operation(sql) != 'select':
+            return None
+        index = replicas.choose(getattr(self._local, 'replica', None))
+        self._local.replica = index
+        return index
+
+    def _read(self, sql, run):
+        """以run(conn)執行唯讀查詢並返回結果
+
+        可使用副本時在副本上執行；副本發生連線錯誤時改由主資料庫重試，
+        主資料庫也失敗時視為查詢本身的錯誤，不將副本標記為失效。
+        """
+        index = self._read_replica(sql)
+        if index is not None:
+            replicas = self.replicas
+            index, conn = replicas.acquire(index)
+            if conn is not None:
+                self._local.replica = index
+                try:
+                    result = run(conn)
+                except REPLICA_ERRORS as e:
+                    replicas.release(index, conn, discard=True)
+                    with self.transaction() as primary:
+                        result = run(primary)
+                    replicas.mark_down(index, e)
+                    self._local.replica = None
+                    return result
+                except BaseException:
+                    replicas.release(index, conn)
+                    raise
+                replicas.release(index, conn)
+                return result
+        with self.transaction() as conn:
+            return run(conn)
+
+    def init_app(self, app):
+        """註冊讀寫分離的中介層
+
+        GET/HEAD請求的唯讀查詢由讀取副本執行。寫入過的客戶端以cookie記錄，
+        read_your_writes_seconds秒內的讀取仍使用主資料庫，能讀到自己剛寫入的資料。
+        """
+        if not self.replica_targets:
+            return
+        from flask import request
+
+        @app.before_request
+        def route_reads():
+            self._local.wrote = False
+            if self.wants_replica_reads(request.method, request.cookies):
+                self._local.replica_reads = True
+
+        @app.after_request
+        def remember_writes(response):
+            if getattr(self._local, 'wrote', False):
+                until = time.time() + self.read_your_writes_seconds
+                response.set_cookie(READ_PRIMARY_COOKIE, f'{until:.3f}',
+                                    max_age=math.ceil(self.read_your_writes_seconds),
+                                    httponly=True, samesite='Lax')
+            return response
+
+        @app.teardown_request
+        def reset_reads(exc=None):
+            self._local.replica_reads = False
+            self._local.replica = None
+            self._local.wrote = False
+
+    @contextmanager
+    def transaction(self):
+        """從連接池取得連接並包在交易中；同一執行緒內的巢狀呼叫共用同一交易"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+
+        pool = self.pool
+        conn = pool.acquire()
+        self._local.conn = conn
+        self._local.after_commit = []
+        discard = False
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+            raise
+        finally:
+            callbacks = self._local.after_commit
+            self._local.conn = None
+            self._local.after_commit = []
+            pool.release(conn, discard=discard)
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                logger.exception("after_commit callback failed")
+
+    def after_commit(self, callback):
+        """登記在目前交易成功提交後執行的回呼；交易回滾時不會執行"""
+        if getattr(self._local, 'conn', None) is None:
+            raise RuntimeError("after_commit() must be called inside a transaction")
+        self._local.after_commit.append(callback)
+
+    @property
+    def schema_ready(self):
+        """目前行程是否已確認資料庫結構為最新版本"""
+        return self._schema_ready
+
+    def ensure_schema(self):
+        """確保資料庫結構為最新版本
+
+        每個行程只檢查一次；所有遷移都已套用時只執行查詢，不執行任何DDL。
+        多個worker同時啟動時由遷移執行器的鎖排隊，每個遷移只會套用一次。
+        """
+        if self._schema_ready:
+            return
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            started = time.perf_counter()
+            action = 'migrated' if self.init_db() else 'current'
+            self.schema_status = {'action': action, 'seconds': round(time.perf_counter() - started, 4)}
+            self._schema_ready = True
+            logger.info("database schema %s in %.4fs", action, self.schema_status['seconds'])
+
     def init_db(self):
-        """初始化資料庫表格"""
+        """套用所有尚未執行的結構遷移（見migrations模組），返回本次套用的遷移"""
+        from .migrations import migrator
+        return migrator.migrate()
+
+    def rollup_group(self, dimension, row='tasks'):
+        """彙總維度的分組運算式；row為資料表名稱或觸發器中的NEW/OLD"""
+        if dimension == 'all':
+            return "''"
+        if dimension == 'week':
+            # 以開始日所在週的星期一為鍵
+            if self.use_sqlite:
+                return f"COALESCE(date({row}.start_date, 'weekday 0', '-6 days'), '')"
+            return f"COALESCE(to_char(date_trunc('week', {row}.start_date), 'YYYY-MM-DD'), '')"
+        return f"COALESCE(CAST({row}.{dimension} AS TEXT), '')"
+
+    def rebuild_rollups(self, cursor=None, by_event=True):
+        """由tasks重新計算彙總表（資料修復用）；未指定cursor時在新交易中執行
+
+        by_event為False時依活動功能加入前的結構彙總（只在遷移3建立彙總表時使用）。
+        """
+        if cursor is None:
+            with self.transaction() as conn:
+                self.rebuild_rollups(conn.cursor(), by_event)
+            return
+        cursor.execute('DELETE FROM task_rollups')
+        event_column = 'event_id, ' if by_event else ''
+        for dimension in ROLLUP_DIMENSIONS:
+            cursor.execute(f'''
+                INSERT INTO task_rollups ({event_column}dimension, group_key, total, completed)
+                SELECT {event_column}'{dimension}', {self.rollup_group(dimension)}, COUNT(*),
+                       SUM(CASE WHEN tasks.completed THEN 1 ELSE 0 END)
+                FROM tasks
+                GROUP BY {'1, 3' if by_event else '2'}
+            ''')
+
+    def ping(self):
+        """往返資料庫執行一個最小查詢，返回秒數（包含從連接池取得連接的時間）"""
+        started = time.perf_counter()
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchall()
+        return time.perf_counter() - started
+
+    def get_table_version(self, name):
+        """取得資料表目前的版本號"""
+        row = self.fetch_one(SELECT_TABLE_VERSION, (name,))
+        return row['version'] if row else 0
+
+    def record_write(self):
+        """記錄目前請求有寫入（讀寫分離的read-your-writes使用）；所有任務寫入分配變更序號時呼叫"""
+        self._local.wrote = True
+
+    def last_change_seq(self):
+        """最後分配的任務變更序號（監控用）"""
         if self.use_sqlite:
-            self._init_sqlite()
-        else:
-            self._init_postgresql()
-    
-    def _init_sqlite(self):
-        """初始化SQLite資料庫"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tasks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                stage TEXT NOT NULL,
-                milestone TEXT NOT NULL,
-                start_date TEXT NOT NULL,
-                end_date TEXT NOT NULL,
-                content TEXT,
-                holiday_impact TEXT,
-                dependencies TEXT,
-                responsible TEXT,
-                risks TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
-    
-    def _init_postgresql(self):
-        """初始化PostgreSQL資料庫"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tasks (
-                id SERIAL PRIMARY KEY,
-                stage VARCHAR(255) NOT NULL,
-                milestone VARCHAR(255) NOT NULL,
-                start_date DATE NOT NULL,
-                end_date DATE NOT NULL,
-                content TEXT,
-                holiday_impact TEXT,
-                dependencies TEXT,
-                responsible TEXT,
-                risks TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
-    
+            return self.get_table_version('tasks')
+        row = self.fetch_one(SELECT_LAST_CHANGE_SEQ)
+        return row['seq'] if row else 0
+
+    def bump_table_version(self, name):
+        """在目前交易中遞增資料表版本號並返回新版本"""
+        self.record_write()
+        with self.transaction():
+            self.execute(BUMP_TABLE_VERSION, (name,))
+            return self.get_table_version(name)
+
+    def render(self, statement):
+        """取得語句在目前資料庫使用的SQL文字"""
+        if not isinstance(statement, Statement):
+            return statement
+        return statement.qmark_sql if self.use_sqlite else statement.format_sql
+
+    def _run(self, cursor, statement, params):
+        """執行語句；PostgreSQL上的可準備語句會在連接上PREPARE一次後重複使用"""
+        params = tuple(params or ())
+        if not isinstance(statement, Statement):
+            cursor.execute(statement, params)
+            return
+
+        conn = cursor.connection
+        if not statement.prepare:
+            cursor.execute(self.render(statement), params)
+            return
+
+        hit = statement.name in conn.prepared_statements
+        with self._statement_lock:
+            counters = self._statement_stats.setdefault(statement.name, {'hits': 0, 'misses': 0})
+            counters['hits' if hit else 'misses'] += 1
+
+        if self.use_sqlite:
+            # sqlite3依SQL文字快取已編譯的語句
+            conn.prepared_statements.add(statement.name)
+            cursor.execute(statement.qmark_sql, params)
+            return
+
+        if not hit:
+            cursor.execute(f"PREPARE {statement.name} AS {statement.numeric_sql}")
+            conn.prepared_statements.add(statement.name)
+        try:
+            cursor.execute(statement.execute_sql, params)
+        except psycopg2.errors.FeatureNotSupported:
+            # 結構變更後已準備的計畫失效（cached plan must not change result type），
+            # 捨棄這條連接，下次由新連接重新準備
+            conn.discard_on_release = True
+            raise
+
+    def fetch_all(self, statement, params=None):
+        """執行語句並返回所有結果"""
+        def run(conn):
+            cursor = conn.cursor()
+            self._run(cursor, statement, params)
+            return [dict(row) for row in cursor.fetchall()]
+        return self._read(statement, run)
+
+    def fetch_one(self, statement, params=None):
+        """執行語句並返回第一筆結果，沒有結果時返回None"""
+        def run(conn):
+            cursor = conn.cursor()
+            self._run(cursor, statement, params)
+            # 讀完所有結果，確保帶RETURNING的寫入語句已執行完畢
+            rows = cursor.fetchall()
+            return dict(rows[0]) if rows else None
+        return self._read(statement, run)
+
+    def execute(self, statement, params=None):
+        """執行寫入語句並返回影響的筆數"""
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            self._run(cursor, statement, params)
+            return cursor.rowcount
+
+    def statement_stats(self):
+        """各語句的快取命中與未命中次數"""
+        with self._statement_lock:
+            return {name: dict(counters) for name, counters in self._statement_stats.items()}
+
     def execute_query(self, query, params=None):
         """執行查詢並返回結果"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
+        def run(conn):
+            cursor = conn.cursor()
+
             if params:
                 cursor.execute(query, params)
             else:
                 cursor.execute(query)
-            
+
             if query.strip().upper().startswith('SELECT'):
                 results = cursor.fetchall()
-                if self.use_sqlite:
-                    # 將sqlite3.Row轉換為字典
-                    return [dict(row) for row in results]
-                else:
-                    # psycopg2的RealDictCursor已經返回字典
-                    return [dict(row) for row in results]
+                # sqlite3.Row與psycopg2的RealDictCursor都轉換為字典
+                return [dict(row) for row in results]
             else:
-                conn.commit()
                 return cursor.rowcount
-        
-        except Exception as e:
-            conn.rollback()
-            raise e
+        return self._read(query, run)
+
+    def stream_query(self, query, params=None, batch_size=None):
+        """以批次逐步讀取查詢結果，每次產生一批資料列
+
+        PostgreSQL使用具名（伺服器端）游標，SQLite以fetchmany逐步讀取，
+        記憶體用量只與批次大小有關。讀取期間佔用一條連接，
+        產生器結束或被關閉時才歸還。呼叫時即決定是否使用讀取副本，
+        因此在請求結束後才讀取的串流回應也遵循讀寫分離。
+        """
+        batch_size = batch_size or self.stream_batch_size
+        return self._stream(query, params, batch_size, self._read_replica(query))
+
+    def _stream(self, query, params, batch_size, replica):
+        if replica is not None:
+            replicas = self.replicas
+            replica, conn = replicas.acquire(replica)
+            if conn is not None:
+                try:
+                    yield from self._stream_rows(conn, query, params, batch_size)
+                finally:
+                    replicas.release(replica, conn)
+                return
+        with self.transaction() as conn:
+            yield from self._stream_rows(conn, query, params, batch_size)
+
+    def _stream_rows(self, conn, query, params, batch_size):
+        if self.use_sqlite:
+            cursor = conn.cursor()
+        else:
+            # 具名游標只能在交易中使用，結果保留在伺服器端
+            cursor = conn.cursor(name=f'stream_{next(self._stream_ids)}')
+            cursor.itersize = batch_size
+        try:
+            cursor.execute(query, params or ())
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
         finally:
-            conn.close()
-    
+            cursor.close()
+
     def insert_and_return(self, query, params=None):
         """插入資料並返回新插入的記錄"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            if params:
-                cursor.execute(query, params)
-            else:
-                cursor.execute(query)
-            
-            if self.use_sqlite:
-                # SQLite使用lastrowid
-                new_id = cursor.lastrowid
-                conn.commit()
-                # 查詢新插入的記錄
-                cursor.execute("SELECT * FROM tasks WHERE id = ?", (new_id,))
-                result = cursor.fetchone()
-                return dict(result) if result else None
-            else:
-                # PostgreSQL使用RETURNING
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+
+            if self.supports_returning:
+                # 以RETURNING在同一個語句中取回新記錄
+                query = query.strip()
                 if not query.upper().endswith('RETURNING *'):
                     query += ' RETURNING *'
-                if params:
-                    cursor.execute(query, params)
-                else:
-                    cursor.execute(query)
-                result = cursor.fetchone()
-                conn.commit()
-                return dict(result) if result else None
-        
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
+                cursor.execute(query, params or ())
+                results = cursor.fetchall()
+                return dict(results[0]) if results else None
+
+            # 舊版SQLite使用lastrowid，在同一交易中查詢新插入的記錄
+            cursor.execute(query, params or ())
+            cursor.execute("SELECT * FROM tasks WHERE id = ?", (cursor.lastrowid,))
+            result = cursor.fetchone()
+            return dict(result) if result else None
+
+# 資料表版本號
+SELECT_TABLE_VERSION = Statement(
+    'table_version_select', "SELECT version FROM table_versions WHERE name = ?")
+BUMP_TABLE_VERSION = Statement(
+    'table_version_bump', "UPDATE table_versions SET version = version + 1 WHERE name = ?")
+
+# PostgreSQL上分配任務變更序號的序列；SQLite同一時間只有一個寫入交易，沿用table_versions的計數
+CHANGE_SEQUENCE = 'task_change_seq'
+SELECT_LAST_CHANGE_SEQ = Statement(
+    'change_seq_last', f"SELECT CASE WHEN is_called THEN last_value ELSE 0 END AS seq FROM {CHANGE_SEQUENCE}")
 
 # 全域資料庫實例
 db = Database()
-
@@ -0,0 +1,381 @@
+import json
+import logging
+import os
+import select
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import psycopg2
+import psycopg2.extensions
+from .database import db
+
+logger = logging.getLogger(__name__)
+
+# PostgreSQL LISTEN/NOTIFY 使用的頻道
+NOTIFY_CHANNEL = 'task_events'
+
+# NOTIFY的payload上限為8000位元組
+MAX_NOTIFY_PAYLOAD = 7000
+
+# 沒有事件時送出心跳註解的間隔（秒）
+HEARTBEAT_SECONDS = 15
+
+# 斷線重連前建議客戶端等待的時間（毫秒）
+RETRY_MILLISECONDS = 3000
+
+# 從資料庫補送事件時每次讀取的筆數
+REPLAY_BATCH_SIZE = 500
+
+# 每個行程以同步（WSGI）方式服務的即時串流連線上限；每條連線在整段連線期間佔用一個執行緒。
+# 超過時改以輪詢回應：補送錯過的變更後結束連線。設為0時即時串流只由ASGI入口（src.asgi:app）提供
+MAX_SYNC_SUBSCRIBERS = int(os.getenv('SSE_MAX_SYNC_SUBSCRIBERS') or 8)
+
+# 輪詢回應建議客戶端重新連線前等待的時間（毫秒）
+POLL_RETRY_MILLISECONDS = int(os.getenv('SSE_POLL_RETRY_MS') or 5000)
+
+
+def encode_value(value):
+    """PostgreSQL返回的日期物件以ISO格式編碼，與SQLite儲存的字串一致"""
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def format_event(event_id, event_type, data):
+    """編碼為Server-Sent Events格式"""
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=encode_value)
+    return f"id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n"
+
+
+def change_events(tasks, deleted, created_ids=()):
+    """將活動增量同步的結果轉換為依變更序號排序的 (序號, 已編碼事件) 列表"""
+    events = []
+    for task in tasks:
+        event_type = 'task.created' if task.id in created_ids else 'task.updated'
+        events.append((task.change_seq, task.id, format_event(task.change_seq, event_type, task.to_dict())))
+    for task_id, seq, event_id in deleted:
+        events.append((seq, task_id, format_event(seq, 'task.deleted', {'id': task_id, 'eventId': event_id})))
+    events.sort(key=lambda event: (event[0], event[1]))
+    return [(seq, message) for seq, _, message in events]
+
+
+class SubscriberLimitReached(Exception):
+    """同步串流連線已達上限"""
+
+
+class SyncStream:
+    """佔用同步串流名額的SSE回應內容；WSGI伺服器在連線結束時呼叫close釋放名額"""
+
+    def __init__(self, events, messages):
+        self._events = events
+        self._messages = messages
+        self._closed = False
+
+    def __iter__(self):
+        return self._messages
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._messages.close()
+            self._events.release_sync_stream()
+
+
+class EventBroker:
+    """一個活動在行程內的事件廣播器
+
+    活動的所有串流連線共用同一個條件變數與最近事件的緩衝，事件只編碼一次，
+    閒置連線只是在條件變數上等待，不會各自查詢資料庫。變更序號只在活動內
+    依提交順序遞增，因此每個活動各自一個廣播器。
+    """
+
+    def __init__(self, buffer_size=1000):
+        self.buffer_size = buffer_size
+        self._cond = threading.Condition()
+        self._events = deque()
+        self._evicted_seq = 0
+        self._subscribers = 0
+        # 發布事件時呼叫的喚醒函式（非同步串流以此取代在條件變數上等待）
+        self._wakers = set()
+
+    @property
+    def subscribers(self):
+        """目前連線中的訂閱者數量"""
+        return self._subscribers
+
+    @contextmanager
+    def subscription(self):
+        """訂閱期間計入訂閱者數量"""
+        with self._cond:
+            self._subscribers += 1
+        try:
+            yield self
+        finally:
+            with self._cond:
+                self._subscribers -= 1
+
+    @contextmanager
+    def waker(self, callback):
+        """訂閱期間每次發布事件都呼叫callback（在發布者的執行緒中）"""
+        with self.subscription():
+            with self._cond:
+                self._wakers.add(callback)
+            try:
+                yield self
+            finally:
+                with self._cond:
+                    self._wakers.discard(callback)
+
+    def publish(self, events):
+        """發布依序號排序的 (序號, 已編碼事件) 列表"""
+        if not events:
+            return
+        with self._cond:
+            self._events.extend(events)
+            while len(self._events) > self.buffer_size:
+                seq = self._events.popleft()[0]
+                self._evicted_seq = max(self._evicted_seq, seq)
+            self._cond.notify_all()
+            wakers = list(self._wakers)
+        for wake in wakers:
+            wake()
+
+    def events_after(self, last_seq, timeout):
+        """等待序號大於last_seq的事件；逾時返回空列表，緩衝已不完整時返回None"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if last_seq < self._evicted_seq:
+                    return None
+                pending = []
+                for event in reversed(self._events):
+                    if event[0] <= last_seq:
+                        break
+                    pending.append(event)
+                if pending:
+                    pending.reverse()
+                    return pending
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._cond.wait(remaining)
+
+
+class NotificationListener(threading.Thread):
+    """以獨立連線LISTEN PostgreSQL通知，斷線時自動重連"""
+
+    def __init__(self, dsn, channel, callback):
+        super().__init__(name=f'listen-{channel}', daemon=True)
+        self.dsn = dsn
+        self.channel = channel
+        self.callback = callback
+
+    def run(self):
+        backoff = 1
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self.channel}')
+                backoff = 1
+                # 重新連線期間可能漏掉通知，先同步一次
+                self.callback({})
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            self.callback(json.loads(notify.payload))
+                        except Exception:
+                            logger.exception("處理資料庫通知失敗")
+            except Exception:
+                logger.exception("資料庫通知連線中斷，%s 秒後重試", backoff)
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+
+class TaskEvents:
+    """任務變更事件：由寫入路徑通知，推送給 /api/tasks/stream 的連線
+
+    PostgreSQL 透過 LISTEN/NOTIFY 在各 worker 行程間傳遞通知；SQLite 模式
+    只在行程內廣播。收到通知後依活動的變更序號從資料庫讀取變更內容，
+    因此同一活動的事件順序與提交順序一致。
+    """
+
+    def __init__(self):
+        self._brokers = {}
+        self._lock = threading.Lock()
+        self._published = {}
+        self._created_ids = {}
+        self._listener = None
+        self._listener_pid = None
+        self.max_sync_subscribers = MAX_SYNC_SUBSCRIBERS
+        self._sync_subscribers = 0
+        self._sync_lock = threading.Lock()
+
+    def broker(self, event_id):
+        """活動的事件廣播器，不存在時建立"""
+        broker = self._brokers.get(event_id)
+        if broker is None:
+            broker = self._brokers.setdefault(event_id, EventBroker())
+        return broker
+
+    def notify(self, event_id, seq, created=()):
+        """在寫入交易中呼叫，提交後通知所有行程"""
+        notice = {'event': event_id, 'seq': seq, 'created': list(created)}
+        if db.use_sqlite:
+            db.after_commit(lambda: self.dispatch(notice))
+            return
+        payload = json.dumps(notice, separators=(',', ':'))
+        if len(payload) > MAX_NOTIFY_PAYLOAD:
+            payload = json.dumps({'event': event_id, 'seq': seq}, separators=(',', ':'))
+        with db.transaction() as conn:
+            # 通知在交易提交時才會送出，回滾時不會送出
+            conn.cursor().execute('SELECT pg_notify(%s, %s)', (NOTIFY_CHANNEL, payload))
+
+    def dispatch(self, notice):
+        """處理變更通知：讀取活動尚未發布的變更並廣播；未指定活動時同步所有活動"""
+        with self._lock:
+            event_id = notice.get('event')
+            if event_id is None:
+                # 監聽連線（重新）建立期間可能漏掉通知
+                for event_id in list(self._brokers):
+                    self._publish(event_id)
+                return
+            self._created_ids.setdefault(event_id, set()).update(notice.get('created', ()))
+            self._publish(event_id, notice.get('seq'))
+
+    def _publish(self, event_id, seq=None):
+        """讀取活動在已發布序號之後的變更並廣播；呼叫端持有self._lock"""
+        from .models.task import Task
+
+        broker = self._brokers.get(event_id)
+        if broker is None or broker.subscribers == 0:
+            # 沒有訂閱者時不讀取資料庫，新連線會自行從資料庫補送
+            self._published.pop(event_id, None)
+            self._created_ids.pop(event_id, None)
+            return
+        published = self._published.get(event_id)
+        if published is None:
+            self._published[event_id] = Task.table_version(event_id)
+            self._created_ids.pop(event_id, None)
+            return
+        if seq is not None and seq <= published:
+            return
+
+        tasks, deleted, cursor, _ = Task.get_changes(event_id, published)
+        created_ids = self._created_ids.pop(event_id, ())
+        broker.publish(change_events(tasks, self._deleted_seqs(deleted), created_ids))
+        self._published[event_id] = cursor
+
+    @staticmethod
+    def _deleted_seqs(deleted_ids):
+        """查詢已刪除任務的變更序號與所屬活動，返回 (ID, 序號, 活動ID) 列表"""
+        if not deleted_ids:
+            return []
+        condition, params = db.any_of('id', deleted_ids)
+        rows = db.execute_query(f"SELECT id, change_seq, event_id FROM task_tombstones WHERE {condition}", params)
+        return [(row['id'], row['change_seq'], row['event_id']) for row in rows]
+
+    def ensure_listener(self):
+        """PostgreSQL模式下確保目前行程已啟動通知監聽執行緒"""
+        if db.use_sqlite:
+            return
+        pid = os.getpid()
+        with self._lock:
+            if self._listener is not None and self._listener_pid == pid and self._listener.is_alive():
+                return
+            self._listener = NotificationListener(db.database_url, NOTIFY_CHANNEL, self.dispatch)
+            self._listener_pid = pid
+            self._listener.start()
+
+    def mark_published(self, event_id):
+        """活動的第一個訂閱者連線時記錄目前已發布到的序號"""
+        from .models.task import Task
+
+        with self._lock:
+            if self._published.get(event_id) is None:
+                self._published[event_id] = Task.table_version(event_id)
+
+    def replay(self, event_id, since):
+        """從資料庫補送活動在since之後的變更，返回 (已編碼事件列表, 新游標)"""
+        from .models.task import Task
+
+        messages = []
+        has_more = True
+        while has_more:
+            tasks, deleted, since, has_more = Task.get_changes(event_id, since, REPLAY_BATCH_SIZE)
+            messages.extend(message for _, message in change_events(tasks, self._deleted_seqs(deleted)))
+        return messages, since
+
+    def open_sync_stream(self, event_id, last_event_id=None):
+        """為同步（WSGI）連線保留名額並返回SSE回應內容；已達上限時拋出SubscriberLimitReached"""
+        with self._sync_lock:
+            if self._sync_subscribers >= self.max_sync_subscribers:
+                raise SubscriberLimitReached(
+                    f"Too many event stream connections on this worker ({self.max_sync_subscribers})")
+            self._sync_subscribers += 1
+        return SyncStream(self, self.stream(event_id, last_event_id))
+
+    def poll(self, event_id, last_event_id=None):
+        """同步串流名額已滿時的一次性SSE回應：補送last_event_id之後的變更後結束連線
+
+        retry欄位讓EventSource在POLL_RETRY_MILLISECONDS後帶著Last-Event-ID重新連線，
+        相當於以串流格式輪詢 /tasks/changes，不佔用執行緒。最後以只有id的區塊記錄游標，
+        沒有帶Last-Event-ID的客戶端下次也能從目前的位置繼續。
+        """
+        from .models.task import Task
+
+        if last_event_id is None:
+            messages, cursor = [], Task.table_version(event_id)
+        else:
+            messages, cursor = self.replay(event_id, last_event_id)
+        return f"retry: {POLL_RETRY_MILLISECONDS}\n\n" + ''.join(messages) + f"id: {cursor}\n\n"
+
+    def release_sync_stream(self):
+        """釋放同步串流名額"""
+        with self._sync_lock:
+            self._sync_subscribers -= 1
+
+    def stream(self, event_id, last_event_id=None, heartbeat=HEARTBEAT_SECONDS):
+        """產生活動的SSE串流；帶有last_event_id時先補送之後的變更"""
+        from .models.task import Task
+
+        self.ensure_listener()
+        broker = self.broker(event_id)
+        with broker.subscription():
+            self.mark_published(event_id)
+            yield f"retry: {RETRY_MILLISECONDS}\n\n"
+
+            if last_event_id is None:
+                last_seq = Task.table_version(event_id)
+            else:
+                messages, last_seq = self.replay(event_id, last_event_id)
+                yield from messages
+
+            while True:
+                events = broker.events_after(last_seq, heartbeat)
+                if events is None:
+                    # 連線落後太多，緩衝中的事件已不完整，改從資料庫補送
+                    messages, last_seq = self.replay(event_id, last_seq)
+                    yield from messages
+                elif not events:
+                    yield ": keep-alive\n\n"
+                else:
+                    for _, message in events:
+                        yield message
+                    last_seq = events[-1][0]
+
+
+# 全域任務事件實例
+task_events = TaskEvents()
@@ -0,0 +1,268 @@
+import csv
+import io
+import logging
+import re
+import zipfile
+from datetime import date, datetime, timedelta
+from xml.sax.saxutils import escape
+from .importer import EXCEL_COLUMNS
+from .rows import ColumnGetter
+
+logger = logging.getLogger(__name__)
+
+# 匯出欄位沿用excel_data.json的中文欄位名稱與順序，匯出的檔案可直接重新匯入
+EXPORT_HEADERS = tuple(EXCEL_COLUMNS)
+export_values = ColumnGetter(EXCEL_COLUMNS.values())
+
+# iCalendar事件使用的欄位
+ics_values = ColumnGetter(('id', 'stage', 'milestone', 'start_date', 'end_date', 'content',
+                           'holiday_impact', 'dependencies', 'responsible', 'risks',
+                           'created_at', 'updated_at', 'version'))
+
+ICS_PRODID = '-//Wonder Charge//Task Export//ZH'
+ICS_UID_DOMAIN = 'wonder-charge'
+# iCalendar每行上限75個位元組（不含CRLF）
+ICS_LINE_OCTETS = 75
+
+XLSX_SHEET_NAME = '任務'
+XLSX_NAMESPACE = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+
+# XML 1.0不允許的控制字元
+XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+
+def _text(value):
+    """欄位值轉為字串，None為空字串"""
+    if value is None:
+        return ''
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def stream_csv(batches):
+    """逐批輸出CSV（UTF-8含BOM，Excel才能正確辨識中文）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\r\n')
+    writer.writerow(EXPORT_HEADERS)
+    yield ('\ufeff' + buffer.getvalue()).encode('utf-8')
+    try:
+        for rows in batches:
+            buffer.seek(0)
+            buffer.truncate()
+            values = export_values.for_row(rows[0])
+            writer.writerows([_text(value) for value in values(row)] for row in rows)
+            yield buffer.getvalue().encode('utf-8')
+    except Exception:
+        logger.exception("匯出串流中途失敗")
+        raise
+
+
+class _ChunkSink(io.RawIOBase):
+    """只能寫入、不能定位的輸出，zipfile寫入的位元組暫存到被取走為止"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _xlsx_row(number, values):
+    cells = []
+    for value in values:
+        text = XML_INVALID.sub('', _text(value))
+        if text:
+            cells.append(f'<c t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>')
+        else:
+            cells.append('<c/>')
+    return f'<row r="{number}">{"".join(cells)}</row>'
+
+
+XLSX_PARTS = (
+    ('[Content_Types].xml',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+     '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+     '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+     '<Default Extension="xml" ContentType="application/xml"/>'
+     '<Override PartName="/xl/workbook.xml" '
+     'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+     '<Override PartName="/xl/worksheets/sheet1.xml" '
+     'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+     '</Types>'),
+    ('_rels/.rels',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+     '<Relationship Id="rId1" Target="xl/workbook.xml" '
+     'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+     '</Relationships>'),
+    ('xl/workbook.xml',
+     f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+     f'<workbook xmlns="{XLSX_NAMESPACE}" '
+     f'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+     f'<sheets><sheet name="{XLSX_SHEET_NAME}" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+    ('xl/_rels/workbook.xml.rels',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+     '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+     'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+     '</Relationships>'),
+)
+
+
+def stream_xlsx(batches):
+    """逐批輸出XLSX活頁簿
+
+    工作表以行內字串（inlineStr）寫入，不需要先收集共用字串表；zip以資料描述區
+    記錄每個檔案的大小，因此可以邊壓縮邊輸出。日期維持 YYYY-MM-DD 文字，
+    與匯入格式相同。Excel單一工作表的上限為1,048,576列。
+    """
+    sink = _ChunkSink()
+    archive = zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED)
+    for name, content in XLSX_PARTS:
+        archive.writestr(name, content)
+    yield sink.drain()
+
+    try:
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            # 凍結標題列
+            sheet.write((
+                f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                f'<worksheet xmlns="{XLSX_NAMESPACE}"><sheetViews><sheetView workbookViewId="0">'
+                f'<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+                f'</sheetView></sheetViews><sheetData>{_xlsx_row(1, EXPORT_HEADERS)}'
+            ).encode('utf-8'))
+            number = 1
+            for rows in batches:
+                values = export_values.for_row(rows[0])
+                parts = []
+                for row in rows:
+                    number += 1
+                    parts.append(_xlsx_row(number, values(row)))
+                sheet.write(''.join(parts).encode('utf-8'))
+                yield sink.drain()
+            sheet.write(b'</sheetData></worksheet>')
+        archive.close()
+    except Exception:
+        logger.exception("匯出串流中途失敗")
+        raise
+    yield sink.drain()
+
+
+def _ics_escape(value):
+    """TEXT值的跳脫（RFC 5545 3.3.11）"""
+    return (value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n').replace('\r', '\\n'))
+
+
+def _ics_fold(line):
+    """編碼為UTF-8並將超過75個位元組的行摺疊，不拆開多位元組字元"""
+    data = line.encode('utf-8')
+    if len(data) <= ICS_LINE_OCTETS:
+        return data + b'\r\n'
+    parts = []
+    start = 0
+    limit = ICS_LINE_OCTETS
+    while len(data) - start > limit:
+        end = start + limit
+        # 往前退到字元的第一個位元組
+        while data[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(data[start:end])
+        start = end
+        # 續行以一個空白開頭
+        limit = ICS_LINE_OCTETS - 1
+    parts.append(data[start:])
+    return b'\r\n '.join(parts) + b'\r\n'
+
+
+def _ics_date(value):
+    """資料庫中的日期轉為date，空白或格式錯誤時返回None"""
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def _ics_timestamp(value):
+    """資料庫時間戳記（UTC）轉為iCalendar的UTC日期時間"""
+    if value is None:
+        return None
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value))
+    return value.strftime('%Y%m%dT%H%M%SZ')
+
+
+def _ics_event(values):
+    (task_id, stage, milestone, start_date, end_date, content, holiday_impact,
+     dependencies, responsible, risks, created_at, updated_at, version) = values
+    start = _ics_date(start_date)
+    if start is None:
+        # 沒有開始日的任務無法放上行事曆
+        return b''
+    end = max(_ics_date(end_date) or start, start)
+    stamp = _ics_timestamp(updated_at) or _ics_timestamp(created_at) or '19700101T000000Z'
+
+    # 說明為內容說明，其餘欄位以中文標題附在後面
+    description = [content] if content else []
+    for label, value in (('假期影響', holiday_impact), ('相依關係', dependencies),
+                         ('負責單位/人', responsible), ('風險/備註', risks)):
+        if value:
+            description.append(f'{label}：{value}')
+
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:task-{task_id}@{ICS_UID_DOMAIN}',
+        f'DTSTAMP:{stamp}',
+        f'LAST-MODIFIED:{stamp}',
+        f'SEQUENCE:{max((version or 1) - 1, 0)}',
+        # 全天事件，DTEND為結束日的隔天（不含）
+        f'DTSTART;VALUE=DATE:{start.strftime("%Y%m%d")}',
+        f'DTEND;VALUE=DATE:{(end + timedelta(days=1)).strftime("%Y%m%d")}',
+        f'SUMMARY:{_ics_escape(milestone or "")}',
+    ]
+    if description:
+        lines.append(f'DESCRIPTION:{_ics_escape(chr(10).join(description))}')
+    if stage:
+        lines.append(f'CATEGORIES:{_ics_escape(stage)}')
+    lines.append('TRANSP:TRANSPARENT')
+    lines.append('END:VEVENT')
+    return b''.join(_ics_fold(line) for line in lines)
+
+
+def stream_ics(batches, name='Wonder Charge'):
+    """逐批輸出iCalendar，每個任務為一個全天事件
+
+    事件UID固定為任務ID，SEQUENCE取自任務的版本號，行事曆重新訂閱時能辨識同一事件的更新。
+    """
+    header = ['BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:{ICS_PRODID}', 'CALSCALE:GREGORIAN',
+              f'X-WR-CALNAME:{_ics_escape(name)}']
+    yield b''.join(_ics_fold(line) for line in header)
+    try:
+        for rows in batches:
+            values = ics_values.for_row(rows[0])
+            yield b''.join(_ics_event(values(row)) for row in rows)
+    except Exception:
+        logger.exception("匯出串流中途失敗")
+        raise
+    yield b'END:VCALENDAR\r\n'
+
+
+# 匯出格式：(產生器, MIME類型)
+EXPORT_FORMATS = {
+    'csv': (stream_csv, 'text/csv; charset=utf-8'),
+    'xlsx': (stream_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'ics': (stream_ics, 'text/calendar; charset=utf-8'),
+}
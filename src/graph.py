@@ -0,0 +1,475 @@
+import heapq
+import re
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from .cache import PerEvent, SyncedTaskIndex
+
+# 相依關係中分隔多個前置任務的符號（& 與 / 常出現在里程碑名稱中，不視為分隔）
+DEPENDENCY_SEPARATORS = re.compile(r'[、,，;；\n]+')
+
+# 明確指定任務ID的寫法，例如 #12
+TASK_ID_REFERENCE = re.compile(r'#(\d+)')
+
+# 表示沒有前置任務的寫法
+EMPTY_DEPENDENCIES = {'', '—', '-', '–', '無', 'n/a', 'na', 'none'}
+
+# 引用里程碑時常加上的狀態字尾，比對前移除
+STATUS_SUFFIXES = ('完成', '會議', '核准')
+
+# 名稱比對時參照字詞至少要有此比例出現在里程碑中
+MIN_MATCH_SCORE = 0.5
+
+# 出現在超過此數量里程碑中的字詞過於常見，不用來尋找候選任務
+MAX_TOKEN_POSTINGS = 256
+
+ASCII_RUN = re.compile(r'[a-z0-9]+')
+
+
+def normalize_name(text):
+    """轉小寫並移除空白與標點，只保留文字與數字"""
+    return ''.join(char for char in str(text).lower() if char.isalnum())
+
+
+def name_tokens(text):
+    """將名稱切成比對用的字詞：英數字串為一個字詞，中文取相鄰兩字"""
+    normalized = normalize_name(text)
+    tokens = set()
+    position = 0
+    for match in ASCII_RUN.finditer(normalized):
+        tokens.update(_bigrams(normalized[position:match.start()]))
+        tokens.add(match.group())
+        position = match.end()
+    tokens.update(_bigrams(normalized[position:]))
+    return frozenset(tokens)
+
+
+def _bigrams(text):
+    if len(text) == 1:
+        return [text]
+    return [text[i:i + 2] for i in range(len(text) - 1)]
+
+
+def strip_status(text):
+    """移除「完成」「會議」等狀態字尾"""
+    normalized = normalize_name(text)
+    for suffix in STATUS_SUFFIXES:
+        if normalized.endswith(suffix) and len(normalized) > len(suffix):
+            return normalized[:-len(suffix)]
+    return normalized
+
+
+def parse_references(text):
+    """解析相依關係文字，返回 (明確指定的任務ID列表, 里程碑名稱參照列表)"""
+    if text is None:
+        return [], []
+    text = str(text).strip()
+    if text.lower() in EMPTY_DEPENDENCIES:
+        return [], []
+    ids = [int(value) for value in TASK_ID_REFERENCE.findall(text)]
+    names = []
+    for part in DEPENDENCY_SEPARATORS.split(TASK_ID_REFERENCE.sub('', text)):
+        part = part.strip()
+        if part and part.lower() not in EMPTY_DEPENDENCIES and normalize_name(part):
+            names.append(part)
+    return ids, names
+
+
+def to_ordinal(value):
+    """日期（date或YYYY-MM-DD字串）轉為序數，無法解析時返回None"""
+    if isinstance(value, date):
+        return value.toordinal()
+    try:
+        return date.fromisoformat(str(value)[:10]).toordinal()
+    except (TypeError, ValueError):
+        return None
+
+
+def from_ordinal(value):
+    """序數轉回YYYY-MM-DD字串"""
+    return date.fromordinal(value).isoformat() if value is not None else None
+
+
+class DependencyGraph(SyncedTaskIndex):
+    """由相依關係欄位建立的任務圖
+
+    相依關係可寫任務ID（#12）或里程碑名稱；名稱以字詞重疊比例比對，
+    候選任務只由不常見的字詞找出，同分時優先選擇在該任務開始前結束、
+    且結束最晚的任務。任務變更時只
+    重新解析受影響的任務（本身、以及參照字詞與其里程碑重疊的任務）。
+    拓撲排序、要徑與循環等衍生結果依版本快取。
+    """
+
+    def __init__(self, event_id=None):
+        super().__init__(event_id)
+        self.reset()
+
+    def reset(self):
+        self._tasks = {}
+        self._start = {}
+        self._end = {}
+        self._milestone_tokens = {}
+        self._milestone_index = defaultdict(set)
+        self._exact_names = defaultdict(set)
+        self._references = {}
+        self._reference_index = defaultdict(set)
+        self._id_reference_index = defaultdict(set)
+        self._preds = {}
+        self._succs = defaultdict(set)
+        self._unresolved = {}
+        self._derived = {}
+
+    # 索引維護
+
+    def apply(self, tasks, deleted_ids):
+        if not self._tasks:
+            # 重建時全部加入後再一次解析
+            for task in tasks:
+                self._add_task(task)
+            for task_id in self._tasks:
+                self._resolve(task_id)
+            self._derived = {}
+            return
+
+        affected = set()
+        for task_id in deleted_ids:
+            if task_id in self._tasks:
+                affected |= self._dependents_of(task_id)
+                self._remove_task(task_id)
+        for task in tasks:
+            if task.id in self._tasks:
+                affected |= self._dependents_of(task.id)
+                self._remove_task(task.id)
+            self._add_task(task)
+            affected |= self._dependents_of(task.id)
+            affected.add(task.id)
+
+        for task_id in affected:
+            if task_id in self._tasks:
+                self._resolve(task_id)
+        self._derived = {}
+
+    def _add_task(self, task):
+        task_id = task.id
+        self._tasks[task_id] = task
+        self._start[task_id] = to_ordinal(task.start_date)
+        self._end[task_id] = to_ordinal(task.end_date)
+        tokens = name_tokens(task.milestone or '')
+        self._milestone_tokens[task_id] = tokens
+        for token in tokens:
+            self._milestone_index[token].add(task_id)
+        self._exact_names[normalize_name(task.milestone or '')].add(task_id)
+
+        ids, names = parse_references(task.dependencies)
+        references = (ids, [(name, name_tokens(strip_status(name))) for name in names])
+        self._references[task_id] = references
+        for referenced_id in ids:
+            self._id_reference_index[referenced_id].add(task_id)
+        for _, tokens in references[1]:
+            for token in tokens:
+                self._reference_index[token].add(task_id)
+        self._preds[task_id] = ()
+
+    def _remove_task(self, task_id):
+        task = self._tasks.pop(task_id)
+        for token in self._milestone_tokens.pop(task_id):
+            self._discard(self._milestone_index, token, task_id)
+        self._discard(self._exact_names, normalize_name(task.milestone or ''), task_id)
+
+        ids, names = self._references.pop(task_id)
+        for referenced_id in ids:
+            self._discard(self._id_reference_index, referenced_id, task_id)
+        for _, tokens in names:
+            for token in tokens:
+                self._discard(self._reference_index, token, task_id)
+
+        self._set_preds(task_id, ())
+        del self._preds[task_id]
+        self._succs.pop(task_id, None)
+        self._unresolved.pop(task_id, None)
+        self._start.pop(task_id)
+        self._end.pop(task_id)
+
+    @staticmethod
+    def _discard(index, key, value):
+        members = index.get(key)
+        if members is not None:
+            members.discard(value)
+            if not members:
+                del index[key]
+
+    def _dependents_of(self, task_id):
+        """可能參照此任務的任務：明確指定ID，或參照字詞與其里程碑重疊"""
+        dependents = set(self._id_reference_index.get(task_id, ()))
+        dependents |= self._succs.get(task_id, set())
+        for token in self._milestone_tokens.get(task_id, ()):
+            if self._is_selective(token):
+                dependents |= self._reference_index.get(token, set())
+        return dependents
+
+    def _is_selective(self, token):
+        return len(self._milestone_index.get(token, ())) <= MAX_TOKEN_POSTINGS
+
+    def _set_preds(self, task_id, preds):
+        for pred in self._preds.get(task_id, ()):
+            self._discard(self._succs, pred, task_id)
+        self._preds[task_id] = preds
+        for pred in preds:
+            self._succs[pred].add(task_id)
+
+    def _resolve(self, task_id):
+        """重新解析任務的相依關係"""
+        ids, names = self._references[task_id]
+        preds = [pred for pred in ids if pred in self._tasks and pred != task_id]
+        unresolved = [f'#{pred}' for pred in ids if pred not in self._tasks]
+        for name, tokens in names:
+            pred = self._match_name(task_id, name, tokens)
+            if pred is None:
+                unresolved.append(name)
+            elif pred not in preds:
+                preds.append(pred)
+        self._set_preds(task_id, tuple(preds))
+        if unresolved:
+            self._unresolved[task_id] = unresolved
+        else:
+            self._unresolved.pop(task_id, None)
+
+    def _match_name(self, task_id, name, tokens):
+        """以里程碑名稱找出被參照的任務，找不到時返回None"""
+        exact = self._exact_names.get(normalize_name(name), set()) - {task_id}
+        candidates = exact
+        if not candidates and tokens:
+            # 只從較少見的字詞找候選，再計算每個候選命中的字詞數
+            hits = Counter()
+            for token in tokens:
+                if self._is_selective(token):
+                    hits.update(self._milestone_index.get(token, ()))
+            for candidate in hits:
+                milestone_tokens = self._milestone_tokens[candidate]
+                hits[candidate] += sum(1 for token in tokens
+                                       if not self._is_selective(token) and token in milestone_tokens)
+            hits.pop(task_id, None)
+            if not hits:
+                return None
+            best = max(hits.values())
+            if best / len(tokens) < MIN_MATCH_SCORE:
+                return None
+            candidates = [candidate for candidate, count in hits.items() if count == best]
+        if not candidates:
+            return None
+
+        start = self._start[task_id]
+
+        def rank(candidate):
+            end = self._end[candidate]
+            precedes = start is not None and end is not None and end <= start
+            # 在開始前結束者優先，其次是名稱較精確、結束最晚者
+            return (precedes, -len(self._milestone_tokens[candidate]),
+                    end if precedes else 0, -candidate)
+
+        return max(candidates, key=rank)
+
+    # 查詢
+
+    def edges(self):
+        """所有相依邊 [前置任務ID, 任務ID]"""
+        return [[pred, task_id] for task_id in sorted(self._preds) for pred in self._preds[task_id]]
+
+    def unresolved(self):
+        """無法解析的相依關係 {任務ID: [參照文字]}"""
+        return {task_id: list(names) for task_id, names in sorted(self._unresolved.items())}
+
+    def predecessors(self, task_id):
+        return list(self._preds.get(task_id, ()))
+
+    def successors(self, task_id):
+        return sorted(self._succs.get(task_id, ()))
+
+    def topological_order(self):
+        """拓撲排序，同層依開始日與ID排序；返回 (排序後ID列表, 位於循環中或依賴循環的ID列表)"""
+        cached = self._derived.get('order')
+        if cached is not None:
+            return cached
+        indegree = {task_id: len(preds) for task_id, preds in self._preds.items()}
+        heap = [(self._start[task_id] or 0, task_id) for task_id, count in indegree.items() if count == 0]
+        heapq.heapify(heap)
+        order = []
+        while heap:
+            _, task_id = heapq.heappop(heap)
+            order.append(task_id)
+            for succ in self._succs.get(task_id, ()):
+                indegree[succ] -= 1
+                if indegree[succ] == 0:
+                    heapq.heappush(heap, (self._start[succ] or 0, succ))
+        blocked = sorted(task_id for task_id, count in indegree.items() if count > 0)
+        result = self._derived['order'] = (order, blocked)
+        return result
+
+    def cycles(self):
+        """找出所有相依循環（強連通分量），每個循環為排序後的ID列表"""
+        cached = self._derived.get('cycles')
+        if cached is not None:
+            return cached
+        index = {}
+        lowlink = {}
+        on_stack = set()
+        stack = []
+        components = []
+        counter = 0
+        for root in sorted(self._preds):
+            if root in index:
+                continue
+            # 迭代版Tarjan演算法，避免大型圖超過遞迴深度
+            work = [(root, iter(sorted(self._succs.get(root, ()))))]
+            index[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                node, children = work[-1]
+                child = next(children, None)
+                if child is not None:
+                    if child not in index:
+                        index[child] = lowlink[child] = counter
+                        counter += 1
+                        stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(sorted(self._succs.get(child, ())))))
+                    elif child in on_stack:
+                        lowlink[node] = min(lowlink[node], index[child])
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    if len(component) > 1:
+                        components.append(sorted(component))
+        components.sort()
+        self._derived['cycles'] = components
+        return components
+
+    def critical_path(self):
+        """要徑（CPM）：依拓撲順序計算工期加總最長的相依鏈
+
+        每個任務的工期為 結束日 - 開始日 + 1 天（缺日期時為0），最早完成時間為
+        工期加上前置任務中最晚的最早完成時間；從最早完成時間最大的任務往回，
+        沿著最早完成時間等於其最早開始時間的前置任務追溯。返回依時間順序排列的任務ID、
+        每一步與前一任務在排定日期之間的間隔天數（gapDays，依排定日期計算，並非CPM的
+        總浮時；要徑上的任務總浮時皆為0），以及路徑的工期總和（lengthDays）。
+        循環中的任務不列入。
+        """
+        cached = self._derived.get('critical_path')
+        if cached is not None:
+            return cached
+        order, _ = self.topological_order()
+        acyclic = set(order)
+        earliest_start = {}
+        earliest_finish = {}
+        for task_id in order:
+            start, end = self._start[task_id], self._end[task_id]
+            duration = max(end - start + 1, 0) if start is not None and end is not None else 0
+            earliest_start[task_id] = max((earliest_finish[pred] for pred in self._preds[task_id]
+                                           if pred in acyclic), default=0)
+            earliest_finish[task_id] = earliest_start[task_id] + duration
+
+        def driving_key(task_id):
+            # 同為最長時優先選擇排定結束日最晚、ID最小的任務
+            return earliest_finish[task_id], self._end[task_id] is not None, self._end[task_id] or 0, -task_id
+
+        path = []
+        if order and max(earliest_finish.values()) > 0:
+            current = max(order, key=driving_key)
+            while current is not None:
+                path.append(current)
+                preds = [pred for pred in self._preds[current] if pred in acyclic
+                         and earliest_finish[pred] == earliest_start[current] > 0]
+                current = max(preds, key=driving_key) if preds else None
+            path.reverse()
+
+        steps = []
+        for position, task_id in enumerate(path):
+            gap = None
+            previous_end = self._end[path[position - 1]] if position > 0 else None
+            if previous_end is not None and self._start[task_id] is not None:
+                gap = max(self._start[task_id] - previous_end - 1, 0)
+            steps.append({'id': task_id, 'gapDays': gap})
+        first_start = self._start[path[0]] if path else None
+        last_end = self._end[path[-1]] if path else None
+        result = {
+            'path': steps,
+            'startDate': from_ordinal(first_start),
+            'endDate': from_ordinal(last_end),
+            'durationDays': last_end - first_start + 1 if first_start is not None and last_end is not None else None,
+            'lengthDays': earliest_finish[path[-1]] if path else 0,
+        }
+        self._derived['critical_path'] = result
+        return result
+
+    def impact(self, task_id, days):
+        """任務延後days天時，後續任務各會延後幾天
+
+        延遲沿相依邊傳遞，每條邊先扣除兩任務之間原有的緩衝天數。
+        返回受影響任務的列表（依拓撲順序）與整體結束日的延後天數。
+        """
+        if task_id not in self._tasks:
+            raise KeyError(task_id)
+        order, _ = self.topological_order()
+        position = {node: index for index, node in enumerate(order)}
+
+        slip = {task_id: days}
+        pending = [(position.get(task_id, -1), task_id)]
+        queued = {task_id}
+        while pending:
+            # 依拓撲順序處理，確保每個任務在所有前置任務之後才計算
+            _, node = heapq.heappop(pending)
+            for succ in self._succs.get(node, ()):
+                if succ not in position:
+                    continue
+                start, end = self._start[succ], self._end[node]
+                gap = max(start - end - 1, 0) if start is not None and end is not None else 0
+                delay = slip[node] - gap
+                if delay > slip.get(succ, 0):
+                    slip[succ] = delay
+                    if succ not in queued:
+                        queued.add(succ)
+                        heapq.heappush(pending, (position[succ], succ))
+
+        affected = []
+        for node in sorted(slip, key=lambda node: position.get(node, -1)):
+            if node == task_id or slip[node] <= 0:
+                continue
+            affected.append({
+                'id': node,
+                'milestone': self._tasks[node].milestone,
+                'slipDays': slip[node],
+                'newStartDate': self._shift(self._start[node], slip[node]),
+                'newEndDate': self._shift(self._end[node], slip[node]),
+            })
+
+        ends = [end for end in self._end.values() if end is not None]
+        finish = max(ends) if ends else None
+        new_finish = max([finish or 0] + [self._end[node] + slip[node] for node in slip
+                                          if self._end[node] is not None and slip[node] > 0])
+        return {
+            'taskId': task_id,
+            'days': days,
+            'affected': affected,
+            'projectDelayDays': new_finish - finish if finish is not None else 0,
+        }
+
+    @staticmethod
+    def _shift(ordinal, days):
+        if ordinal is None:
+            return None
+        return (date.fromordinal(ordinal) + timedelta(days=days)).isoformat()
+
+
+# 各活動的任務相依圖
+dependency_graph = PerEvent(DependencyGraph)
@@ -0,0 +1,283 @@
+import io
+import json
+import time
+from datetime import date
+from .database import db
+from .models.event import DEFAULT_EVENT_ID
+from .models.task import Task
+
+# excel_data.json 的中文欄位名稱對應到tasks資料表欄位
+EXCEL_COLUMNS = {
+    '階段': 'stage',
+    '開始日': 'start_date',
+    '結束日': 'end_date',
+    '里程碑': 'milestone',
+    '內容說明': 'content',
+    '假期影響': 'holiday_impact',
+    '相依關係': 'dependencies',
+    '負責單位/人': 'responsible',
+    '風險/備註': 'risks',
+}
+
+# 舊版匯出檔使用的欄位名稱
+LEGACY_COLUMNS = {
+    '開始日期': 'start_date',
+    '結束日期': 'end_date',
+}
+
+IMPORT_COLUMNS = ('stage', 'milestone', 'start_date', 'end_date', 'content',
+                  'holiday_impact', 'dependencies', 'responsible', 'risks')
+
+# 判斷同一筆任務的自然鍵，重複匯入時以此更新而不是新增
+NATURAL_KEY = ('stage', 'milestone')
+
+
+def iter_json_array(fp, chunk_size=64 * 1024):
+    """逐筆解析最外層為陣列的JSON，不需將整個檔案載入記憶體"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    state = 'start'
+
+    while True:
+        # 略過空白，必要時讀取更多內容
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+            pos += 1
+        if pos >= len(buffer):
+            if eof:
+                raise ValueError("JSON 資料不完整")
+            chunk = fp.read(chunk_size)
+            if not chunk:
+                eof = True
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+
+        char = buffer[pos]
+        if state == 'start':
+            if char != '[':
+                raise ValueError("JSON 資料必須是陣列")
+            pos += 1
+            state = 'first'
+            continue
+        if char == ']' and state in ('first', 'separator'):
+            return
+        if state == 'separator':
+            if char != ',':
+                raise ValueError(f"JSON 格式錯誤：預期 ',' 但讀到 {char!r}")
+            pos += 1
+            state = 'value'
+            continue
+
+        # 解析一個元素；內容被分塊截斷時讀取更多再重試
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+                if end < len(buffer) or eof:
+                    break
+            except ValueError:
+                if eof:
+                    raise
+            chunk = fp.read(chunk_size)
+            if not chunk:
+                eof = True
+            buffer, pos = buffer[pos:] + chunk, 0
+
+        yield item
+        pos = end
+        state = 'separator'
+        if pos > chunk_size:
+            buffer, pos = buffer[pos:], 0
+
+
+def is_iso_date(value):
+    """是否為 YYYY-MM-DD 格式且實際存在的日期（2025-02-30等不存在的日期不接受）"""
+    try:
+        return date.fromisoformat(value).isoformat() == value
+    except (TypeError, ValueError):
+        return False
+
+
+def normalize_row(item):
+    """將一筆Excel格式資料轉換為tasks欄位，資料不合法時拋出ValueError"""
+    if not isinstance(item, dict):
+        raise ValueError("資料格式錯誤，應為物件")
+
+    row = dict.fromkeys(IMPORT_COLUMNS)
+    for source, column in LEGACY_COLUMNS.items():
+        if item.get(source) is not None:
+            row[column] = item[source]
+    for source, column in EXCEL_COLUMNS.items():
+        if item.get(source) is not None:
+            row[column] = item[source]
+
+    for column in ('stage', 'milestone'):
+        if not row[column] or not str(row[column]).strip():
+            raise ValueError(f"缺少必要欄位: {column}")
+    for column in ('start_date', 'end_date'):
+        value = row[column]
+        if not value or not is_iso_date(str(value)):
+            raise ValueError(f"日期格式錯誤 ({column}): {value!r}")
+    if row['end_date'] < row['start_date']:
+        raise ValueError("結束日早於開始日")
+
+    for column in IMPORT_COLUMNS:
+        if row[column] is not None and not isinstance(row[column], str):
+            row[column] = str(row[column])
+    return row
+
+
+def _copy_value(value):
+    """轉換為PostgreSQL COPY文字格式的欄位值"""
+    if value is None:
+        return '\\N'
+    return (value.replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+class TaskImporter:
+    """批次、交易式的任務匯入引擎
+
+    資料逐筆串流讀取，每累積batch_size筆寫入暫存表，再以集合式
+    UPDATE/INSERT依自然鍵（階段＋里程碑）合併到活動的任務，因此重複匯入
+    不會產生重複資料。整個匯入在同一個交易中完成，資料庫錯誤時全部回滾；
+    個別資料列的格式錯誤只會跳過該列並記錄在結果中。
+    """
+
+    STAGING_TABLE = 'task_import_staging'
+
+    def __init__(self, batch_size=500, event_id=DEFAULT_EVENT_ID):
+        self.batch_size = batch_size
+        self.event_id = event_id
+
+    def import_file(self, fp):
+        """從JSON檔案物件匯入"""
+        return self.run(iter_json_array(fp))
+
+    def run(self, items):
+        """匯入可迭代的Excel格式資料，返回匯入統計"""
+        started = time.perf_counter()
+        result = {
+            'total': 0,
+            'inserted': 0,
+            'updated': 0,
+            'unchanged': 0,
+            'errors': [],
+        }
+
+        with db.transaction() as conn:
+            cursor = conn.cursor()
+            seq = Task.begin_change(self.event_id)
+            self._create_staging(cursor)
+
+            batch = {}
+            for index, item in enumerate(items, start=1):
+                result['total'] += 1
+                try:
+                    row = normalize_row(item)
+                except ValueError as e:
+                    milestone = item.get('里程碑') if isinstance(item, dict) else None
+                    result['errors'].append({'row': index, 'milestone': milestone, 'error': str(e)})
+                    continue
+                # 同一批內重複的自然鍵以後出現者為準
+                batch[tuple(row[column] for column in NATURAL_KEY)] = row
+                if len(batch) >= self.batch_size:
+                    self._flush(cursor, list(batch.values()), seq, result)
+                    batch = {}
+            if batch:
+                self._flush(cursor, list(batch.values()), seq, result)
+
+            self._drop_staging(cursor)
+            Task.finish_change(self.event_id, seq)
+
+        elapsed = time.perf_counter() - started
+        result['imported'] = result['inserted'] + result['updated'] + result['unchanged']
+        result['elapsed_seconds'] = round(elapsed, 4)
+        result['rows_per_second'] = round(result['total'] / elapsed, 1) if elapsed > 0 else None
+        return result
+
+    def _create_staging(self, cursor):
+        """建立本次匯入使用的暫存表"""
+        if db.use_sqlite:
+            cursor.execute(f'DROP TABLE IF EXISTS temp.{self.STAGING_TABLE}')
+            cursor.execute(f'''
+                CREATE TEMP TABLE {self.STAGING_TABLE} (
+                    stage TEXT, milestone TEXT, start_date TEXT, end_date TEXT,
+                    content TEXT, holiday_impact TEXT, dependencies TEXT,
+                    responsible TEXT, risks TEXT
+                )
+            ''')
+        else:
+            cursor.execute(f'''
+                CREATE TEMP TABLE {self.STAGING_TABLE} (
+                    stage VARCHAR(255), milestone VARCHAR(255), start_date DATE, end_date DATE,
+                    content TEXT, holiday_impact TEXT, dependencies TEXT,
+                    responsible TEXT, risks TEXT
+                ) ON COMMIT DROP
+            ''')
+
+    def _drop_staging(self, cursor):
+        """移除暫存表（PostgreSQL於提交時自動移除）"""
+        if db.use_sqlite:
+            cursor.execute(f'DROP TABLE IF EXISTS temp.{self.STAGING_TABLE}')
+
+    def _load_staging(self, cursor, rows):
+        """將一批資料寫入暫存表：PostgreSQL使用COPY，SQLite使用executemany"""
+        if db.use_sqlite:
+            placeholders = ', '.join('?' for _ in IMPORT_COLUMNS)
+            cursor.executemany(
+                f"INSERT INTO {self.STAGING_TABLE} ({', '.join(IMPORT_COLUMNS)}) VALUES ({placeholders})",
+                [tuple(row[column] for column in IMPORT_COLUMNS) for row in rows])
+        else:
+            buffer = io.StringIO()
+            for row in rows:
+                buffer.write('\t'.join(_copy_value(row[column]) for column in IMPORT_COLUMNS))
+                buffer.write('\n')
+            buffer.seek(0)
+            cursor.copy_from(buffer, self.STAGING_TABLE, columns=IMPORT_COLUMNS)
+
+    def _flush(self, cursor, rows, seq, result):
+        """以集合式SQL將暫存表合併到活動的任務"""
+        self._load_staging(cursor, rows)
+
+        key_match = ' AND '.join(f'tasks.{column} = s.{column}' for column in NATURAL_KEY)
+        data_columns = [column for column in IMPORT_COLUMNS if column not in NATURAL_KEY]
+        distinct = 'IS NOT' if db.use_sqlite else 'IS DISTINCT FROM'
+        p = db.placeholder
+
+        changed = ' OR '.join(f'tasks.{column} {distinct} s.{column}' for column in data_columns)
+        if db.supports_update_from:
+            cursor.execute(f'''
+                UPDATE tasks
+                SET {', '.join(f'{column} = s.{column}' for column in data_columns)},
+                    change_seq = {p}, version = tasks.version + 1, updated_at = CURRENT_TIMESTAMP
+                FROM {self.STAGING_TABLE} AS s
+                WHERE tasks.event_id = {p} AND {key_match} AND ({changed})
+            ''', (seq, self.event_id))
+        else:
+            # 舊版SQLite沒有 UPDATE ... FROM，以相關子查詢取得暫存表中的新值
+            staged = f'FROM {self.STAGING_TABLE} AS s WHERE {key_match}'
+            cursor.execute(f'''
+                UPDATE tasks
+                SET {', '.join(f'{column} = (SELECT s.{column} {staged})' for column in data_columns)},
+                    change_seq = {p}, version = tasks.version + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE tasks.event_id = {p} AND EXISTS (SELECT 1 {staged} AND ({changed}))
+            ''', (seq, self.event_id))
+        updated = cursor.rowcount
+
+        cursor.execute(f'''
+            INSERT INTO tasks ({', '.join(IMPORT_COLUMNS)}, completed, change_seq, event_id)
+            SELECT {', '.join(f's.{column}' for column in IMPORT_COLUMNS)}, FALSE, {p}, {p}
+            FROM {self.STAGING_TABLE} AS s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM tasks
+                WHERE tasks.event_id = {p} AND {key_match}
+            )
+        ''', (seq, self.event_id, self.event_id))
+        inserted = cursor.rowcount
+
+        cursor.execute(f'DELETE FROM {self.STAGING_TABLE}')
+
+        result['inserted'] += inserted
+        result['updated'] += updated
+        result['unchanged'] += max(len(rows) - inserted - updated, 0)
@@ -0,0 +1,180 @@
+import random
+from .cache import PerEvent, SyncedTaskIndex
+from .graph import to_ordinal
+
+
+class _Node:
+    __slots__ = ('key', 'priority', 'max_end', 'left', 'right')
+
+    def __init__(self, key, priority):
+        self.key = key
+        self.priority = priority
+        self.max_end = key[1]
+        self.left = None
+        self.right = None
+
+
+def _update(node):
+    """重新計算子樹中最大的結束值"""
+    max_end = node.key[1]
+    if node.left is not None and node.left.max_end > max_end:
+        max_end = node.left.max_end
+    if node.right is not None and node.right.max_end > max_end:
+        max_end = node.right.max_end
+    node.max_end = max_end
+
+
+class IntervalTree:
+    """以treap實作、依子樹最大結束值剪枝的區間樹
+
+    鍵為 (開始, 結束, ID)，區間為閉區間。新增與刪除為 O(log n)，
+    重疊查詢為 O(log n + k)，結果依開始、結束、ID排序。
+    """
+
+    def __init__(self, seed=None):
+        self._root = None
+        self._size = 0
+        self._random = random.Random(seed)
+
+    def __len__(self):
+        return self._size
+
+    def insert(self, start, end, item_id):
+        self._root = self._insert(self._root, _Node((start, end, item_id), self._random.random()))
+        self._size += 1
+
+    def _insert(self, node, new):
+        if node is None:
+            return new
+        if new.key < node.key:
+            node.left = self._insert(node.left, new)
+            if node.left.priority > node.priority:
+                node = self._rotate_right(node)
+        else:
+            node.right = self._insert(node.right, new)
+            if node.right.priority > node.priority:
+                node = self._rotate_left(node)
+        _update(node)
+        return node
+
+    def remove(self, start, end, item_id):
+        """刪除區間，不存在時拋出KeyError"""
+        self._root = self._remove(self._root, (start, end, item_id))
+        self._size -= 1
+
+    def _remove(self, node, key):
+        if node is None:
+            raise KeyError(key)
+        if key < node.key:
+            node.left = self._remove(node.left, key)
+        elif key > node.key:
+            node.right = self._remove(node.right, key)
+        else:
+            if node.left is None:
+                return node.right
+            if node.right is None:
+                return node.left
+            # 將優先權較高的子節點轉上來，直到要刪除的節點成為葉節點
+            if node.left.priority > node.right.priority:
+                node = self._rotate_right(node)
+                node.right = self._remove(node.right, key)
+            else:
+                node = self._rotate_left(node)
+                node.left = self._remove(node.left, key)
+        _update(node)
+        return node
+
+    @staticmethod
+    def _rotate_right(node):
+        pivot = node.left
+        node.left = pivot.right
+        pivot.right = node
+        _update(node)
+        _update(pivot)
+        return pivot
+
+    @staticmethod
+    def _rotate_left(node):
+        pivot = node.right
+        node.right = pivot.left
+        pivot.left = node
+        _update(node)
+        _update(pivot)
+        return pivot
+
+    def overlapping(self, low, high):
+        """與閉區間 [low, high] 重疊的所有 (開始, 結束, ID)"""
+        results = []
+        stack = []
+        node = self._root
+        # 中序走訪；子樹最大結束值小於low時整棵略過，開始值大於high時不再往右
+        while stack or node is not None:
+            while node is not None and node.max_end >= low:
+                stack.append(node)
+                node = node.left
+            if not stack:
+                break
+            node = stack.pop()
+            start, end, _ = node.key
+            if start > high:
+                break
+            if end >= low:
+                results.append(node.key)
+            node = node.right
+        return results
+
+
+class TaskIntervalIndex(SyncedTaskIndex):
+    """依任務開始日與結束日建立的區間索引，供時間軸與甘特圖查詢
+
+    沒有有效日期的任務不列入索引；結束日早於開始日時視為單日任務。
+    """
+
+    def __init__(self, event_id=None):
+        super().__init__(event_id)
+        self.reset()
+
+    def reset(self):
+        self._tree = IntervalTree()
+        self._tasks = {}
+        self._keys = {}
+
+    def apply(self, tasks, deleted_ids):
+        for task_id in deleted_ids:
+            self._discard(task_id)
+        for task in tasks:
+            self._discard(task.id)
+            start, end = to_ordinal(task.start_date), to_ordinal(task.end_date)
+            if start is None:
+                continue
+            if end is None or end < start:
+                end = start
+            self._tree.insert(start, end, task.id)
+            self._tasks[task.id] = task
+            self._keys[task.id] = (start, end)
+
+    def _discard(self, task_id):
+        key = self._keys.pop(task_id, None)
+        if key is not None:
+            self._tree.remove(key[0], key[1], task_id)
+            del self._tasks[task_id]
+
+    def window(self, window_from, window_to):
+        """與日期區間重疊的任務，依開始日排序"""
+        low, high = to_ordinal(window_from), to_ordinal(window_to)
+        if low is None or high is None:
+            raise ValueError("from and to must be YYYY-MM-DD dates")
+        if high < low:
+            raise ValueError("to must not be earlier than from")
+        return [self._tasks[item_id] for _, _, item_id in self._tree.overlapping(low, high)]
+
+    def active_on(self, day):
+        """在指定日期進行中的任務"""
+        return self.window(day, day)
+
+    def __len__(self):
+        return len(self._tree)
+
+
+# 各活動的任務區間索引
+task_intervals = PerEvent(TaskIntervalIndex)
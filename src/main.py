@@ -3,56 +3,130 @@ import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory
+import logging
+import secrets
+import time
+from flask import Flask, request
 from flask_cors import CORS
 from src.database import db
+from src.models.event import DEFAULT_EVENT_ID
+from src.metrics import metrics
+from src.routes.event import event_bp
 from src.routes.task import task_bp
+from src.static_files import StaticManifest
 
-app = Flask(__name__, static_folder=os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static'))
-app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
-
-# 啟用CORS以支援跨域請求
-CORS(app)
-
-# 註冊API路由
-app.register_blueprint(task_bp, url_prefix='/api')
-
-# 初始化資料庫
-with app.app_context():
-    db.init_db()
-
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
-def serve(path):
-    """提供靜態檔案服務"""
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
-        return "Static folder not configured", 404
-
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        response = send_from_directory(static_folder_path, path)
-        # 禁用快取
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
-        return response
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            response = send_from_directory(static_folder_path, 'index.html')
-            # 禁用快取
-            response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-            response.headers['Pragma'] = 'no-cache'
-            response.headers['Expires'] = '0'
-            return response
-        else:
+logger = logging.getLogger(__name__)
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static')
+
+# 資料庫結構初始化的時機：lazy（第一個請求時）、startup（建立應用時）、skip（由部署流程另外執行）
+DB_INIT_MODES = ('lazy', 'startup', 'skip')
+
+# 監控端點不觸發資料庫結構檢查，資料庫無法連線時仍可回應
+MONITORING_ENDPOINTS = ('health_check', 'deep_health_check', 'metrics')
+
+def create_app(config=None):
+    """建立Flask應用
+
+    設定可由環境變數或config參數指定。建立應用時不連接資料庫，
+    資料庫結構預設在第一個請求時檢查一次，已是最新版本時不執行任何DDL。
+    """
+    started = time.perf_counter()
+    app = Flask(__name__, static_folder=STATIC_FOLDER)
+    app.config.update(
+        SECRET_KEY=os.getenv('SECRET_KEY'),
+        DB_INIT=os.getenv('DB_INIT', 'lazy'),
+        # 未指定活動的 /api/tasks... 路由操作的活動
+        DEFAULT_EVENT_ID=int(os.getenv('DEFAULT_EVENT_ID') or DEFAULT_EVENT_ID),
+    )
+    if config:
+        app.config.update(config)
+
+    if not app.config['SECRET_KEY']:
+        # 未設定時每個行程使用隨機金鑰，重新啟動後已簽署的資料會失效
+        logger.warning("SECRET_KEY is not set; using a random key for this process")
+        app.config['SECRET_KEY'] = secrets.token_hex(32)
+    if app.config['DB_INIT'] not in DB_INIT_MODES:
+        raise ValueError(f"DB_INIT must be one of {', '.join(DB_INIT_MODES)}")
+
+    # 啟用CORS以支援跨域請求
+    CORS(app)
+
+    # 註冊API路由
+    app.register_blueprint(task_bp, url_prefix='/api')
+    app.register_blueprint(task_bp, url_prefix='/api/events/<int:event_id>', name='event_task_bp')
+    app.register_blueprint(event_bp, url_prefix='/api')
+
+    # 請求計時、每個請求的查詢次數與 /metrics 端點
+    metrics.init_app(app)
+
+    # 設定讀取副本時，GET請求的查詢改由副本執行
+    db.init_app(app)
+
+    # 初始化資料庫
+    if app.config['DB_INIT'] == 'startup':
+        db.ensure_schema()
+    elif app.config['DB_INIT'] == 'lazy':
+        @app.before_request
+        def ensure_schema():
+            if request.endpoint not in MONITORING_ENDPOINTS:
+                db.ensure_schema()
+
+    # 啟動時建立靜態檔案清單
+    static_manifest = StaticManifest(app.static_folder)
+
+    @app.route('/', defaults={'path': ''})
+    @app.route('/<path:path>')
+    def serve(path):
+        """提供靜態檔案服務"""
+        if app.static_folder is None:
+            return "Static folder not configured", 404
+
+        response = static_manifest.response(path)
+        if response is None:
             return "index.html not found", 404
+        return response
 
-@app.route('/health')
-def health_check():
-    """健康檢查端點"""
-    return {"status": "healthy", "database": "postgresql" if not db.use_sqlite else "sqlite"}
+    @app.route('/health')
+    def health_check():
+        """健康檢查端點"""
+        return {
+            "status": "healthy",
+            "database": "postgresql" if not db.use_sqlite else "sqlite",
+            "pool": db.pool_stats(),
+            "replicas": db.replica_stats(),
+            "statements": db.statement_stats(),
+            "startup": dict(app.extensions['startup'], schema=db.schema_status),
+        }
+
+    @app.route('/health/deep')
+    def deep_health_check():
+        """深度健康檢查：實際往返資料庫並回報延遲，資料庫無法使用時返回503"""
+        status = {
+            "database": "postgresql" if not db.use_sqlite else "sqlite",
+            "schema": db.schema_status,
+        }
+        try:
+            status["roundTripMs"] = round(db.ping() * 1000, 3)
+            status["lastChangeSeq"] = db.last_change_seq()
+        except Exception as e:
+            logger.exception("deep health check failed")
+            return dict(status, status="unhealthy", error=str(e)), 503
+        return dict(status, status="healthy", pool=db.pool_stats())
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """初始化資料庫結構（已是最新版本時略過）"""
+        db.ensure_schema()
+        print(f"資料庫結構：{db.schema_status['action']}（{db.schema_status['seconds']} 秒）")
+
+    app.extensions['startup'] = {
+        'createSeconds': round(time.perf_counter() - started, 4),
+    }
+    logger.info("app created in %.4fs", app.extensions['startup']['createSeconds'])
+    return app
+
+app = create_app()
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
-
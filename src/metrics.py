@@ -0,0 +1,292 @@
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# 請求與查詢延遲直方圖的分界（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 每個請求查詢次數的直方圖分界
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+INF_LABEL = 'le="+Inf"'
+
+# 依SQL第一個關鍵字分類查詢
+QUERY_OPERATIONS = ('select', 'insert', 'update', 'delete')
+
+# 連接池的指標：(名稱, 類型, 說明, pool_stats()中的欄位)；只輸出目前後端有提供的欄位
+POOL_METRICS = (
+    ('db_pool_connections_created_total', 'counter', 'Database connections opened.', 'connections_created'),
+    ('db_pool_connections_closed_total', 'counter', 'Database connections closed.', 'connections_closed'),
+    ('db_pool_connections_recycled_total', 'counter',
+     'Connections closed for exceeding DB_POOL_MAX_LIFETIME.', 'connections_recycled'),
+    ('db_pool_health_check_failures_total', 'counter',
+     'Idle connections discarded after a failed health check.', 'health_check_failures'),
+    ('db_pool_acquired_total', 'counter', 'Connections handed out by the pool.', 'acquired'),
+    ('db_pool_waits_total', 'counter', 'Acquisitions that waited for a free connection.', 'waits'),
+    ('db_pool_timeouts_total', 'counter', 'Acquisitions that timed out waiting for a connection.', 'timeouts'),
+    ('db_pool_size', 'gauge', 'Connections currently held by the pool.', 'size'),
+    ('db_pool_idle', 'gauge', 'Idle connections in the pool.', 'idle'),
+    ('db_pool_in_use', 'gauge', 'Connections currently checked out.', 'in_use'),
+    ('db_pool_min_size', 'gauge', 'Configured minimum pool size.', 'min_size'),
+    ('db_pool_max_size', 'gauge', 'Configured maximum pool size.', 'max_size'),
+    ('db_pool_open', 'gauge', 'Open per-thread SQLite connections.', 'open'),
+    ('db_pool_busy_timeout_ms', 'gauge', 'Configured SQLite busy timeout in milliseconds.', 'busy_timeout_ms'),
+)
+
+# 語句快取查詢結果在標籤中的名稱
+STATEMENT_CACHE_RESULTS = {'hits': 'hit', 'misses': 'miss'}
+
+# 讀取副本的指標：(名稱, 類型, 說明, ReplicaSet.stats()中的欄位)
+REPLICA_METRICS = (
+    ('db_replica_healthy', 'gauge', 'Whether the read replica is currently used (1) or skipped (0).', 'healthy'),
+    ('db_replica_reads_total', 'counter', 'Read connections taken from each replica.', 'reads'),
+    ('db_replica_failures_total', 'counter', 'Times a replica was marked unavailable.', 'failures'),
+)
+
+# 慢查詢紀錄中SQL的最大長度
+MAX_LOGGED_SQL = 500
+
+
+def _env_float(name, default):
+    """讀取浮點數型環境變數"""
+    value = os.getenv(name)
+    return float(value) if value not in (None, '') else default
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """依標籤分組的累積直方圖（Prometheus格式）"""
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, values, amount):
+        with self._lock:
+            series = self._series.get(values)
+            if series is None:
+                series = self._series[values] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for index, bound in enumerate(self.buckets):
+                if amount <= bound:
+                    counts[index] += 1
+                    break
+            series[1] += amount
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((values, list(counts), total, count)
+                            for values, (counts, total, count) in self._series.items())
+        for values, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_number(bound)}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labels, values, le)} {cumulative}')
+            lines.append(f'{self.name}_bucket{_labels(self.labels, values, INF_LABEL)} {count}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, values)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labels, values)} {count}')
+        return lines
+
+
+class Counter:
+    """依標籤分組的累計計數"""
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, values, amount=1):
+        with self._lock:
+            self._values[values] = self._values.get(values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            lines.append(f'{self.name}{_labels(self.labels, label_values)} {_number(value)}')
+        return lines
+
+
+class Metrics:
+    """請求與資料庫查詢的效能指標
+
+    資料庫層的游標在每個語句結束時呼叫observe_query；Flask請求由init_app註冊的
+    中介層計時，並統計每個請求執行的查詢次數以找出N+1查詢。指標保存在行程內，
+    多worker部署時每個worker各自回報。
+    """
+
+    def __init__(self):
+        # 超過此時間（毫秒）的查詢記錄為慢查詢
+        self.slow_query_ms = _env_float('DB_SLOW_QUERY_MS', 200.0)
+        # 單一請求的查詢次數超過此值時記錄警告
+        self.request_query_warn = int(_env_float('DB_REQUEST_QUERY_WARN', 25))
+        self.started_at = time.time()
+        # 目前請求的統計；WSGI的每個執行緒與ASGI的每個請求各有一份，
+        # 非同步請求交給執行緒池的查詢也透過複製的context計入同一份統計
+        self._request = contextvars.ContextVar('metrics_request', default=None)
+
+        self.request_duration = Histogram(
+            'http_request_duration_seconds', 'HTTP request latency until the response is ready.',
+            ('method', 'endpoint', 'status'), LATENCY_BUCKETS)
+        self.request_queries = Histogram(
+            'http_request_db_queries', 'Database queries executed per HTTP request.',
+            ('endpoint',), QUERY_COUNT_BUCKETS)
+        self.query_duration = Histogram(
+            'db_query_duration_seconds', 'Database statement latency including fetching the rows.',
+            ('operation',), LATENCY_BUCKETS)
+        self.query_rows = Counter(
+            'db_query_rows_total', 'Rows returned or affected by database statements.', ('operation',))
+        self.slow_queries = Counter(
+            'db_slow_queries_total', 'Statements slower than DB_SLOW_QUERY_MS.', ('operation',))
+
+    def begin_request(self, method, path):
+        """開始統計目前執行緒（或非同步請求）上的請求"""
+        self._request.set({'method': method, 'path': path, 'queries': 0, 'query_seconds': 0.0})
+
+    def end_request(self, method, endpoint, status, seconds):
+        """記錄請求的延遲與查詢次數，返回 (查詢次數, 查詢總秒數)"""
+        current = self._request.get()
+        self._request.set(None)
+        self.request_duration.observe((method, endpoint, str(status)), seconds)
+        if current is None:
+            return 0, 0.0
+        self.request_queries.observe((endpoint,), current['queries'])
+        if current['queries'] > self.request_query_warn:
+            logger.warning("%s %s ran %d queries (%.1f ms in the database)", method, current['path'],
+                           current['queries'], current['query_seconds'] * 1000)
+        return current['queries'], current['query_seconds']
+
+    def observe_query(self, sql, seconds, rows, operation=None):
+        """記錄一個語句的執行時間與返回或影響的筆數"""
+        operation = operation or self.operation(str(sql))
+        self.query_duration.observe((operation,), seconds)
+        if rows:
+            self.query_rows.inc((operation,), rows)
+
+        current = self._request.get()
+        if current is not None:
+            current['queries'] += 1
+            current['query_seconds'] += seconds
+
+        if seconds * 1000 >= self.slow_query_ms:
+            self.slow_queries.inc((operation,))
+            text = ' '.join(str(sql).split())
+            if len(text) > MAX_LOGGED_SQL:
+                text = text[:MAX_LOGGED_SQL] + '...'
+            where = f" during {current['method']} {current['path']}" if current is not None else ''
+            logger.warning("slow query (%.1f ms, %d rows)%s: %s", seconds * 1000, rows, where, text)
+
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def operation(sql):
+        """SQL的操作類別：select/insert/update/delete/other"""
+        match = re.match(r'\s*(\w+)', str(sql))
+        keyword = match.group(1).lower() if match else ''
+        if keyword == 'with':
+            # 帶CTE的語句有寫入時歸類為該寫入，否則為查詢
+            write = re.search(r'\b(insert|update|delete)\b', str(sql), re.IGNORECASE)
+            return write.group(1).lower() if write else 'select'
+        return keyword if keyword in QUERY_OPERATIONS else 'other'
+
+    def render(self):
+        """Prometheus文字格式的所有指標"""
+        from .database import db
+        lines = [
+            '# HELP process_start_time_seconds Start time of the process since unix epoch in seconds.',
+            '# TYPE process_start_time_seconds gauge',
+            f'process_start_time_seconds {self.started_at}',
+        ]
+        for metric in (self.request_duration, self.request_queries, self.query_duration,
+                       self.query_rows, self.slow_queries):
+            lines.extend(metric.render())
+
+        pool = db.pool_stats()
+        backend = _labels(("backend",), (pool['backend'],))
+        for name, kind, help, key in POOL_METRICS:
+            if key not in pool:
+                continue
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.append(f'{name}{backend} {_number(pool[key])}')
+
+        replicas = db.replica_stats()
+        if replicas is not None:
+            for name, kind, help, key in REPLICA_METRICS:
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {kind}')
+                for index, replica in enumerate(replicas['replicas']):
+                    lines.append(f'{name}{_labels(("replica",), (index,))} {int(replica[key])}')
+            lines.append('# HELP db_replica_primary_fallbacks_total Reads sent to the primary because no replica was available.')
+            lines.append('# TYPE db_replica_primary_fallbacks_total counter')
+            lines.append(f'db_replica_primary_fallbacks_total {replicas["primary_fallbacks"]}')
+
+        lines.append('# HELP db_statement_cache_total Prepared statement cache lookups per statement.')
+        lines.append('# TYPE db_statement_cache_total counter')
+        for name, counters in sorted(db.statement_stats().items()):
+            for key, result in STATEMENT_CACHE_RESULTS.items():
+                lines.append(f'db_statement_cache_total'
+                             f'{_labels(("statement", "result"), (name, result))} {counters[key]}')
+        return '\n'.join(lines) + '\n'
+
+    def init_app(self, app):
+        """註冊請求計時中介層與 /metrics 端點"""
+        from flask import g, request
+
+        @app.before_request
+        def start_timer():
+            g.request_started = time.perf_counter()
+            self.begin_request(request.method, request.path)
+
+        @app.after_request
+        def record_request(response):
+            started = g.pop('request_started', None)
+            if started is None:
+                return response
+            seconds = time.perf_counter() - started
+            endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            queries, query_seconds = self.end_request(request.method, endpoint, response.status_code, seconds)
+            # 串流回應只計算到開始送出為止
+            response.headers.add('Server-Timing', f'db;dur={query_seconds * 1000:.2f};desc="{queries} queries"')
+            response.headers.add('Server-Timing', f'app;dur={seconds * 1000:.2f}')
+            return response
+
+        @app.route('/metrics')
+        def metrics():
+            """Prometheus格式的效能指標"""
+            return app.response_class(self.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# 全域效能指標實例
+metrics = Metrics()
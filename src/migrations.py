@@ -0,0 +1,556 @@
+import logging
+import time
+from contextlib import contextmanager
+from functools import partial
+from .database import db, TASK_DATE_RANGE, ROLLUP_DIMENSIONS, CHANGE_SEQUENCE
+from .models.event import DEFAULT_EVENT_ID, partition_name
+from .search import task_search
+
+logger = logging.getLogger(__name__)
+
+# 多個行程同時執行遷移時，PostgreSQL以此advisory lock排隊
+MIGRATION_LOCK_KEY = 74613001
+
+# tasks資料表的索引：(名稱, 定義)
+TASK_INDEXES = (
+    ('idx_tasks_start_date_id', 'tasks (start_date, id)'),
+    ('idx_tasks_end_date_id', 'tasks (end_date, id)'),
+    ('idx_tasks_stage_start_date', 'tasks (stage, start_date, id)'),
+    ('idx_tasks_responsible_start_date', 'tasks (responsible, start_date, id)'),
+    ('idx_tasks_completed_start_date', 'tasks (completed, start_date, id)'),
+    # 匯入時比對自然鍵（階段＋里程碑）
+    ('idx_tasks_stage_milestone', 'tasks (stage, milestone)'),
+    # 增量同步依變更序號查詢
+    ('idx_tasks_change_seq', 'tasks (change_seq)'),
+    # 日期區間重疊查詢（SQLite可只靠索引判斷結束日）
+    ('idx_tasks_start_end', 'tasks (start_date, end_date, id)'),
+)
+
+# 依活動分開儲存後SQLite的tasks索引：以event_id開頭，活動內的查詢只讀取該活動的索引範圍。
+# PostgreSQL的索引建立在分割表上，每個分割區只有一個活動，沿用TASK_INDEXES的欄位。
+# 全域的變更序號索引保留給跨活動的變更通知使用。
+EVENT_TASK_INDEXES = tuple(
+    (name, definition.replace('tasks (', 'tasks (event_id, ', 1))
+    for name, definition in TASK_INDEXES if name != 'idx_tasks_change_seq'
+) + (('idx_tasks_event_change_seq', 'tasks (event_id, change_seq)'),)
+
+# 分割前tasks資料表的欄位，搬移資料時使用
+UNPARTITIONED_TASK_COLUMNS = ('id', 'stage', 'milestone', 'start_date', 'end_date', 'content',
+                              'holiday_impact', 'dependencies', 'responsible', 'risks', 'completed',
+                              'change_seq', 'created_at', 'updated_at', 'version')
+
+# 影響彙總結果的欄位，只有這些欄位更新時才觸發彙總表更新
+ROLLUP_COLUMNS = ('stage', 'responsible', 'start_date', 'completed')
+
+
+class Migration:
+    """一個結構遷移
+
+    sqlite與postgresql為依序執行的步驟：SQL字串，或接受cursor的函式。
+    transactional為False時，步驟在自動提交的獨立連接上執行（CREATE INDEX CONCURRENTLY
+    與分批回填需要），中途失敗不會回滾，因此步驟必須可以安全地重新執行。
+    """
+
+    def __init__(self, version, name, sqlite=(), postgresql=(), transactional=True):
+        self.version = version
+        self.name = name
+        self.sqlite = tuple(sqlite)
+        self.postgresql = tuple(postgresql)
+        self.transactional = transactional
+
+    def steps(self):
+        """目前資料庫要執行的步驟"""
+        return self.sqlite if db.use_sqlite else self.postgresql
+
+    def __repr__(self):
+        return f"<Migration {self.version:04d} {self.name}>"
+
+
+def create_index(name, definition, unique=False):
+    """建立索引的步驟
+
+    PostgreSQL在非交易遷移中以 CREATE INDEX CONCURRENTLY 建立，建立期間不阻擋寫入；
+    先前建立失敗而留下的無效（INVALID）索引會先刪除再重建。
+    """
+    kind = 'UNIQUE INDEX' if unique else 'INDEX'
+
+    def step(cursor):
+        if db.use_sqlite or not cursor.connection.autocommit:
+            cursor.execute(f'CREATE {kind} IF NOT EXISTS {name} ON {definition}')
+            return
+        cursor.execute('''
+            SELECT NOT i.indisvalid AS invalid
+            FROM pg_index AS i JOIN pg_class AS c ON c.oid = i.indexrelid
+            WHERE c.relname = %s
+        ''', (name,))
+        row = cursor.fetchone()
+        if row is not None and row['invalid']:
+            cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+        cursor.execute(f'CREATE {kind} CONCURRENTLY IF NOT EXISTS {name} ON {definition}')
+
+    return step
+
+
+def backfill(table, assignments, condition='1 = 1', params=(), batch_size=1000):
+    """分批更新大型資料表，返回更新的筆數
+
+    依主鍵id由小到大，每批最多batch_size筆，各自在短交易中提交，不會長時間
+    鎖住整個資料表。condition中的參數放在params；條件應排除已更新的資料列，
+    中斷後重新執行時才會從未完成的部分繼續。只能在非交易遷移中使用。
+    """
+    p = db.placeholder
+    last_id = None
+    total = 0
+    while True:
+        with db.transaction() as conn:
+            cursor = conn.cursor()
+            lower = f"id > {p} AND " if last_id is not None else ''
+            lower_params = (last_id,) if last_id is not None else ()
+            cursor.execute(f"SELECT id FROM {table} WHERE {lower}({condition}) ORDER BY id LIMIT {p}",
+                           lower_params + tuple(params) + (batch_size,))
+            ids = [row['id'] for row in cursor.fetchall()]
+            if not ids:
+                return total
+            cursor.execute(f"UPDATE {table} SET {assignments} WHERE id >= {p} AND id <= {p} AND ({condition})",
+                           (ids[0], ids[-1]) + tuple(params))
+            total += cursor.rowcount
+        last_id = ids[-1]
+        logger.info("backfill %s: %d rows updated (id <= %s)", table, total, last_id)
+
+
+def _add_sqlite_task_columns(cursor):
+    """舊版tasks資料表缺少的欄位"""
+    columns = [row['name'] for row in cursor.execute('PRAGMA table_info(tasks)')]
+    if 'completed' not in columns:
+        cursor.execute('ALTER TABLE tasks ADD COLUMN completed BOOLEAN DEFAULT FALSE')
+    if 'change_seq' not in columns:
+        cursor.execute('ALTER TABLE tasks ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 0')
+
+
+def rollup_delta(row, sign, by_event=False):
+    """觸發器中將一筆任務計入（sign=1）或移出（sign=-1）彙總表的語句；by_event時依活動分開彙總"""
+    completed = f"CASE WHEN {row}.completed THEN {sign} ELSE 0 END"
+    event_column = 'event_id, ' if by_event else ''
+    event_value = f'{row}.event_id, ' if by_event else ''
+    statements = [
+        f"""INSERT INTO task_rollups ({event_column}dimension, group_key, total, completed)
+            VALUES ({event_value}'{dimension}', {db.rollup_group(dimension, row)}, {sign}, {completed})
+            ON CONFLICT ({event_column}dimension, group_key) DO UPDATE
+            SET total = task_rollups.total + excluded.total,
+                completed = task_rollups.completed + excluded.completed;"""
+        for dimension in ROLLUP_DIMENSIONS
+    ]
+    if sign < 0:
+        scope = f"event_id = {row}.event_id AND " if by_event else ''
+        statements.append(f"DELETE FROM task_rollups WHERE {scope}total <= 0;")
+    return statements
+
+
+def _create_rollups(cursor, by_event=False):
+    """各維度的任務數與完成數，由觸發器在每次寫入的同一交易中更新；by_event時依活動分開彙總"""
+    if db.use_sqlite:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'task_rollups'")
+        rollups_exist = cursor.fetchone() is not None
+    else:
+        cursor.execute("SELECT to_regclass('task_rollups') IS NOT NULL AS present")
+        rollups_exist = cursor.fetchone()['present']
+    event_column = 'event_id INTEGER NOT NULL,' if by_event else ''
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS task_rollups (
+            {event_column}
+            dimension {'TEXT' if db.use_sqlite else 'VARCHAR(32)'} NOT NULL,
+            group_key TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY ({'event_id, ' if by_event else ''}dimension, group_key)
+        )
+    ''')
+
+    if db.use_sqlite:
+        # 封存活動的任務在刪除活動時整批移除，不逐筆更新彙總表（彙總列隨後一併刪除）
+        active = " WHEN (SELECT status FROM events WHERE id = OLD.event_id) = 'active'" if by_event else ''
+        triggers = {
+            'trg_tasks_rollups_insert': ('AFTER INSERT', rollup_delta('NEW', 1, by_event)),
+            'trg_tasks_rollups_delete': ('AFTER DELETE', rollup_delta('OLD', -1, by_event)),
+            'trg_tasks_rollups_update': (f"AFTER UPDATE OF {', '.join(ROLLUP_COLUMNS)}",
+                                         rollup_delta('OLD', -1, by_event) + rollup_delta('NEW', 1, by_event)),
+        }
+        for name, (event, statements) in triggers.items():
+            condition = active if name == 'trg_tasks_rollups_delete' else ''
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            cursor.execute(f"CREATE TRIGGER {name} {event} ON tasks{condition} BEGIN {' '.join(statements)} END")
+    else:
+        cursor.execute(f'''
+            CREATE OR REPLACE FUNCTION task_rollups_apply() RETURNS trigger
+            LANGUAGE plpgsql AS $$
+            BEGIN
+                IF TG_OP <> 'INSERT' THEN
+                    {' '.join(rollup_delta('OLD', -1, by_event))}
+                END IF;
+                IF TG_OP <> 'DELETE' THEN
+                    {' '.join(rollup_delta('NEW', 1, by_event))}
+                END IF;
+                RETURN NULL;
+            END
+            $$
+        ''')
+        cursor.execute('DROP TRIGGER IF EXISTS trg_tasks_rollups ON tasks')
+        cursor.execute(f'''
+            CREATE TRIGGER trg_tasks_rollups
+            AFTER INSERT OR DELETE OR UPDATE OF {', '.join(ROLLUP_COLUMNS)} ON tasks
+            FOR EACH ROW EXECUTE PROCEDURE task_rollups_apply()
+        ''')
+
+    if not rollups_exist:
+        db.rebuild_rollups(cursor, by_event=by_event)
+
+
+def _scope_sqlite_task_indexes(cursor):
+    """以event_id開頭的索引取代原本的tasks索引"""
+    for name, _ in TASK_INDEXES:
+        if name != 'idx_tasks_change_seq':
+            cursor.execute(f'DROP INDEX IF EXISTS {name}')
+    for name, definition in EVENT_TASK_INDEXES:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {definition}')
+
+
+def _partition_tasks(cursor):
+    """將tasks改為依event_id做LIST分割的資料表，既有任務搬入預設活動的分割區
+
+    分割表的主鍵必須包含分割鍵，因此改為 (event_id, id)；id仍由原本的序列產生，
+    在所有活動之間唯一。搬移期間tasks被鎖定，只在升級時執行一次。
+    """
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = 'tasks'::regclass")
+    if cursor.fetchone()['relkind'] == 'p':
+        return
+    cursor.execute("SELECT pg_get_serial_sequence('tasks', 'id') AS sequence")
+    sequence = cursor.fetchone()['sequence']
+    # 序列改由新資料表擁有，刪除舊資料表時才不會一併刪除
+    cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY NONE')
+    cursor.execute('ALTER TABLE tasks RENAME TO tasks_unpartitioned')
+    cursor.execute(f'''
+        CREATE TABLE tasks (
+            id INTEGER NOT NULL DEFAULT nextval('{sequence}'),
+            stage VARCHAR(255) NOT NULL,
+            milestone VARCHAR(255) NOT NULL,
+            start_date DATE NOT NULL,
+            end_date DATE NOT NULL,
+            content TEXT,
+            holiday_impact TEXT,
+            dependencies TEXT,
+            responsible TEXT,
+            risks TEXT,
+            completed BOOLEAN DEFAULT FALSE,
+            change_seq BIGINT NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            version INTEGER NOT NULL DEFAULT 1,
+            event_id INTEGER NOT NULL REFERENCES events (id),
+            -- 舊資料表的主鍵索引仍佔用tasks_pkey這個名稱
+            CONSTRAINT tasks_event_pkey PRIMARY KEY (event_id, id)
+        ) PARTITION BY LIST (event_id)
+    ''')
+    cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY tasks.id')
+    cursor.execute(f'CREATE TABLE {partition_name(DEFAULT_EVENT_ID)} '
+                   f'PARTITION OF tasks FOR VALUES IN ({DEFAULT_EVENT_ID})')
+    columns = ', '.join(UNPARTITIONED_TASK_COLUMNS)
+    cursor.execute(f'INSERT INTO tasks ({columns}, event_id) '
+                   f'SELECT {columns}, {DEFAULT_EVENT_ID} FROM tasks_unpartitioned')
+    # 一併移除舊資料表的索引、觸發器與task_search的外鍵（分割表的id本身不唯一，無法被外鍵參照）
+    cursor.execute('DROP TABLE tasks_unpartitioned CASCADE')
+    for name, definition in TASK_INDEXES:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {definition}')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_tasks_date_range ON tasks USING gist (({TASK_DATE_RANGE}))')
+
+
+# 依版本排序的遷移；已發布的遷移不可修改，結構變更請新增版本
+MIGRATIONS = (
+    Migration(1, 'create_tasks', sqlite=(
+        '''
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            stage TEXT NOT NULL,
+            milestone TEXT NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            content TEXT,
+            holiday_impact TEXT,
+            dependencies TEXT,
+            responsible TEXT,
+            risks TEXT,
+            completed BOOLEAN DEFAULT FALSE,
+            change_seq INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        _add_sqlite_task_columns,
+        # 資料表版本號，每次寫入遞增，供快取判斷資料是否變更
+        '''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        "INSERT OR IGNORE INTO table_versions (name, version) VALUES ('tasks', 0)",
+        # 改用schema_migrations之前記錄結構版本的資料列
+        "DELETE FROM table_versions WHERE name = 'schema'",
+        # 已刪除任務的紀錄，供增量同步通知客戶端
+        '''
+        CREATE TABLE IF NOT EXISTS task_tombstones (
+            id INTEGER PRIMARY KEY,
+            change_seq INTEGER NOT NULL,
+            deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_task_tombstones_change_seq ON task_tombstones (change_seq)',
+    ), postgresql=(
+        '''
+        CREATE TABLE IF NOT EXISTS tasks (
+            id SERIAL PRIMARY KEY,
+            stage VARCHAR(255) NOT NULL,
+            milestone VARCHAR(255) NOT NULL,
+            start_date DATE NOT NULL,
+            end_date DATE NOT NULL,
+            content TEXT,
+            holiday_impact TEXT,
+            dependencies TEXT,
+            responsible TEXT,
+            risks TEXT,
+            completed BOOLEAN DEFAULT FALSE,
+            change_seq BIGINT NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        'ALTER TABLE tasks ADD COLUMN IF NOT EXISTS completed BOOLEAN DEFAULT FALSE',
+        'ALTER TABLE tasks ADD COLUMN IF NOT EXISTS change_seq BIGINT NOT NULL DEFAULT 0',
+        '''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name VARCHAR(64) PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0
+        )
+        ''',
+        "INSERT INTO table_versions (name, version) VALUES ('tasks', 0) ON CONFLICT (name) DO NOTHING",
+        # 改用schema_migrations之前記錄結構版本的資料列
+        "DELETE FROM table_versions WHERE name = 'schema'",
+        '''
+        CREATE TABLE IF NOT EXISTS task_tombstones (
+            id INTEGER PRIMARY KEY,
+            change_seq BIGINT NOT NULL,
+            deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_task_tombstones_change_seq ON task_tombstones (change_seq)',
+    )),
+    Migration(2, 'task_indexes', transactional=False,
+              sqlite=tuple(create_index(name, definition) for name, definition in TASK_INDEXES),
+              postgresql=tuple(create_index(name, definition) for name, definition in TASK_INDEXES) + (
+                  # 日期區間重疊查詢使用GiST索引
+                  create_index('idx_tasks_date_range', f'tasks USING gist (({TASK_DATE_RANGE}))'),
+              )),
+    Migration(3, 'task_rollups', sqlite=(_create_rollups,), postgresql=(_create_rollups,)),
+    Migration(4, 'task_search', sqlite=(task_search.create_schema,), postgresql=(task_search.create_schema,)),
+    # 每列的版本號，條件式更新與刪除以此偵測並行寫入的衝突
+    Migration(5, 'task_row_versions', sqlite=(
+        'ALTER TABLE tasks ADD COLUMN version INTEGER NOT NULL DEFAULT 1',
+    ), postgresql=(
+        'ALTER TABLE tasks ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1',
+    )),
+    # 活動：任務依活動分開儲存，活動內的查詢不受其他活動的資料量影響
+    Migration(6, 'events', sqlite=(
+        '''
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            start_date TEXT,
+            end_date TEXT,
+            status TEXT NOT NULL DEFAULT 'active',
+            version INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            archived_at TIMESTAMP
+        )
+        ''',
+        f'''
+        INSERT OR IGNORE INTO events (id, name, start_date, end_date, version)
+        SELECT {DEFAULT_EVENT_ID}, 'Wonder Charge', MIN(NULLIF(start_date, '')), MAX(NULLIF(end_date, '')),
+               COALESCE((SELECT version FROM table_versions WHERE name = 'tasks'), 0)
+        FROM tasks
+        ''',
+        f'ALTER TABLE tasks ADD COLUMN event_id INTEGER NOT NULL DEFAULT {DEFAULT_EVENT_ID}',
+        f'ALTER TABLE task_tombstones ADD COLUMN event_id INTEGER NOT NULL DEFAULT {DEFAULT_EVENT_ID}',
+        'CREATE INDEX IF NOT EXISTS idx_task_tombstones_event_change_seq ON task_tombstones (event_id, change_seq)',
+        _scope_sqlite_task_indexes,
+        'DROP TABLE IF EXISTS task_rollups',
+        partial(_create_rollups, by_event=True),
+    ), postgresql=(
+        '''
+        CREATE TABLE IF NOT EXISTS events (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            start_date DATE,
+            end_date DATE,
+            status VARCHAR(16) NOT NULL DEFAULT 'active',
+            version BIGINT NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            archived_at TIMESTAMP
+        )
+        ''',
+        f'''
+        INSERT INTO events (id, name, start_date, end_date, version)
+        SELECT {DEFAULT_EVENT_ID}, 'Wonder Charge', MIN(start_date), MAX(end_date),
+               COALESCE((SELECT version FROM table_versions WHERE name = 'tasks'), 0)
+        FROM tasks
+        ON CONFLICT (id) DO NOTHING
+        ''',
+        "SELECT setval(pg_get_serial_sequence('events', 'id'), (SELECT MAX(id) FROM events))",
+        _partition_tasks,
+        f'ALTER TABLE task_tombstones ADD COLUMN IF NOT EXISTS event_id INTEGER NOT NULL DEFAULT {DEFAULT_EVENT_ID}',
+        'CREATE INDEX IF NOT EXISTS idx_task_tombstones_event_change_seq ON task_tombstones (event_id, change_seq)',
+        'DROP TABLE IF EXISTS task_rollups',
+        partial(_create_rollups, by_event=True),
+    )),
+    # 變更序號改由序列分配：寫入只鎖定所屬活動的列，不同活動的寫入不再排隊等待同一列。
+    # SQLite同一時間只有一個寫入交易，沿用table_versions的計數
+    Migration(7, 'task_change_sequence', postgresql=(
+        f'CREATE SEQUENCE IF NOT EXISTS {CHANGE_SEQUENCE} AS BIGINT',
+        f'''
+        SELECT setval('{CHANGE_SEQUENCE}', GREATEST(latest, 1), latest > 0)
+        FROM (SELECT GREATEST(COALESCE((SELECT version FROM table_versions WHERE name = 'tasks'), 0),
+                              COALESCE((SELECT MAX(version) FROM events), 0)) AS latest) AS current
+        ''',
+    )),
+)
+
+
+class Migrator:
+    """依序套用遷移並記錄在schema_migrations資料表
+
+    每個交易式遷移與其紀錄在同一個交易中提交。PostgreSQL以advisory lock
+    讓同時啟動的行程依序執行；SQLite以 BEGIN IMMEDIATE 取得寫入鎖，
+    取得鎖後會重新確認遷移是否已被其他行程套用。
+    """
+
+    def __init__(self, migrations):
+        versions = [migration.version for migration in migrations]
+        if versions != sorted(set(versions)):
+            raise ValueError("Migration versions must be unique and ascending")
+        self.migrations = tuple(migrations)
+
+    @property
+    def latest(self):
+        return self.migrations[-1].version
+
+    def _table_exists(self, cursor):
+        if db.use_sqlite:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_migrations'")
+            return cursor.fetchone() is not None
+        cursor.execute("SELECT to_regclass('schema_migrations') IS NOT NULL AS present")
+        return cursor.fetchone()['present']
+
+    def applied(self):
+        """已套用的遷移紀錄 {版本: 資料列}"""
+        with db.transaction() as conn:
+            cursor = conn.cursor()
+            if not self._table_exists(cursor):
+                return {}
+            return self._applied(cursor)
+
+    @staticmethod
+    def _applied(cursor):
+        cursor.execute('SELECT version, name, applied_at, duration_ms FROM schema_migrations ORDER BY version')
+        return {row['version']: dict(row) for row in cursor.fetchall()}
+
+    def pending(self, target=None):
+        """尚未套用且版本不超過target的遷移"""
+        target = self.latest if target is None else target
+        applied = self.applied()
+        return [migration for migration in self.migrations
+                if migration.version <= target and migration.version not in applied]
+
+    def migrate(self, target=None):
+        """套用所有待執行的遷移，返回本次套用的遷移；已是最新版本時只執行查詢"""
+        if not self.pending(target):
+            return []
+        with self._lock():
+            with db.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version INTEGER PRIMARY KEY,
+                        name VARCHAR(255) NOT NULL,
+                        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        duration_ms INTEGER
+                    )
+                ''')
+            return [migration for migration in self.pending(target) if self.apply(migration)]
+
+    @contextmanager
+    def _lock(self):
+        """PostgreSQL上以專用連接持有session層級的advisory lock"""
+        if db.use_sqlite:
+            yield
+            return
+        conn = self._autocommit_connection()
+        try:
+            conn.cursor().execute('SELECT pg_advisory_lock(%s)', (MIGRATION_LOCK_KEY,))
+            yield
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _autocommit_connection():
+        conn = db.get_connection()
+        if db.use_sqlite:
+            conn.isolation_level = None
+        else:
+            conn.autocommit = True
+        return conn
+
+    def apply(self, migration):
+        """套用一個遷移；已被其他行程套用時返回False"""
+        started = time.perf_counter()
+        if migration.transactional:
+            with db.transaction() as conn:
+                cursor = conn.cursor()
+                if db.use_sqlite and not conn.in_transaction:
+                    cursor.execute('BEGIN IMMEDIATE')
+                if migration.version in self._applied(cursor):
+                    return False
+                self.run(migration, cursor)
+                self._record(cursor, migration, started)
+        else:
+            conn = self._autocommit_connection()
+            try:
+                self.run(migration, conn.cursor())
+            finally:
+                conn.close()
+            with db.transaction() as conn:
+                if not self._record(conn.cursor(), migration, started):
+                    return False
+        logger.info("applied migration %04d %s in %.3fs", migration.version, migration.name,
+                    time.perf_counter() - started)
+        return True
+
+    @staticmethod
+    def run(migration, cursor):
+        """執行遷移的步驟（不記錄）"""
+        for step in migration.steps():
+            if callable(step):
+                step(cursor)
+            else:
+                cursor.execute(step)
+
+    @staticmethod
+    def _record(cursor, migration, started):
+        """記錄已套用的遷移；其他行程已記錄時返回False"""
+        p = db.placeholder
+        cursor.execute(
+            f"INSERT INTO schema_migrations (version, name, duration_ms) VALUES ({p}, {p}, {p}) "
+            "ON CONFLICT (version) DO NOTHING",
+            (migration.version, migration.name, int((time.perf_counter() - started) * 1000)))
+        return cursor.rowcount > 0
+
+
+# 全域遷移執行器
+migrator = Migrator(MIGRATIONS)
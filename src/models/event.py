@@ -0,0 +1,280 @@
+from datetime import date
+from ..database import db, Statement, CHANGE_SEQUENCE
+from ..rows import ColumnGetter, RowMapper, isoformat
+
+# 分割前的既有任務全部歸入此活動；未指定活動的舊版路由預設也使用此活動
+DEFAULT_EVENT_ID = 1
+
+# 活動狀態：active可讀寫；archived為封存，任務不再提供讀寫，可還原或刪除
+EVENT_STATUSES = ('active', 'archived')
+
+# events資料表欄位，順序與Event建構參數一致
+EVENT_COLUMNS = ('id', 'name', 'start_date', 'end_date', 'status', 'version',
+                 'created_at', 'archived_at')
+
+event_row_values = ColumnGetter(EVENT_COLUMNS)
+
+
+def _date_text(value):
+    """日期轉為YYYY-MM-DD字串，其他值原樣返回"""
+    return value.isoformat() if isinstance(value, date) else value
+
+
+# 資料表欄位轉換為前端格式
+event_to_wire = RowMapper((
+    ('id', 'id'),
+    ('name', 'name'),
+    ('start_date', 'startDate'),
+    ('end_date', 'endDate'),
+    ('status', 'status'),
+    ('version', 'version'),
+    ('created_at', 'created_at'),
+    ('archived_at', 'archived_at'),
+), converters={'start_date': _date_text, 'end_date': _date_text,
+               'created_at': isoformat, 'archived_at': isoformat})
+
+SELECT_EVENT = Statement('event_select', "SELECT * FROM events WHERE id = ?")
+
+SELECT_EVENT_VERSION = Statement('event_version_select', "SELECT version FROM events WHERE id = ?")
+
+# 在寫入任務的交易中記錄活動最後一次變更的序號；只有進行中的活動可以寫入
+TOUCH_EVENT = Statement('event_touch', "UPDATE events SET version = ? WHERE id = ? AND status = 'active'")
+
+# PostgreSQL：先鎖定活動的列，再由序列取號並記錄為活動的版本號
+LOCK_EVENT = Statement('event_lock', "SELECT status FROM events WHERE id = ? FOR UPDATE")
+ADVANCE_EVENT = Statement('event_advance',
+                          f"UPDATE events SET version = nextval('{CHANGE_SEQUENCE}') WHERE id = ? RETURNING version")
+
+# 各活動的任務數與完成數，取自觸發器維護的彙總表
+SELECT_EVENT_TOTALS = Statement('event_totals_select', '''
+    SELECT event_id, total, completed FROM task_rollups WHERE dimension = 'all'
+''')
+
+
+def partition_name(event_id):
+    """PostgreSQL上活動任務所在的分割區名稱"""
+    return f'tasks_event_{int(event_id)}'
+
+
+def _parse_date(value, field):
+    if value is None or value == '':
+        return None
+    try:
+        return date.fromisoformat(str(value)).isoformat()
+    except ValueError:
+        raise ValueError(f"Invalid {field}: {value}")
+
+
+class EventUnavailable(Exception):
+    """活動不存在，或活動目前的狀態不允許此操作；status為活動的狀態（不存在時為None）"""
+
+    def __init__(self, event_id, status=None, message=None):
+        if message is None:
+            message = f"Event {event_id} not found" if status is None else f"Event {event_id} is {status}"
+        super().__init__(message)
+        self.event_id = event_id
+        self.status = status
+
+
+class Event:
+    """一場活動，每個任務屬於一個活動
+
+    任務依event_id分開儲存：PostgreSQL上tasks以event_id做LIST分割，每個活動一個分割區；
+    SQLite上tasks的索引以event_id為第一個欄位。因此活動內的查詢只讀取該活動的資料，
+    延遲不會隨過去活動的累積而增加。結束的活動可以封存（PostgreSQL上分離分割區），
+    之後還原或整個刪除（PostgreSQL上刪除分割區）。
+    """
+
+    __slots__ = EVENT_COLUMNS
+
+    def __init__(self, id=None, name=None, start_date=None, end_date=None, status=None,
+                 version=None, created_at=None, archived_at=None):
+        self.id = id
+        self.name = name
+        self.start_date = start_date
+        self.end_date = end_date
+        self.status = status
+        self.version = version
+        self.created_at = created_at
+        self.archived_at = archived_at
+
+    def to_dict(self):
+        """將Event物件轉換為字典"""
+        return event_to_wire.from_object(self)
+
+    @classmethod
+    def from_row(cls, row):
+        """從資料庫資料列創建Event物件"""
+        return cls(*event_row_values(row))
+
+    @classmethod
+    def get(cls, event_id):
+        """根據ID獲取活動，不存在時返回None"""
+        row = db.fetch_one(SELECT_EVENT, (event_id,))
+        return cls.from_row(row) if row else None
+
+    @classmethod
+    def available(cls, row, event_id):
+        """由SELECT_EVENT的結果取得可讀寫的活動；不存在或已封存時拋出EventUnavailable"""
+        if row is None:
+            raise EventUnavailable(event_id)
+        if row['status'] != 'active':
+            raise EventUnavailable(event_id, row['status'])
+        return cls.from_row(row)
+
+    @classmethod
+    def require(cls, event_id):
+        """取得可讀寫的活動；不存在或已封存時拋出EventUnavailable"""
+        return cls.available(db.fetch_one(SELECT_EVENT, (event_id,)), event_id)
+
+    @classmethod
+    def advance(cls, event_id):
+        """在寫入交易中分配活動的下一個變更序號並記錄為活動的版本號，返回序號
+
+        events的該列在交易結束前保持鎖定：同一活動的寫入依取得鎖的順序提交，PostgreSQL上
+        取得鎖後才由序列（nextval）取號，因此活動內序號的大小順序與提交順序一致；
+        不同活動的寫入不會互相等待。SQLite同一時間只有一個寫入交易，序號沿用table_versions的計數。
+        同時封存活動的交易會等待寫入完成。活動不存在或已封存時拋出EventUnavailable。
+        """
+        with db.transaction():
+            if db.use_sqlite:
+                seq = db.bump_table_version('tasks')
+                if not db.execute(TOUCH_EVENT, (seq, event_id)):
+                    cls.require(event_id)
+                    raise EventUnavailable(event_id)
+                return seq
+            row = db.fetch_one(LOCK_EVENT, (event_id,))
+            if row is None:
+                raise EventUnavailable(event_id)
+            if row['status'] != 'active':
+                raise EventUnavailable(event_id, row['status'])
+            db.record_write()
+            return db.fetch_one(ADVANCE_EVENT, (event_id,))['version']
+
+    @staticmethod
+    def version_of(event_id):
+        """活動最後一次變更的序號，供快取判斷活動的任務是否變更"""
+        row = db.fetch_one(SELECT_EVENT_VERSION, (event_id,))
+        return row['version'] if row else 0
+
+    @classmethod
+    def summaries(cls, status=None):
+        """活動列表（依ID排序），每個活動附帶任務數與完成數"""
+        if status is not None and status not in EVENT_STATUSES:
+            raise ValueError(f"Unsupported status: {status}")
+        query = "SELECT * FROM events"
+        params = ()
+        if status is not None:
+            query += f" WHERE status = {db.placeholder}"
+            params = (status,)
+        events = [cls.from_row(row) for row in db.execute_query(query + " ORDER BY id", params)]
+        totals = {row['event_id']: row for row in db.fetch_all(SELECT_EVENT_TOTALS)}
+        return [event.summary(totals.get(event.id)) for event in events]
+
+    def summary(self, totals=None):
+        """前端格式的活動，附帶任務數與完成數"""
+        if totals is None:
+            totals = db.fetch_one(f"SELECT total, completed FROM task_rollups "
+                                  f"WHERE event_id = {db.placeholder} AND dimension = 'all'", (self.id,))
+        result = self.to_dict()
+        result['total'] = totals['total'] if totals else 0
+        result['completed'] = totals['completed'] if totals else 0
+        return result
+
+    @classmethod
+    def create(cls, name, start_date=None, end_date=None):
+        """新增活動；PostgreSQL上同時建立活動的分割區"""
+        if not isinstance(name, str) or not name.strip():
+            raise ValueError("name is required")
+        start_date = _parse_date(start_date, 'startDate')
+        end_date = _parse_date(end_date, 'endDate')
+        if start_date and end_date and end_date < start_date:
+            raise ValueError("endDate must not be earlier than startDate")
+
+        p = db.placeholder
+        with db.transaction() as conn:
+            cursor = conn.cursor()
+            query = f"INSERT INTO events (name, start_date, end_date) VALUES ({p}, {p}, {p})"
+            if db.use_sqlite:
+                cursor.execute(query, (name.strip(), start_date, end_date))
+                event_id = cursor.lastrowid
+            else:
+                cursor.execute(query + " RETURNING id", (name.strip(), start_date, end_date))
+                event_id = cursor.fetchone()['id']
+                cursor.execute(f"CREATE TABLE {partition_name(event_id)} "
+                               f"PARTITION OF tasks FOR VALUES IN ({int(event_id)})")
+            cursor.execute(f"SELECT * FROM events WHERE id = {p}", (event_id,))
+            return cls.from_row(cursor.fetchone())
+
+    @classmethod
+    def archive(cls, event_id):
+        """封存活動，返回封存後的活動
+
+        PostgreSQL上將活動的分割區從tasks分離（只改變系統目錄，不搬移資料），
+        之後的任務查詢完全不會讀到它；SQLite上只標記狀態，索引以event_id開頭，
+        其他活動的查詢同樣不會讀到。封存活動的任務移出搜尋索引，彙總數字保留。
+        """
+        from ..search import task_search
+
+        p = db.placeholder
+        with db.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"UPDATE events SET status = 'archived', archived_at = CURRENT_TIMESTAMP "
+                           f"WHERE id = {p} AND status = 'active'", (event_id,))
+            if not cursor.rowcount:
+                cls.require(event_id)
+                raise EventUnavailable(event_id)
+            task_search.remove_event(cursor, event_id)
+            if not db.use_sqlite:
+                cursor.execute(f"ALTER TABLE tasks DETACH PARTITION {partition_name(event_id)}")
+            cursor.execute(f"SELECT * FROM events WHERE id = {p}", (event_id,))
+            return cls.from_row(cursor.fetchone())
+
+    @classmethod
+    def restore(cls, event_id):
+        """還原封存的活動，返回還原後的活動；PostgreSQL上重新附加分割區"""
+        from ..search import task_search
+
+        p = db.placeholder
+        with db.transaction() as conn:
+            cursor = conn.cursor()
+            cls._require_archived(cursor, event_id, f"Event {event_id} is not archived")
+            if not db.use_sqlite:
+                cursor.execute(f"ALTER TABLE tasks ATTACH PARTITION {partition_name(event_id)} "
+                               f"FOR VALUES IN ({int(event_id)})")
+            cursor.execute(f"UPDATE events SET status = 'active', archived_at = NULL WHERE id = {p}",
+                           (event_id,))
+            task_search.index_event(cursor, event_id)
+            cursor.execute(f"SELECT * FROM events WHERE id = {p}", (event_id,))
+            return cls.from_row(cursor.fetchone())
+
+    @classmethod
+    def drop(cls, event_id):
+        """刪除封存的活動與其所有任務；進行中的活動必須先封存
+
+        PostgreSQL上直接刪除分割區，成本與任務數無關；SQLite上依 (event_id, ...) 索引
+        刪除該活動的任務，封存活動的刪除不逐筆更新彙總表。
+        """
+        p = db.placeholder
+        with db.transaction() as conn:
+            cursor = conn.cursor()
+            cls._require_archived(cursor, event_id, f"Archive event {event_id} before dropping it")
+            if db.use_sqlite:
+                cursor.execute(f"DELETE FROM tasks WHERE event_id = {p}", (event_id,))
+            else:
+                cursor.execute(f"DROP TABLE IF EXISTS {partition_name(event_id)}")
+            cursor.execute(f"DELETE FROM task_rollups WHERE event_id = {p}", (event_id,))
+            cursor.execute(f"DELETE FROM task_tombstones WHERE event_id = {p}", (event_id,))
+            cursor.execute(f"DELETE FROM events WHERE id = {p}", (event_id,))
+
+    @staticmethod
+    def _require_archived(cursor, event_id, message):
+        """鎖定活動並確認已封存，否則拋出EventUnavailable"""
+        p = db.placeholder
+        lock = '' if db.use_sqlite else ' FOR UPDATE'
+        cursor.execute(f"SELECT status FROM events WHERE id = {p}{lock}", (event_id,))
+        row = cursor.fetchone()
+        if row is None:
+            raise EventUnavailable(event_id)
+        if row['status'] != 'archived':
+            raise EventUnavailable(event_id, row['status'], message)
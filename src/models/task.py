@@ -1,11 +1,249 @@
-from datetime import datetime
-from ..database import db
+import base64
+import json
+from datetime import date
+from ..database import db, Statement
+from ..events import task_events
+from ..search import task_search
+from ..rows import ColumnGetter, RowMapper, isoformat
+from .event import Event
+
+# 可排序的欄位，皆搭配id作為穩定排序的次要鍵
+SORTABLE_COLUMNS = ('start_date', 'end_date', 'id')
+
+# 單頁筆數的預設值與上限
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# 前端欄位名稱對應到資料表欄位
+WIRE_COLUMNS = {
+    'stage': 'stage',
+    'milestone': 'milestone',
+    'startDate': 'start_date',
+    'endDate': 'end_date',
+    'description': 'content',
+    'holidayImpact': 'holiday_impact',
+    'dependencies': 'dependencies',
+    'responsible': 'responsible',
+    'risks': 'risks',
+    'isCompleted': 'completed',
+    'completed': 'completed',
+}
+
+# tasks資料表欄位，順序與Task建構參數一致
+TASK_COLUMNS = ('id', 'stage', 'milestone', 'start_date', 'end_date', 'content',
+                'holiday_impact', 'dependencies', 'responsible', 'risks', 'completed',
+                'created_at', 'updated_at', 'change_seq', 'version', 'event_id')
+
+# 資料列依TASK_COLUMNS順序取值
+task_row_values = ColumnGetter(TASK_COLUMNS)
+
+# 資料表欄位轉換為前端格式
+task_to_wire = RowMapper((
+    ('id', 'id'),
+    ('stage', 'stage'),
+    ('milestone', 'milestone'),
+    ('start_date', 'startDate'),
+    ('end_date', 'endDate'),
+    ('content', 'description'),
+    ('holiday_impact', 'holidayImpact'),
+    ('dependencies', 'dependencies'),
+    ('responsible', 'responsible'),
+    ('risks', 'risks'),
+    ('completed', 'isCompleted'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+    ('change_seq', 'changeSeq'),
+    ('version', 'version'),
+    ('event_id', 'eventId'),
+), converters={'created_at': isoformat, 'updated_at': isoformat})
+
+# 可由API更新的欄位
+UPDATABLE_COLUMNS = ('stage', 'milestone', 'start_date', 'end_date', 'content',
+                     'holiday_impact', 'dependencies', 'responsible', 'risks', 'completed')
+
+# 資料表中不可為空的欄位
+REQUIRED_COLUMNS = ('stage', 'milestone', 'start_date', 'end_date')
+
+# 日期欄位，格式為YYYY-MM-DD
+DATE_COLUMNS = ('start_date', 'end_date')
+
+# 資料表欄位對應的前端欄位名稱，用於錯誤訊息
+COLUMN_WIRE_NAMES = {column: key for key, column in reversed(tuple(WIRE_COLUMNS.items()))}
+
+# 批次操作支援的類型，依此順序套用
+BULK_OPERATIONS = ('create', 'update', 'toggle', 'delete')
+
+# 多列INSERT每個語句的參數上限，取SQLite 3.32以前的999以相容各版本
+MAX_INSERT_PARAMETERS = 999
+
+# 任務語句皆以活動為第一個條件，SQLite使用以event_id開頭的索引，PostgreSQL只掃描活動的分割區
+SELECT_TASK_BY_ID = Statement('task_select_by_id', "SELECT * FROM tasks WHERE event_id = ? AND id = ?")
+
+INSERT_TASK = Statement('task_insert', '''
+    INSERT INTO tasks (stage, milestone, start_date, end_date, content,
+                       holiday_impact, dependencies, responsible, risks, completed,
+                       change_seq, event_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+''')
+
+UPDATE_TASK = Statement('task_update', '''
+    UPDATE tasks
+    SET stage = ?, milestone = ?, start_date = ?, end_date = ?,
+        content = ?, holiday_impact = ?, dependencies = ?,
+        responsible = ?, risks = ?, completed = ?, change_seq = ?,
+        version = version + 1, updated_at = CURRENT_TIMESTAMP
+    WHERE event_id = ? AND id = ?
+''')
+
+TOGGLE_TASK = Statement('task_toggle', '''
+    UPDATE tasks
+    SET completed = NOT COALESCE(completed, FALSE), change_seq = ?,
+        version = version + 1, updated_at = CURRENT_TIMESTAMP
+    WHERE event_id = ? AND id = ?
+''')
+
+TOGGLE_TASK_IF_VERSION = Statement('task_toggle_if_version', '''
+    UPDATE tasks
+    SET completed = NOT COALESCE(completed, FALSE), change_seq = ?,
+        version = version + 1, updated_at = CURRENT_TIMESTAMP
+    WHERE event_id = ? AND id = ? AND version = ?
+''')
+
+DELETE_TASK = Statement('task_delete', "DELETE FROM tasks WHERE event_id = ? AND id = ?")
+
+DELETE_TASK_IF_VERSION = Statement(
+    'task_delete_if_version', "DELETE FROM tasks WHERE event_id = ? AND id = ? AND version = ?")
+
+
+def _change_statement(name, table, columns, limited):
+    """活動的增量同步查詢語句；limited時多一個筆數上限參數"""
+    name += '_event' + ('_limit' if limited else '')
+    return Statement(name, f"SELECT {columns} FROM {table} WHERE event_id = ? AND change_seq > ? AND change_seq <= ? "
+                           f"ORDER BY change_seq, id{' LIMIT ?' if limited else ''}")
+
+
+# 增量同步的語句：是否限制筆數 → (變更的任務, 刪除紀錄)
+CHANGE_STATEMENTS = {
+    limited: (_change_statement('task_select_changed', 'tasks', '*', limited),
+              _change_statement('task_tombstone_select', 'task_tombstones', 'id, change_seq', limited))
+    for limited in (False, True)
+}
+
+INSERT_TOMBSTONE = Statement(
+    'task_tombstone_insert', "INSERT INTO task_tombstones (id, change_seq, event_id) VALUES (?, ?, ?)")
+
+SELECT_ROLLUPS = Statement('task_rollups_select',
+                           "SELECT dimension, group_key, total, completed FROM task_rollups WHERE event_id = ?")
+
+# 逾期與日期有關，無法預先彙總；只掃描結束日在今天以前的任務
+SELECT_OVERDUE_COUNTS = Statement('task_overdue_counts', '''
+    SELECT COALESCE(stage, '') AS stage, COALESCE(responsible, '') AS responsible, COUNT(*) AS overdue
+    FROM tasks
+    WHERE event_id = ? AND end_date >= '0001-01-01' AND end_date < ? AND (completed = ? OR completed IS NULL)
+    GROUP BY COALESCE(stage, ''), COALESCE(responsible, '')
+''')
+
+# 統計結果中各維度的名稱與分組欄位的前端名稱
+STATS_DIMENSIONS = (('stage', 'byStage', 'stage'),
+                    ('responsible', 'byResponsible', 'responsible'),
+                    ('week', 'byWeek', 'weekStart'))
+
+# 依欄位組合建立的部分更新語句
+_partial_update_statements = {}
+
+
+def partial_update_statement(columns, if_version=False):
+    """取得只更新指定欄位的語句，同一組欄位共用同一個已準備語句
+
+    if_version為True時語句多一個版本號參數，只在版本號相符時更新。
+    """
+    key = (columns, if_version)
+    statement = _partial_update_statements.get(key)
+    if statement is None:
+        mask = sum(1 << UPDATABLE_COLUMNS.index(column) for column in columns)
+        assignments = ''.join(f"{column} = ?, " for column in columns)
+        condition = 'event_id = ? AND id = ? AND version = ?' if if_version else 'event_id = ? AND id = ?'
+        statement = Statement(
+            f"task_update_partial_{mask:x}{'_if_version' if if_version else ''}",
+            f"UPDATE tasks SET {assignments}change_seq = ?, version = version + 1, "
+            f"updated_at = CURRENT_TIMESTAMP WHERE {condition}")
+        _partial_update_statements[key] = statement
+    return statement
+
+
+def update_returning(statement, params, event_id, task_id):
+    """執行更新並取回更新後的資料列；不支援RETURNING時在同一交易中再查詢"""
+    if db.supports_returning:
+        return db.fetch_one(statement.returning(), params)
+    with db.transaction():
+        if not db.execute(statement, params):
+            return None
+        return db.fetch_one(SELECT_TASK_BY_ID, (event_id, task_id))
+
+
+def update_if_version(statement, params, event_id, task_id):
+    """執行帶版本號條件的更新並取回更新後的資料列，必須在寫入交易中呼叫
+
+    沒有更新到資料列時再查詢一次：任務存在表示版本號不符，拋出VersionConflict
+    讓交易回滾；任務不存在時返回None。
+    """
+    row = update_returning(statement, params, event_id, task_id)
+    if row is None:
+        check_version(event_id, task_id)
+    return row
+
+
+def check_version(event_id, task_id):
+    """條件式寫入沒有影響任何資料列後呼叫：任務仍存在時拋出VersionConflict"""
+    current = db.fetch_one(SELECT_TASK_BY_ID, (event_id, task_id))
+    if current is not None:
+        raise VersionConflict(Task.from_row(current))
+
+
+def encode_cursor(sort, values):
+    """將排序欄位與最後一筆的鍵值編碼為分頁游標"""
+    raw = json.dumps([sort] + list(values), ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    """解碼分頁游標，排序方式不一致時拋出ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(data, list) or not data or data[0] != sort:
+        raise ValueError("Cursor does not match sort order")
+    return data[1:]
+
+
+def in_event(event_id, column, values):
+    """「活動中且欄位值屬於清單」的條件與參數"""
+    condition, params = db.any_of(column, values)
+    return f"event_id = {db.placeholder} AND {condition}", (event_id,) + tuple(params)
+
+
+class VersionConflict(Exception):
+    """條件式寫入的版本號與資料庫中的不符；task為目前的任務"""
+
+    def __init__(self, task):
+        super().__init__(f"Task {task.id} has been modified (current version {task.version})")
+        self.task = task
+
+
+class TaskNotFound(Exception):
+    """單筆寫入的任務不存在；在寫入交易中拋出，讓已推進的活動版本號回滾，不通知任何變更"""
+
 
 class Task:
+    __slots__ = TASK_COLUMNS
+
     def __init__(self, id=None, stage=None, milestone=None, start_date=None, 
                  end_date=None, content=None, holiday_impact=None, 
                  dependencies=None, responsible=None, risks=None,
-                 completed=None, created_at=None, updated_at=None):
+                 completed=None, created_at=None, updated_at=None, change_seq=None, version=None,
+                 event_id=None):
         self.id = id
         self.stage = stage
         self.milestone = milestone
@@ -19,24 +257,13 @@ class Task:
         self.completed = completed
         self.created_at = created_at
         self.updated_at = updated_at
+        self.change_seq = change_seq
+        self.version = version
+        self.event_id = event_id
     
     def to_dict(self):
         """將Task物件轉換為字典"""
-        return {
-            'id': self.id,
-            'stage': self.stage,
-            'milestone': self.milestone,
-            'startDate': self.start_date,  # 保持前端期望的欄位名稱
-            'endDate': self.end_date,      # 保持前端期望的欄位名稱
-            'description': self.content,   # 保持前端期望的欄位名稱
-            'holidayImpact': self.holiday_impact,  # 保持前端期望的欄位名稱
-            'dependencies': self.dependencies,
-            'responsible': self.responsible,
-            'risks': self.risks,
-            'isCompleted': self.completed,  # 返回前端期望的 isCompleted 字段
-            'created_at': self.created_at.isoformat() if isinstance(self.created_at, datetime) else self.created_at,
-            'updated_at': self.updated_at.isoformat() if isinstance(self.updated_at, datetime) else self.updated_at
-        }
+        return task_to_wire.from_object(self)
     
     @classmethod
     def from_dict(cls, data):
@@ -54,104 +281,581 @@ class Task:
             risks=data.get('risks'),
             completed=data.get('completed'),
             created_at=data.get('created_at'),
-            updated_at=data.get('updated_at')
+            updated_at=data.get('updated_at'),
+            change_seq=data.get('change_seq'),
+            version=data.get('version'),
+            event_id=data.get('event_id') or data.get('eventId')
         )
     
     @classmethod
-    def get_all(cls):
-        """獲取所有任務"""
-        query = "SELECT * FROM tasks ORDER BY start_date"
-        results = db.execute_query(query)
-        return [cls.from_dict(row) for row in results]
+    def from_row(cls, row):
+        """從資料庫資料列（sqlite3.Row或字典）創建Task物件"""
+        return cls(*task_row_values(row))
+
+    @classmethod
+    def from_rows(cls, rows):
+        """從一批欄位相同的資料列創建Task物件列表"""
+        if not rows:
+            return []
+        values = task_row_values.for_row(rows[0])
+        return [cls(*values(row)) for row in rows]
+
+    @staticmethod
+    def rows_to_wire(rows):
+        """將一批資料庫資料列直接轉換為前端格式，不建立Task物件"""
+        return task_to_wire.map_rows(rows)
+
+    @classmethod
+    def get_all(cls, event_id):
+        """獲取活動的所有任務"""
+        query = f"SELECT * FROM tasks WHERE event_id = {db.placeholder} ORDER BY start_date"
+        results = db.execute_query(query, (event_id,))
+        return cls.from_rows(results)
     
     @classmethod
-    def get_by_id(cls, task_id):
-        """根據ID獲取任務"""
-        if db.use_sqlite:
-            query = "SELECT * FROM tasks WHERE id = ?"
+    def query(cls, event_id, stage=None, responsible=None, completed=None, start_from=None,
+              start_to=None, sort='start_date', order='asc', limit=None, cursor=None,
+              window=None):
+        """依條件篩選活動的任務，支援穩定排序與游標（keyset）分頁
+
+        window為 (from, to) 時只返回日期區間與其重疊的任務。
+        返回 (tasks, next_cursor)；沒有下一頁時next_cursor為None。
+        """
+        query, params = cls.select_query(event_id, stage, responsible, completed, start_from,
+                                         start_to, sort, order, limit, cursor, window)
+        return cls.page(db.execute_query(query, params), sort, limit)
+
+    @classmethod
+    def page(cls, results, sort='start_date', limit=None):
+        """將多取一筆的查詢結果切成一頁，返回 (tasks, next_cursor)"""
+        next_cursor = None
+        if limit is not None and len(results) > limit:
+            results = results[:limit]
+            last = results[-1]
+            if sort == 'id':
+                next_cursor = encode_cursor(sort, [last['id']])
+            else:
+                value = last[sort]
+                if isinstance(value, date):
+                    value = value.isoformat()
+                next_cursor = encode_cursor(sort, [value, last['id']])
+
+        return cls.from_rows(results), next_cursor
+
+    @classmethod
+    def stream(cls, event_id, stage=None, responsible=None, completed=None, start_from=None,
+               start_to=None, sort='start_date', order='asc', cursor=None, window=None,
+               batch_size=None):
+        """與query相同的篩選與排序，但以批次逐步產生資料列，不一次載入全部結果"""
+        query, params = cls.select_query(event_id, stage, responsible, completed, start_from,
+                                         start_to, sort, order, None, cursor, window)
+        return db.stream_query(query, params, batch_size)
+
+    @staticmethod
+    def select_query(event_id, stage=None, responsible=None, completed=None, start_from=None, start_to=None,
+                     sort='start_date', order='asc', limit=None, cursor=None, window=None):
+        """組合篩選、排序與分頁條件，返回 (SQL, 參數)"""
+        if sort not in SORTABLE_COLUMNS:
+            raise ValueError(f"Unsupported sort column: {sort}")
+        if order not in ('asc', 'desc'):
+            raise ValueError(f"Unsupported sort order: {order}")
+
+        p = db.placeholder
+        conditions = [f"event_id = {p}"]
+        params = [event_id]
+
+        if stage is not None:
+            conditions.append(f"stage = {p}")
+            params.append(stage)
+        if responsible is not None:
+            conditions.append(f"responsible = {p}")
+            params.append(responsible)
+        if completed is True:
+            conditions.append(f"completed = {p}")
+            params.append(True)
+        elif completed is False:
+            conditions.append(f"(completed = {p} OR completed IS NULL)")
+            params.append(False)
+        if start_from is not None:
+            conditions.append(f"start_date >= {p}")
+            params.append(start_from)
+        if start_to is not None:
+            conditions.append(f"start_date <= {p}")
+            params.append(start_to)
+        if window is not None:
+            window_from, window_to = window
+            for value in window:
+                try:
+                    date.fromisoformat(value)
+                except (TypeError, ValueError):
+                    raise ValueError(f"Invalid date: {value}")
+            if window_to < window_from:
+                raise ValueError("to must not be earlier than from")
+            condition, window_params = db.date_overlap(window_from, window_to)
+            conditions.append(condition)
+            params.extend(window_params)
+
+        comparison = '>' if order == 'asc' else '<'
+        if cursor is not None:
+            values = decode_cursor(cursor, sort)
+            if sort == 'id':
+                conditions.append(f"id {comparison} {p}")
+                params.append(values[0])
+            else:
+                conditions.append(f"({sort}, id) {comparison} ({p}, {p})")
+                params.extend(values)
+
+        query = "SELECT * FROM tasks WHERE " + " AND ".join(conditions)
+        direction = order.upper()
+        if sort == 'id':
+            query += f" ORDER BY id {direction}"
         else:
-            query = "SELECT * FROM tasks WHERE id = %s"
-        
-        results = db.execute_query(query, (task_id,))
-        if results:
-            return cls.from_dict(results[0])
+            query += f" ORDER BY {sort} {direction}, id {direction}"
+
+        if limit is not None:
+            # 多取一筆用來判斷是否還有下一頁
+            query += f" LIMIT {p}"
+            params.append(limit + 1)
+
+        return query, tuple(params)
+
+    @staticmethod
+    def columns_from_wire(data):
+        """將前端欄位名稱的資料轉換為資料表欄位"""
+        values = {}
+        for key, column in WIRE_COLUMNS.items():
+            # isCompleted 優先於 completed
+            if key in data:
+                values.setdefault(column, data[key])
+        return values
+
+    @staticmethod
+    def validate_columns(values, required=False):
+        """檢查columns_from_wire轉換後的欄位，不合法時拋出ValueError
+
+        不可為空的欄位只要出現就必須有值，日期必須是YYYY-MM-DD；
+        required為True（新增任務）時不可為空的欄位都必須提供。
+        """
+        if required:
+            missing = [COLUMN_WIRE_NAMES[column] for column in REQUIRED_COLUMNS if column not in values]
+            if missing:
+                raise ValueError(f"Missing required fields: {', '.join(missing)}")
+        for column in REQUIRED_COLUMNS:
+            if column in values and (values[column] is None or not str(values[column]).strip()):
+                raise ValueError(f"{COLUMN_WIRE_NAMES[column]} must not be empty")
+        for column in DATE_COLUMNS:
+            if column not in values:
+                continue
+            value = values[column]
+            try:
+                valid = date.fromisoformat(value).isoformat() == value
+            except (TypeError, ValueError):
+                valid = False
+            if not valid:
+                raise ValueError(f"Invalid {COLUMN_WIRE_NAMES[column]}: {value}")
+        if all(column in values for column in DATE_COLUMNS) and values['end_date'] < values['start_date']:
+            raise ValueError("endDate must not be earlier than startDate")
+
+    @classmethod
+    def apply_bulk(cls, event_id, operations):
+        """在單一交易中對活動的任務套用多筆新增/更新/切換完成/刪除操作
+
+        同類型的操作以集合式SQL一次處理，套用順序為
+        create → update → toggle → delete。返回與輸入順序相同的結果列表，
+        每筆包含 index、op、id、status，新增或更新後的任務附在 task 欄位。
+        update/toggle/delete可帶version，與批次開始前的版本號不符時該筆的
+        status為conflict並附上目前的任務，其餘操作照常套用。
+        格式錯誤的操作會在寫入前拋出ValueError。
+        """
+        if not isinstance(operations, list) or not operations:
+            raise ValueError("operations must be a non-empty list")
+
+        grouped = {op: [] for op in BULK_OPERATIONS}
+        for index, operation in enumerate(operations):
+            if not isinstance(operation, dict):
+                raise ValueError(f"Operation {index} must be an object")
+            op = operation.get('op')
+            if op not in BULK_OPERATIONS:
+                raise ValueError(f"Operation {index} has unsupported op: {op}")
+            if op != 'create':
+                task_id = operation.get('id')
+                if isinstance(task_id, bool) or not isinstance(task_id, int):
+                    raise ValueError(f"Operation {index} requires an integer id")
+                version = operation.get('version')
+                if version is not None and (isinstance(version, bool) or not isinstance(version, int)):
+                    raise ValueError(f"Operation {index} has a non-integer version")
+            if op in ('create', 'update') and not isinstance(operation.get('data'), dict):
+                raise ValueError(f"Operation {index} requires a data object")
+            if op in ('create', 'update'):
+                try:
+                    cls.validate_columns(cls.columns_from_wire(operation['data']), required=op == 'create')
+                except ValueError as e:
+                    raise ValueError(f"Operation {index}: {e}")
+            grouped[op].append((index, operation))
+
+        results = [None] * len(operations)
+        p = db.placeholder
+
+        with db.transaction() as conn:
+            cursor = conn.cursor()
+            seq = cls.begin_change(event_id)
+
+            # 一次查出所有被引用的任務是否存在與其版本號；begin_change已鎖定活動，
+            # 提交前不會有其他交易修改這些任務
+            referenced = {operation['id'] for op in ('update', 'toggle', 'delete')
+                          for _, operation in grouped[op]}
+            existing = {}
+            if referenced:
+                condition, params = in_event(event_id, 'id', referenced)
+                cursor.execute(f"SELECT id, version FROM tasks WHERE {condition}", params)
+                existing = {row['id']: row['version'] for row in cursor.fetchall()}
+
+            def rejected(index, op, operation):
+                """任務不存在或版本號不符時記錄結果並返回True"""
+                task_id = operation['id']
+                if task_id not in existing:
+                    results[index] = {'index': index, 'op': op, 'id': task_id, 'status': 'not_found'}
+                    return True
+                version = operation.get('version')
+                if version is not None and version != existing[task_id]:
+                    results[index] = {'index': index, 'op': op, 'id': task_id, 'status': 'conflict'}
+                    return True
+                return False
+
+            # 新增依欄位組合分組，每組以多列VALUES的INSERT送出；新id依插入順序遞增，
+            # 排序後即與該組的輸入順序對應
+            create_groups = {}
+            for index, operation in grouped['create']:
+                values = cls.columns_from_wire(operation['data'])
+                columns = tuple(sorted(values))
+                create_groups.setdefault(columns, []).append(
+                    (index, tuple(values[column] for column in columns) + (seq, event_id)))
+            for columns, rows in create_groups.items():
+                columns += ('change_seq', 'event_id')
+                row_placeholders = f"({', '.join(p for _ in columns)})"
+                per_statement = max(1, MAX_INSERT_PARAMETERS // len(columns))
+                for start in range(0, len(rows), per_statement):
+                    chunk = rows[start:start + per_statement]
+                    query = (f"INSERT INTO tasks ({', '.join(columns)}) "
+                             f"VALUES {', '.join(row_placeholders for _ in chunk)}")
+                    params = tuple(value for _, row in chunk for value in row)
+                    if db.supports_returning:
+                        cursor.execute(query + " RETURNING id", params)
+                        new_ids = sorted(row['id'] for row in cursor.fetchall())
+                    else:
+                        # 舊版SQLite沒有RETURNING；單一寫入交易中同一語句的rowid連續
+                        cursor.execute(query, params)
+                        new_ids = range(cursor.lastrowid - len(chunk) + 1, cursor.lastrowid + 1)
+                    for (index, _), task_id in zip(chunk, new_ids):
+                        results[index] = {'index': index, 'op': 'create', 'id': task_id, 'status': 'created'}
+
+            # 更新依欄位組合分組，每組以executemany一次送出
+            update_groups = {}
+            for index, operation in grouped['update']:
+                task_id = operation['id']
+                if rejected(index, 'update', operation):
+                    continue
+                values = cls.columns_from_wire(operation['data'])
+                results[index] = {'index': index, 'op': 'update', 'id': task_id, 'status': 'updated'}
+                columns = tuple(sorted(values))
+                update_groups.setdefault(columns, []).append(
+                    tuple(values[column] for column in columns) + (seq, event_id, task_id))
+            for columns, rows in update_groups.items():
+                assignments = ''.join(f"{column} = {p}, " for column in columns)
+                cursor.executemany(
+                    f"UPDATE tasks SET {assignments}change_seq = {p}, version = version + 1, "
+                    f"updated_at = CURRENT_TIMESTAMP WHERE event_id = {p} AND id = {p}", rows)
+
+            # 同一任務切換偶數次等於不變
+            toggle_counts = {}
+            for index, operation in grouped['toggle']:
+                task_id = operation['id']
+                if rejected(index, 'toggle', operation):
+                    continue
+                toggle_counts[task_id] = toggle_counts.get(task_id, 0) + 1
+                results[index] = {'index': index, 'op': 'toggle', 'id': task_id, 'status': 'toggled'}
+            toggle_ids = [task_id for task_id, count in toggle_counts.items() if count % 2]
+            if toggle_ids:
+                condition, params = in_event(event_id, 'id', toggle_ids)
+                cursor.execute(
+                    f"UPDATE tasks SET completed = NOT COALESCE(completed, FALSE), change_seq = {p}, "
+                    f"version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE {condition}", (seq,) + params)
+
+            delete_ids = set()
+            for index, operation in grouped['delete']:
+                task_id = operation['id']
+                if task_id in delete_ids:
+                    results[index] = {'index': index, 'op': 'delete', 'id': task_id, 'status': 'not_found'}
+                    continue
+                if rejected(index, 'delete', operation):
+                    continue
+                delete_ids.add(task_id)
+                results[index] = {'index': index, 'op': 'delete', 'id': task_id, 'status': 'deleted'}
+            if delete_ids:
+                condition, params = in_event(event_id, 'id', delete_ids)
+                cls.record_deletions(cursor, condition, params, seq)
+                cursor.execute(f"DELETE FROM tasks WHERE {condition}", params)
+
+            # 一次取回所有新增或更新後的任務，以及版本衝突的任務目前的內容
+            touched = {result['id'] for result in results
+                       if result['status'] in ('created', 'updated', 'toggled', 'conflict')} - delete_ids
+            tasks = {}
+            if touched:
+                condition, params = in_event(event_id, 'id', touched)
+                cursor.execute(f"SELECT * FROM tasks WHERE {condition}", params)
+                tasks = {row['id']: cls.from_row(row) for row in cursor.fetchall()}
+
+            cls.finish_change(event_id, seq, created=[result['id'] for result in results
+                                                      if result['status'] == 'created'])
+
+        for result in results:
+            task = tasks.get(result['id'])
+            if task is not None:
+                result['task'] = task.to_dict()
+        return results
+
+    @classmethod
+    def get_by_id(cls, event_id, task_id):
+        """根據ID獲取活動中的任務"""
+        row = db.fetch_one(SELECT_TASK_BY_ID, (event_id, task_id))
+        if row:
+            return cls.from_row(row)
         return None
     
     def save(self):
-        """保存任務（新增或更新）"""
+        """保存任務（新增或更新）；任務必須指定所屬活動"""
+        if not self.event_id:
+            raise ValueError("event_id is required")
         if self.id:
             # 更新現有任務
-            if db.use_sqlite:
-                query = '''
-                    UPDATE tasks 
-                    SET stage = ?, milestone = ?, start_date = ?, end_date = ?,
-                        content = ?, holiday_impact = ?, dependencies = ?,
-                        responsible = ?, risks = ?, completed = ?, updated_at = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                '''
-                params = (self.stage, self.milestone, self.start_date, self.end_date,
-                         self.content, self.holiday_impact, self.dependencies,
-                         self.responsible, self.risks, self.completed, self.id)
-            else:
-                query = '''
-                    UPDATE tasks 
-                    SET stage = %s, milestone = %s, start_date = %s, end_date = %s,
-                        content = %s, holiday_impact = %s, dependencies = %s,
-                        responsible = %s, risks = %s, completed = %s, updated_at = CURRENT_TIMESTAMP
-                    WHERE id = %s
-                '''
+            with db.transaction():
+                seq = self.begin_change(self.event_id)
                 params = (self.stage, self.milestone, self.start_date, self.end_date,
                          self.content, self.holiday_impact, self.dependencies,
-                         self.responsible, self.risks, self.completed, self.id)
-            
-            db.execute_query(query, params)
-            return self
+                         self.responsible, self.risks, self.completed, seq, self.event_id, self.id)
+                row = update_returning(UPDATE_TASK, params, self.event_id, self.id)
+                self.finish_change(self.event_id, seq)
+            if row:
+                return self.from_row(row)
+            return None
         else:
-            # 新增任務
-            if db.use_sqlite:
-                query = '''
-                    INSERT INTO tasks (stage, milestone, start_date, end_date, content,
-                                     holiday_impact, dependencies, responsible, risks, completed)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                '''
-                params = (self.stage, self.milestone, self.start_date, self.end_date,
-                         self.content, self.holiday_impact, self.dependencies,
-                         self.responsible, self.risks, self.completed)
-            else:
-                query = '''
-                    INSERT INTO tasks (stage, milestone, start_date, end_date, content,
-                                     holiday_impact, dependencies, responsible, risks, completed)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                '''
+            # 新增任務；未指定完成狀態時與批次新增相同，預設為未完成
+            completed = self.completed if self.completed is not None else False
+            with db.transaction():
+                seq = self.begin_change(self.event_id)
                 params = (self.stage, self.milestone, self.start_date, self.end_date,
                          self.content, self.holiday_impact, self.dependencies,
-                         self.responsible, self.risks, self.completed)
-            
-            result = db.insert_and_return(query, params)
+                         self.responsible, self.risks, completed, seq, self.event_id)
+                result = db.insert_and_return(db.render(INSERT_TASK), params)
+                self.finish_change(self.event_id, seq, created=[result['id']] if result else [])
             if result:
-                return self.from_dict(result)
+                return self.from_row(result)
             return None
     
+    @classmethod
+    def update_fields(cls, event_id, task_id, values, expected_version=None):
+        """只更新values中提供的欄位，返回更新後的任務；任務不存在時返回None
+
+        指定expected_version時以 WHERE event_id = ? AND id = ? AND version = ? 條件式更新，
+        版本號不符時拋出VersionConflict，不持有任何鎖等待客戶端。
+        """
+        columns = tuple(column for column in UPDATABLE_COLUMNS if column in values)
+        if not columns:
+            task = cls.get_by_id(event_id, task_id)
+            if task is not None and expected_version is not None and task.version != expected_version:
+                raise VersionConflict(task)
+            return task
+
+        try:
+            with db.transaction():
+                seq = cls.begin_change(event_id)
+                params = tuple(values[column] for column in columns) + (seq, event_id, task_id)
+                if expected_version is None:
+                    row = update_returning(partial_update_statement(columns), params, event_id, task_id)
+                else:
+                    row = update_if_version(partial_update_statement(columns, if_version=True),
+                                            params + (expected_version,), event_id, task_id)
+                if row is None:
+                    raise TaskNotFound(task_id)
+                cls.finish_change(event_id, seq)
+        except TaskNotFound:
+            return None
+        return cls.from_row(row)
+
+    @classmethod
+    def toggle_completed(cls, event_id, task_id, expected_version=None):
+        """以單一語句切換完成狀態，返回更新後的任務；任務不存在時返回None
+
+        指定expected_version時版本號不符會拋出VersionConflict。
+        """
+        try:
+            with db.transaction():
+                seq = cls.begin_change(event_id)
+                if expected_version is None:
+                    row = update_returning(TOGGLE_TASK, (seq, event_id, task_id), event_id, task_id)
+                else:
+                    row = update_if_version(TOGGLE_TASK_IF_VERSION, (seq, event_id, task_id, expected_version),
+                                            event_id, task_id)
+                if row is None:
+                    raise TaskNotFound(task_id)
+                cls.finish_change(event_id, seq)
+        except TaskNotFound:
+            return None
+        return cls.from_row(row)
+
     def delete(self):
         """刪除任務"""
         if self.id:
-            if db.use_sqlite:
-                query = "DELETE FROM tasks WHERE id = ?"
-            else:
-                query = "DELETE FROM tasks WHERE id = %s"
-            
-            db.execute_query(query, (self.id,))
+            self.delete_by_id(self.event_id, self.id)
             return True
         return False
     
     @classmethod
-    def delete_by_id(cls, task_id):
-        """根據ID刪除任務"""
-        if db.use_sqlite:
-            query = "DELETE FROM tasks WHERE id = ?"
-        else:
-            query = "DELETE FROM tasks WHERE id = %s"
-        
-        rowcount = db.execute_query(query, (task_id,))
-        return rowcount > 0
+    def delete_by_id(cls, event_id, task_id, expected_version=None):
+        """根據ID刪除活動中的任務
+
+        指定expected_version時只在版本號相符時刪除，否則拋出VersionConflict。
+        任務不存在時交易回滾並返回False，活動版本號不變，也不產生刪除紀錄或通知。
+        """
+        try:
+            with db.transaction():
+                seq = cls.begin_change(event_id)
+                if expected_version is None:
+                    rowcount = db.execute(DELETE_TASK, (event_id, task_id))
+                else:
+                    rowcount = db.execute(DELETE_TASK_IF_VERSION, (event_id, task_id, expected_version))
+                    if not rowcount:
+                        check_version(event_id, task_id)
+                if not rowcount:
+                    raise TaskNotFound(task_id)
+                db.execute(INSERT_TOMBSTONE, (task_id, seq, event_id))
+                cls.finish_change(event_id, seq)
+        except TaskNotFound:
+            return False
+        return True
+
+    @staticmethod
+    def completion_rate(total, completed):
+        """完成率（0～1），沒有任務時為None"""
+        return round(completed / total, 4) if total else None
+
+    @classmethod
+    def stats(cls, event_id, today=None):
+        """活動的儀表板統計：總數、完成率、逾期數量，以及各階段、負責人與週的分組
+
+        數量與完成數讀取觸發器維護的task_rollups，成本與分組數成正比；
+        逾期數量以GROUP BY查詢結束日在today以前且未完成的任務。
+        """
+        today = today or date.today().isoformat()
+        return cls.stats_from_rows(db.fetch_all(SELECT_ROLLUPS, (event_id,)),
+                                   db.fetch_all(SELECT_OVERDUE_COUNTS, (event_id, today, False)), today)
+
+    @classmethod
+    def stats_from_rows(cls, rollup_rows, overdue_rows, today):
+        """由SELECT_ROLLUPS與SELECT_OVERDUE_COUNTS的結果組成統計"""
+        groups = {dimension: {} for dimension in ('all',) + tuple(d for d, _, _ in STATS_DIMENSIONS)}
+        for row in rollup_rows:
+            groups.setdefault(row['dimension'], {})[row['group_key']] = (row['total'], row['completed'])
+
+        overdue = {'all': {}, 'stage': {}, 'responsible': {}}
+        for row in overdue_rows:
+            for dimension, key in (('all', ''), ('stage', row['stage']), ('responsible', row['responsible'])):
+                overdue[dimension][key] = overdue[dimension].get(key, 0) + row['overdue']
+
+        total, completed = groups['all'].get('', (0, 0))
+        result = {
+            'asOf': today,
+            'total': total,
+            'completed': completed,
+            'completionRate': cls.completion_rate(total, completed),
+            'overdue': overdue['all'].get('', 0),
+        }
+        for dimension, field, key_name in STATS_DIMENSIONS:
+            items = []
+            for key, (group_total, group_completed) in sorted(groups[dimension].items()):
+                item = {
+                    key_name: key or None,
+                    'total': group_total,
+                    'completed': group_completed,
+                    'completionRate': cls.completion_rate(group_total, group_completed),
+                }
+                if dimension in overdue:
+                    item['overdue'] = overdue[dimension].get(key, 0)
+                items.append(item)
+            result[field] = items
+        return result
+
+    @staticmethod
+    def group_counts(dimension):
+        """直接以GROUP BY計算某個維度的 {(活動, 分組): (總數, 完成數)}，用於核對彙總表"""
+        rows = db.execute_query(f'''
+            SELECT event_id, {db.rollup_group(dimension)} AS group_key, COUNT(*) AS total,
+                   SUM(CASE WHEN completed THEN 1 ELSE 0 END) AS completed
+            FROM tasks
+            GROUP BY 1, 2
+        ''')
+        return {(row['event_id'], row['group_key']): (row['total'], row['completed']) for row in rows}
+
+    @staticmethod
+    def table_version(event_id):
+        """活動最後一次變更的序號"""
+        return Event.version_of(event_id)
+
+    @staticmethod
+    def begin_change(event_id):
+        """分配本次寫入的變更序號並記錄為活動的版本號，必須在寫入交易中呼叫
+
+        活動的列鎖住直到交易結束（見Event.advance），因此同一活動內變更序號的大小順序
+        與提交順序一致，以活動版本號為上限的增量同步不會漏掉較晚提交的變更；
+        不同活動的寫入互不等待。活動不存在或已封存時拋出EventUnavailable。
+        """
+        return Event.advance(event_id)
+
+    @staticmethod
+    def finish_change(event_id, seq, created=()):
+        """在寫入交易結束前呼叫：更新搜尋索引，並在提交後通知變更"""
+        task_search.sync(event_id, seq)
+        task_events.notify(event_id, seq, created=created)
+
+    @staticmethod
+    def record_deletions(cursor, condition, params, seq):
+        """為即將刪除的任務寫入刪除紀錄（tombstone），供增量同步使用"""
+        p = db.placeholder
+        cursor.execute(
+            f"INSERT INTO task_tombstones (id, change_seq, event_id) "
+            f"SELECT id, {p}, event_id FROM tasks WHERE {condition}",
+            (seq,) + tuple(params))
+
+    @classmethod
+    def get_changes(cls, event_id, since=None, limit=None, until=None):
+        """取得活動中變更序號大於since的任務與已刪除的任務ID
+
+        since為None時返回完整快照；until可限制變更序號的上限。變更序號只在活動內
+        依提交順序遞增，游標只適用於同一活動。返回 (tasks, deleted_ids, cursor, has_more)，
+        下次以cursor作為since即可取得之後的變更。同一序號的變更不會被拆到兩頁。
+        """
+        version = cls.table_version(event_id)
+        if until is not None:
+            version = min(version, until)
+        if since is None:
+            results = db.execute_query(f"SELECT * FROM tasks WHERE event_id = {db.placeholder} ORDER BY id",
+                                       (event_id,))
+            return cls.from_rows(results), [], version, False
+
+        def fetch(upper, row_limit):
+            select_tasks, select_tombstones = CHANGE_STATEMENTS[row_limit is not None]
+            params = (event_id, since, upper) + (() if row_limit is None else (row_limit,))
+            return db.fetch_all(select_tasks, params), db.fetch_all(select_tombstones, params)
+
+        rows, tombstones = fetch(version, limit + 1 if limit is not None else None)
+        cursor = version
+        has_more = False
+        if limit is not None and len(rows) + len(tombstones) > limit:
+            # 以第limit筆的序號為界，重新取回該序號以前的完整變更
+            sequences = sorted(row['change_seq'] for row in rows + tombstones)
+            cursor = sequences[limit - 1]
+            has_more = cursor < version
+            rows, tombstones = fetch(cursor, None)
 
+        return (cls.from_rows(rows),
+                [row['id'] for row in tombstones], cursor, has_more)
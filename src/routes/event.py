@@ -0,0 +1,82 @@
+from flask import Blueprint, request, jsonify
+from ..models.event import Event, EventUnavailable
+from ..graph import dependency_graph
+from ..intervals import task_intervals
+from .task import task_list_cache, task_stats_cache, event_unavailable
+
+event_bp = Blueprint("event_bp", __name__)
+
+def discard_event_caches(event_id):
+    """釋放活動在本行程的回應快取與索引（其他worker的快取依LRU自然淘汰）"""
+    for per_event in (task_list_cache, task_stats_cache, dependency_graph, task_intervals):
+        per_event.discard(event_id)
+
+@event_bp.route("/events", methods=["GET"])
+def get_events():
+    """活動列表，每個活動附帶任務數與完成數；status 可篩選 active 或 archived"""
+    try:
+        return jsonify(Event.summaries(request.args.get("status")))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@event_bp.route("/events", methods=["POST"])
+def create_event():
+    """新增活動
+
+    請求格式：{"name": "2026 春季", "startDate": "2026-03-01", "endDate": "2026-05-31"}
+    """
+    try:
+        data = request.json or {}
+        event = Event.create(data.get("name"), data.get("startDate"), data.get("endDate"))
+        return jsonify(event.summary()), 201
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@event_bp.route("/events/<int:event_id>", methods=["GET"])
+def get_event(event_id):
+    """獲取活動（包括已封存的活動）"""
+    try:
+        event = Event.get(event_id)
+        if event is None:
+            return jsonify({"error": f"Event {event_id} not found"}), 404
+        return jsonify(event.summary())
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@event_bp.route("/events/<int:event_id>/archive", methods=["POST"])
+def archive_event(event_id):
+    """封存結束的活動：任務不再提供讀寫，也不再出現在搜尋結果中，可再還原"""
+    try:
+        event = Event.archive(event_id)
+        discard_event_caches(event_id)
+        return jsonify(event.summary())
+    except EventUnavailable as e:
+        return event_unavailable(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@event_bp.route("/events/<int:event_id>/restore", methods=["POST"])
+def restore_event(event_id):
+    """還原封存的活動"""
+    try:
+        return jsonify(Event.restore(event_id).summary())
+    except EventUnavailable as e:
+        return event_unavailable(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@event_bp.route("/events/<int:event_id>", methods=["DELETE"])
+def drop_event(event_id):
+    """刪除封存的活動與其所有任務；進行中的活動必須先封存，否則返回409"""
+    try:
+        Event.drop(event_id)
+        discard_event_caches(event_id)
+        return jsonify({"message": f"Event {event_id} deleted successfully"}), 200
+    except EventUnavailable as e:
+        return event_unavailable(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -1,17 +1,466 @@
-from flask import Blueprint, request, jsonify
-from ..models.task import Task
-from ..database import db
-import json
+from flask import Blueprint, request, jsonify, current_app, g
+from ..models.event import Event, EventUnavailable
+from ..models.task import Task, VersionConflict, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from ..cache import PerEvent, ResponseCache, make_etag
+from ..exports import EXPORT_FORMATS
+from ..importer import TaskImporter
+from ..events import task_events, SubscriberLimitReached
+from ..streaming import stream_json_array
+from ..graph import dependency_graph
+from ..intervals import task_intervals
+from ..search import task_search
+from datetime import date
+import io
 import os
 
+# 同一組路由註冊兩次：/api/events/<event_id>/tasks... 操作指定活動，
+# /api/tasks... 操作DEFAULT_EVENT_ID設定的活動（相容活動功能加入前的客戶端）
 task_bp = Blueprint("task_bp", __name__)
 
+# GET /tasks 已編碼回應的快取，每個活動一份，依活動版本失效
+task_list_cache = PerEvent(lambda event_id: ResponseCache(f"tasks-{event_id}"))
+
+# GET /tasks/stats 已編碼回應的快取，每個活動一份，依活動版本與統計日期失效
+task_stats_cache = PerEvent(lambda event_id: ResponseCache(f"stats-{event_id}", max_entries=8))
+
+@task_bp.url_value_preprocessor
+def pull_event_id(endpoint, values):
+    """取出網址中的活動ID，不傳給各個路由函式"""
+    g.event_id = values.pop("event_id", None) if values else None
+
+@task_bp.before_request
+def load_event():
+    """載入請求的活動，其版本號作為快取與ETag的依據；活動不存在或已封存時直接回應"""
+    event_id = g.event_id if g.event_id is not None else current_app.config["DEFAULT_EVENT_ID"]
+    try:
+        g.event = Event.require(event_id)
+    except EventUnavailable as e:
+        return event_unavailable(e)
+
+def event_unavailable(error):
+    """活動不存在時回應404，狀態不允許此操作（例如已封存）時回應409"""
+    return jsonify({"error": str(error)}), 404 if error.status is None else 409
+
+def not_modified(etag):
+    """建立帶有ETag的304回應"""
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+def parse_version(value):
+    """解析版本號，接受 3、"3" 或 W/"3"；* 表示任何版本"""
+    text = str(value).strip()
+    if text == "*":
+        return None
+    if text.startswith("W/"):
+        text = text[2:]
+    try:
+        version = int(text.strip('"'))
+    except ValueError:
+        raise ValueError(f"Invalid version: {value}")
+    if version < 1:
+        raise ValueError(f"Invalid version: {value}")
+    return version
+
+def json_body():
+    """請求內容的JSON物件；沒有內容時為空物件，內容不是JSON物件時拋出ValueError"""
+    data = request.get_json(silent=True)
+    if data is None:
+        if request.get_data():
+            raise ValueError("Request body must be JSON")
+        return {}
+    if not isinstance(data, dict):
+        raise ValueError("Request body must be a JSON object")
+    return data
+
+def expected_version(data=None):
+    """取得條件式寫入的版本號（If-Match標頭或請求內容的version），都沒有時返回None"""
+    header = request.headers.get("If-Match")
+    from_header = parse_version(header) if header is not None else None
+    body = data.get("version") if isinstance(data, dict) else None
+    if body is None:
+        return from_header
+    if isinstance(body, bool) or not isinstance(body, int):
+        raise ValueError(f"Invalid version: {body}")
+    if from_header is not None and from_header != body:
+        raise ValueError("If-Match and version in the body disagree")
+    return body
+
+def task_response(task, status=200):
+    """單一任務的回應，ETag為任務的版本號，可直接作為下次寫入的If-Match"""
+    response = jsonify(task.to_dict())
+    response.status_code = status
+    response.set_etag(str(task.version))
+    return response
+
+def version_conflict(error):
+    """版本號不符的409回應，附上目前的任務讓客戶端合併後重試"""
+    response = jsonify({"error": str(error), "current": error.task.to_dict()})
+    response.status_code = 409
+    response.set_etag(str(error.task.version))
+    return response
+
+def parse_bool(value):
+    """解析查詢參數中的布林值"""
+    if value is None:
+        return None
+    lowered = value.strip().lower()
+    if lowered in ("1", "true", "yes"):
+        return True
+    if lowered in ("0", "false", "no"):
+        return False
+    raise ValueError(f"Invalid boolean value: {value}")
+
+def parse_limit(value, default=None):
+    """解析並檢查單頁筆數"""
+    if value is None:
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError(f"Invalid limit: {value}")
+    if limit < 1:
+        raise ValueError("limit must be a positive integer")
+    return min(limit, MAX_PAGE_SIZE)
+
+def parse_window(args):
+    """解析日期區間參數 from/to，兩者需同時指定"""
+    if "from" not in args and "to" not in args:
+        return None
+    if "from" not in args or "to" not in args:
+        raise ValueError("from and to must be given together")
+    return args["from"], args["to"]
+
+def task_list_key(args):
+    """GET /tasks 回應快取的鍵值"""
+    return "&".join(f"{k}={v}" for k, v in sorted(args.items(multi=True)))
+
+def task_filters(args):
+    """解析 GET /tasks 的篩選、排序與游標參數，供Task.query與Task.stream使用"""
+    return {
+        "stage": args.get("stage"),
+        "responsible": args.get("responsible"),
+        "completed": parse_bool(args.get("completed")),
+        "start_from": args.get("startFrom"),
+        "start_to": args.get("startTo"),
+        "window": parse_window(args),
+        "sort": args.get("sort", "start_date"),
+        "order": args.get("order", "asc").lower(),
+        "cursor": args.get("cursor")
+    }
+
+def task_list_payload(tasks, next_cursor, paginate):
+    """GET /tasks 的回應內容；分頁時附帶下一頁游標"""
+    items = [task.to_dict() for task in tasks]
+    if not paginate:
+        return items
+    return {
+        "tasks": items,
+        "nextCursor": next_cursor,
+        "hasMore": next_cursor is not None
+    }
+
+def parse_search(args):
+    """解析搜尋參數，返回 (查詢文字, 筆數, 位移)"""
+    text = (args.get("q") or "").strip()
+    if not text:
+        raise ValueError("q is required")
+    limit = parse_limit(args.get("limit"), 20)
+    offset = args.get("offset", "0")
+    try:
+        offset = int(offset)
+    except ValueError:
+        raise ValueError(f"Invalid offset: {offset}")
+    if offset < 0:
+        raise ValueError("offset must not be negative")
+    return text, limit, offset
+
+def search_payload(rows, has_more, offset):
+    """搜尋回應內容，每筆任務附帶相關度分數"""
+    items = Task.rows_to_wire(rows)
+    for item, row in zip(items, rows):
+        item["score"] = round(float(row["score"]), 6)
+    return {
+        "tasks": items,
+        "nextOffset": offset + len(rows) if has_more else None,
+        "hasMore": has_more
+    }
+
+def parse_today(args):
+    """解析統計的基準日（預設為今天）"""
+    today = args.get("today") or date.today().isoformat()
+    try:
+        date.fromisoformat(today)
+    except ValueError:
+        raise ValueError(f"Invalid date: {today}")
+    return today
+
 @task_bp.route("/tasks", methods=["GET"])
 def get_tasks():
-    """獲取所有任務"""
+    """獲取任務列表
+
+    可選查詢參數：stage、responsible、completed、startFrom、startTo 篩選；
+    sort（start_date/end_date/id）與 order（asc/desc）排序；
+    from 與 to 只返回日期區間與之重疊的任務；
+    limit 與 cursor 進行游標分頁。指定 limit 或 cursor 時回傳分頁格式。
+    stream=1 且未指定 limit 時以串流方式逐批輸出完整列表，不經過快取。
+    """
+    try:
+        args = request.args
+        cache_key = task_list_key(args)
+        version = g.event.version
+        cache = task_list_cache.for_event(g.event.id)
+
+        # 資料未變更時直接回應304，不查詢也不序列化
+        etag = cache.etag(cache_key, version)
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag)
+
+        if parse_bool(args.get("stream")) and "limit" not in args:
+            batches = Task.stream(g.event.id, **task_filters(args))
+            body = stream_json_array(batches, Task.rows_to_wire, current_app.json.dumps)
+            response = current_app.response_class(body, mimetype="application/json")
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+
+        entry = cache.get(cache_key, version)
+        if entry is None:
+            paginate = "limit" in args or "cursor" in args
+            limit = parse_limit(args.get("limit"), DEFAULT_PAGE_SIZE if paginate else None)
+
+            tasks, next_cursor = Task.query(g.event.id, limit=limit, **task_filters(args))
+            payload = task_list_payload(tasks, next_cursor, paginate)
+            body = (current_app.json.dumps(payload) + "\n").encode("utf-8")
+            entry = cache.put(cache_key, version, body)
+
+        response = current_app.response_class(entry.body, mimetype="application/json")
+        response.set_etag(entry.etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@task_bp.route("/tasks/export.<fmt>", methods=["GET"])
+def export_tasks(fmt):
+    """以CSV、XLSX或iCalendar匯出任務，欄位沿用Excel原始的中文標題
+
+    篩選與排序參數與 GET /tasks 相同。資料以串流游標逐批讀取並編碼，記憶體用量
+    與筆數無關；ETag取自活動版本，資料未變更時以304回應，不查詢任何任務。
+    """
+    try:
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({"error": f"Unsupported export format: {fmt}"}), 404
+        args = request.args
+        etag = make_etag(f"export-{g.event.id}-{fmt}", g.event.version, task_list_key(args))
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag)
+
+        stream, mimetype = EXPORT_FORMATS[fmt]
+        body = stream(Task.stream(g.event.id, **task_filters(args)))
+        response = current_app.response_class(body, content_type=mimetype)
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["Content-Disposition"] = f'attachment; filename="wonder-charge-tasks.{fmt}"'
+        return response
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@task_bp.route("/tasks/changes", methods=["GET"])
+def get_task_changes():
+    """增量同步：取得 since 之後新增、修改與刪除的任務
+
+    不帶 since 時返回完整快照；回應中的 cursor 作為下次請求的 since。
+    """
+    try:
+        since = request.args.get("since")
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                raise ValueError(f"Invalid since: {since}")
+        limit = parse_limit(request.args.get("limit"))
+
+        tasks, deleted, cursor, has_more = Task.get_changes(g.event.id, since, limit)
+        return jsonify({
+            "changes": [task.to_dict() for task in tasks],
+            "deleted": deleted,
+            "cursor": cursor,
+            "hasMore": has_more
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@task_bp.route("/tasks/stream", methods=["GET"])
+def stream_tasks():
+    """以Server-Sent Events推送任務的新增、更新與刪除事件
+
+    事件 id 為變更序號；重新連線時帶上 Last-Event-ID（或 lastEventId 查詢參數）
+    即可從中斷處繼續。每條連線佔用一個執行緒，同步串流數達SSE_MAX_SYNC_SUBSCRIBERS後
+    改為輪詢回應（見TaskEvents.poll）；即時串流應由ASGI入口提供。
+    """
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("lastEventId")
+    if last_event_id is not None:
+        try:
+            last_event_id = int(last_event_id)
+        except ValueError:
+            return jsonify({"error": f"Invalid Last-Event-ID: {last_event_id}"}), 400
+
+    try:
+        body = task_events.open_sync_stream(g.event.id, last_event_id)
+    except SubscriberLimitReached:
+        body = task_events.poll(g.event.id, last_event_id)
+
+    response = current_app.response_class(body, mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+def index_response(indexes, prefix, build):
+    """在活動同步後的行程內索引上產生回應，並以索引的版本作為ETag"""
+    index = indexes.for_event(g.event.id)
+    with index.current():
+        etag = make_etag(f"{prefix}-{g.event.id}", index.version, request.full_path)
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag)
+        payload = build(index)
+        version = index.version
+    if isinstance(payload, dict):
+        payload["version"] = version
+    response = jsonify(payload)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+@task_bp.route("/tasks/graph", methods=["GET"])
+def get_task_graph():
+    """任務相依圖：解析後的相依邊與無法解析的參照"""
+    try:
+        return index_response(dependency_graph, "graph", lambda graph: {
+            "edges": graph.edges(),
+            "unresolved": graph.unresolved()
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@task_bp.route("/tasks/graph/order", methods=["GET"])
+def get_task_order():
+    """依相依關係的拓撲排序；blocked 為位於循環中或依賴循環的任務"""
+    try:
+        def build(graph):
+            order, blocked = graph.topological_order()
+            return {"order": order, "blocked": blocked}
+        return index_response(dependency_graph, "graph", build)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@task_bp.route("/tasks/graph/critical-path", methods=["GET"])
+def get_critical_path():
+    """要徑：決定整體結束日的相依任務鏈"""
+    try:
+        return index_response(dependency_graph, "graph", lambda graph: dict(graph.critical_path()))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@task_bp.route("/tasks/graph/cycles", methods=["GET"])
+def get_dependency_cycles():
+    """相依循環檢查"""
+    try:
+        return index_response(dependency_graph, "graph", lambda graph: {"cycles": graph.cycles()})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@task_bp.route("/tasks/<int:task_id>/impact", methods=["GET"])
+def get_task_impact(task_id):
+    """影響分析：任務延後 days 天時，後續任務各會延後幾天"""
+    try:
+        days = request.args.get("days", "1")
+        try:
+            days = int(days)
+        except ValueError:
+            raise ValueError(f"Invalid days: {days}")
+        return index_response(dependency_graph, "graph", lambda graph: graph.impact(task_id, days))
+    except KeyError:
+        return jsonify({"error": "Task not found"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@task_bp.route("/tasks/search", methods=["GET"])
+def search_tasks():
+    """全文搜尋里程碑、內容說明、風險與假期影響，依相關度排序
+
+    查詢參數：q（必填）、limit（預設20）、offset。
+    """
+    try:
+        text, limit, offset = parse_search(request.args)
+        rows, has_more = task_search.search(g.event.id, text, limit, offset)
+        return jsonify(search_payload(rows, has_more, offset))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@task_bp.route("/tasks/stats", methods=["GET"])
+def get_task_stats():
+    """儀表板統計：各階段、負責人與週的數量、完成率與逾期數量
+
+    today 可指定計算逾期的基準日（預設為今天）。
+    """
+    try:
+        today = parse_today(request.args)
+        version = g.event.version
+        cache = task_stats_cache.for_event(g.event.id)
+
+        etag = cache.etag(today, version)
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag)
+
+        entry = cache.get(today, version)
+        if entry is None:
+            body = (current_app.json.dumps(Task.stats(g.event.id, today)) + "\n").encode("utf-8")
+            entry = cache.put(today, version, body)
+
+        response = current_app.response_class(entry.body, mimetype="application/json")
+        response.set_etag(entry.etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@task_bp.route("/tasks/window", methods=["GET"])
+def get_tasks_in_window():
+    """時間軸查詢：與 from～to 日期區間重疊的任務，依開始日排序"""
     try:
-        tasks = Task.get_all()
-        return jsonify([task.to_dict() for task in tasks])
+        window = parse_window(request.args)
+        if window is None:
+            raise ValueError("from and to are required")
+        return index_response(task_intervals, "window", lambda index: [
+            task.to_dict() for task in index.window(*window)])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@task_bp.route("/tasks/active", methods=["GET"])
+def get_active_tasks():
+    """指定日期（date，預設為今天）進行中的任務"""
+    try:
+        day = request.args.get("date") or date.today().isoformat()
+        return index_response(task_intervals, "active", lambda index: [
+            task.to_dict() for task in index.active_on(day)])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -19,7 +468,8 @@ def get_tasks():
 def add_task():
     """新增任務"""
     try:
-        data = request.json
+        data = json_body()
+        Task.validate_columns(Task.columns_from_wire(data), required=True)
         
         # 創建新任務
         new_task = Task(
@@ -31,50 +481,47 @@ def add_task():
             holiday_impact=data.get("holidayImpact"),
             dependencies=data.get("dependencies"),
             responsible=data.get("responsible"),
-            risks=data.get("risks")
+            risks=data.get("risks"),
+            event_id=g.event.id
         )
         
         # 保存任務
         saved_task = new_task.save()
         if saved_task:
-            return jsonify(saved_task.to_dict()), 201
+            return task_response(saved_task, 201)
         else:
             return jsonify({"error": "Failed to create task"}), 500
             
+    except EventUnavailable as e:
+        return event_unavailable(e)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@task_bp.route("/tasks/<int:task_id>", methods=["PUT"])
+@task_bp.route("/tasks/<int:task_id>", methods=["PUT", "PATCH"])
 def update_task(task_id):
-    """更新任務"""
+    """更新任務（只更新請求中提供的欄位）
+
+    帶If-Match標頭或version欄位時只在版本號相符時更新，否則返回409與目前的任務。
+    """
     try:
-        # 獲取現有任務
-        task = Task.get_by_id(task_id)
-        if not task:
-            return jsonify({"error": "Task not found"}), 404
-        
-        data = request.json
+        data = json_body()
         
-        # 更新任務資料
-        task.stage = data.get("stage", task.stage)
-        task.milestone = data.get("milestone", task.milestone)
-        task.start_date = data.get("startDate", task.start_date)
-        task.end_date = data.get("endDate", task.end_date)
-        task.content = data.get("description", task.content)
-        task.holiday_impact = data.get("holidayImpact", task.holiday_impact)
-        task.dependencies = data.get("dependencies", task.dependencies)
-        task.responsible = data.get("responsible", task.responsible)
-        task.risks = data.get("risks", task.risks)
-        # 處理完成狀態字段 - 支持 isCompleted 和 completed
-        if "isCompleted" in data:
-            task.completed = data["isCompleted"]
-        elif "completed" in data:
-            task.completed = data["completed"]
-        
-        # 保存更新
-        updated_task = task.save()
-        return jsonify(updated_task.to_dict())
+        # 處理完成狀態字段 - 支持 isCompleted 和 completed；提供的欄位不可為空、日期須合法
+        values = Task.columns_from_wire(data)
+        Task.validate_columns(values)
+        updated_task = Task.update_fields(g.event.id, task_id, values, expected_version(data))
+        if not updated_task:
+            return jsonify({"error": "Task not found"}), 404
+        return task_response(updated_task)
         
+    except VersionConflict as e:
+        return version_conflict(e)
+    except EventUnavailable as e:
+        return event_unavailable(e)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -82,32 +529,64 @@ def update_task(task_id):
 def toggle_task_complete(task_id):
     """切換任務完成狀態"""
     try:
-        # 獲取現有任務
-        task = Task.get_by_id(task_id)
-        if not task:
+        # 以單一語句原子地切換完成狀態
+        updated_task = Task.toggle_completed(g.event.id, task_id, expected_version())
+        if not updated_task:
             return jsonify({"error": "Task not found"}), 404
+        return task_response(updated_task)
         
-        # 切換完成狀態
-        task.completed = not task.completed
-        
-        # 保存更新
-        updated_task = task.save()
-        return jsonify(updated_task.to_dict())
-        
+    except VersionConflict as e:
+        return version_conflict(e)
+    except EventUnavailable as e:
+        return event_unavailable(e)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @task_bp.route("/tasks/<int:task_id>", methods=["DELETE"])
 def delete_task(task_id):
-    """刪除任務"""
+    """刪除任務；帶If-Match標頭或version欄位時只在版本號相符時刪除"""
     try:
         # 嘗試刪除任務
-        success = Task.delete_by_id(task_id)
+        success = Task.delete_by_id(g.event.id, task_id, expected_version(request.get_json(silent=True)))
         if success:
             return jsonify({"message": "Task deleted successfully"}), 200
         else:
             return jsonify({"error": "Task not found"}), 404
             
+    except VersionConflict as e:
+        return version_conflict(e)
+    except EventUnavailable as e:
+        return event_unavailable(e)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@task_bp.route("/tasks/bulk", methods=["POST"])
+def bulk_tasks():
+    """在單一交易中批次新增、更新、切換完成狀態與刪除任務
+
+    請求格式：{"operations": [{"op": "create", "data": {...}},
+                              {"op": "update", "id": 1, "version": 3, "data": {...}},
+                              {"op": "toggle", "id": 2},
+                              {"op": "delete", "id": 3}]}
+    """
+    try:
+        data = json_body()
+        results = Task.apply_bulk(g.event.id, data.get("operations"))
+
+        summary = {}
+        for result in results:
+            summary[result["status"]] = summary.get(result["status"], 0) + 1
+
+        return jsonify({"results": results, "summary": summary}), 200
+
+    except EventUnavailable as e:
+        return event_unavailable(e)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -115,24 +594,28 @@ def delete_task(task_id):
 def batch_delete_tasks():
     """批量刪除任務"""
     try:
-        data = request.json
+        data = json_body()
         task_ids = data.get("taskIds", [])
         
         if not task_ids:
             return jsonify({"error": "No task IDs provided"}), 400
         
-        deleted_count = 0
         errors = []
-        
+        operations = []
         for task_id in task_ids:
-            try:
-                success = Task.delete_by_id(task_id)
-                if success:
+            if isinstance(task_id, int) and not isinstance(task_id, bool):
+                operations.append({"op": "delete", "id": task_id})
+            else:
+                errors.append(f"Error deleting task {task_id}: invalid task ID")
+        
+        # 以單一交易、單一 DELETE 語句刪除
+        deleted_count = 0
+        if operations:
+            for result in Task.apply_bulk(g.event.id, operations):
+                if result["status"] == "deleted":
                     deleted_count += 1
                 else:
-                    errors.append(f"Task {task_id} not found")
-            except Exception as e:
-                errors.append(f"Error deleting task {task_id}: {str(e)}")
+                    errors.append(f"Task {result['id']} not found")
         
         result = {
             "message": f"Successfully deleted {deleted_count} tasks",
@@ -145,67 +628,62 @@ def batch_delete_tasks():
         
         return jsonify(result), 200
             
+    except EventUnavailable as e:
+        return event_unavailable(e)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @task_bp.route("/import-data", methods=["POST", "GET"])
 def import_data():
-    """匯入Excel資料到資料庫"""
+    """匯入Excel資料到資料庫
+
+    預設讀取專案根目錄的 excel_data.json；POST 時也可以用 multipart 欄位 file 上傳JSON檔。
+    依「階段＋里程碑」更新既有任務，重複匯入不會產生重複資料。
+    """
     try:
-        # 找到 excel_data.json 檔案
-        json_file = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'excel_data.json')
-        
-        if not os.path.exists(json_file):
-            return jsonify({"error": f"找不到資料檔案: {json_file}"}), 404
-        
-        # 讀取JSON資料
-        with open(json_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # 清空現有資料（可選）
-        # Task.delete_all()  # 如果需要清空現有資料，取消註解這行
-        
-        migrated_count = 0
-        errors = []
-        
-        for item in data:
-            try:
-                # 創建新任務
-                task = Task(
-                    stage=item.get('階段', ''),
-                    milestone=item.get('里程碑', ''),
-                    start_date=item.get('開始日', ''),  # 修正欄位名稱
-                    end_date=item.get('結束日', ''),    # 修正欄位名稱
-                    content=item.get('內容說明', ''),
-                    holiday_impact=item.get('假期影響', ''),
-                    dependencies=item.get('相依關係', ''),
-                    responsible=item.get('負責單位/人', ''),
-                    risks=item.get('風險/備註', '')
-                )
-                
-                # 保存任務
-                saved_task = task.save()
-                if saved_task:
-                    migrated_count += 1
-                else:
-                    errors.append(f"保存失敗: {task.milestone}")
-                    
-            except Exception as e:
-                errors.append(f"處理錯誤: {item.get('里程碑', 'Unknown')} - {str(e)}")
-        
+        importer = TaskImporter(batch_size=request.args.get("batchSize", 500, type=int), event_id=g.event.id)
+
+        upload = request.files.get("file") if request.method == "POST" else None
+        if upload is not None:
+            result = importer.import_file(io.TextIOWrapper(upload.stream, encoding="utf-8"))
+        else:
+            # 找到 excel_data.json 檔案
+            json_file = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'excel_data.json')
+
+            if not os.path.exists(json_file):
+                return jsonify({"error": f"找不到資料檔案: {json_file}"}), 404
+
+            # 串流讀取JSON資料
+            with open(json_file, 'r', encoding='utf-8') as f:
+                result = importer.import_file(f)
+
+        errors = [
+            f"第 {error['row']} 筆 {error['milestone'] or 'Unknown'}: {error['error']}"
+            for error in result["errors"]
+        ]
+
         # 返回結果
-        result = {
-            "message": f"資料匯入完成！成功匯入 {migrated_count} 筆資料",
-            "imported_count": migrated_count,
-            "total_count": len(data),
-            "errors": errors
+        response = {
+            "message": f"資料匯入完成！成功匯入 {result['imported']} 筆資料",
+            "imported_count": result["imported"],
+            "inserted_count": result["inserted"],
+            "updated_count": result["updated"],
+            "unchanged_count": result["unchanged"],
+            "total_count": result["total"],
+            "elapsed_seconds": result["elapsed_seconds"],
+            "rows_per_second": result["rows_per_second"],
+            "errors": errors,
+            "row_errors": result["errors"]
         }
-        
+
         if errors:
-            result["warning"] = f"有 {len(errors)} 筆資料匯入時發生錯誤"
-        
-        return jsonify(result), 200
-        
+            response["warning"] = f"有 {len(errors)} 筆資料匯入時發生錯誤"
+
+        return jsonify(response), 200
+
+    except EventUnavailable as e:
+        return event_unavailable(e)
     except Exception as e:
         return jsonify({"error": f"匯入失敗: {str(e)}"}), 500
-
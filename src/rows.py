@@ -0,0 +1,81 @@
+import sqlite3
+from datetime import datetime
+from operator import attrgetter, itemgetter
+
+
+def isoformat(value):
+    """datetime轉為ISO 8601字串，其他值原樣返回"""
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+class ColumnGetter:
+    """依欄位名稱從資料列取值，返回依columns順序排列的tuple
+
+    sqlite3.Row以名稱取值需逐欄比對，因此依結果欄位順序換算為位置索引並快取；
+    字典（psycopg2的RealDictRow）直接以名稱取值。
+    """
+
+    def __init__(self, columns):
+        self.columns = tuple(columns)
+        self._by_name = itemgetter(*self.columns)
+        self._by_position = {}
+
+    def for_row(self, row):
+        """取得適用於此類資料列的取值函式"""
+        if not isinstance(row, sqlite3.Row):
+            return self._by_name
+        keys = tuple(row.keys())
+        getter = self._by_position.get(keys)
+        if getter is None:
+            getter = self._by_position[keys] = itemgetter(*(keys.index(column) for column in self.columns))
+        return getter
+
+    def __call__(self, row):
+        return self.for_row(row)(row)
+
+
+class RowMapper:
+    """預先編譯的欄位→前端名稱轉換器
+
+    建立時依欄位與轉換函式產生一個直接建立字典的函式，轉換時每筆資料列
+    只做一次取值與一次函式呼叫；批次轉換時取值函式也只決定一次。
+    """
+
+    def __init__(self, fields, converters=None):
+        converters = converters or {}
+        self.columns = tuple(column for column, _ in fields)
+        self.keys = tuple(key for _, key in fields)
+        self.values = ColumnGetter(self.columns)
+        self._attr_values = attrgetter(*self.columns)
+        self.from_values = self._compile(fields, converters)
+
+    @staticmethod
+    def _compile(fields, converters):
+        """產生由值tuple建立前端字典的函式"""
+        namespace = {}
+        items = []
+        for index, (column, key) in enumerate(fields):
+            if column in converters:
+                namespace[f'convert_{index}'] = converters[column]
+                items.append(f'{key!r}: convert_{index}(values[{index}])')
+            else:
+                items.append(f'{key!r}: values[{index}]')
+        source = f"def from_values(values):\n    return {{{', '.join(items)}}}\n"
+        exec(source, namespace)
+        return namespace['from_values']
+
+    def __call__(self, row):
+        """轉換一筆資料庫資料列"""
+        return self.from_values(self.values(row))
+
+    def map_rows(self, rows):
+        """轉換一批欄位相同的資料列"""
+        if not rows:
+            return []
+        values = self.values.for_row(rows[0])
+        from_values = self.from_values
+        return [from_values(values(row)) for row in rows]
+
+    def from_object(self, obj):
+        """轉換具有同名屬性的物件"""
+        return self.from_values(self._attr_values(obj))
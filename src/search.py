@@ -0,0 +1,192 @@
+import re
+from .database import db
+
+# 建立全文索引的欄位，依權重由高到低
+SEARCH_COLUMNS = ('milestone', 'content', 'risks', 'holiday_impact')
+
+# SQLite bm25 各欄位的權重（與SEARCH_COLUMNS順序相同）
+BM25_WEIGHTS = (10.0, 4.0, 2.0, 2.0)
+
+# PostgreSQL setweight 使用的權重等級（與SEARCH_COLUMNS順序相同）
+TSVECTOR_WEIGHTS = ('A', 'B', 'C', 'D')
+
+WORD_RUN = re.compile(r'\w+')
+SCRIPT_RUN = re.compile(r'[a-z0-9_]+|[^a-z0-9_]+')
+
+
+def _runs(text):
+    """切出英數字詞與中文（非ASCII）字串，返回 (字串, 是否為英數) 的列表"""
+    runs = []
+    for word in WORD_RUN.findall(str(text).lower()):
+        for run in SCRIPT_RUN.findall(word):
+            if run.strip('_'):
+                runs.append((run.strip('_'), run.isascii()))
+    return runs
+
+
+def document_tokens(text):
+    """索引用的詞：英數字詞整個保留；中文取相鄰兩字，並加上每段最後一字
+
+    加上最後一字後，每個中文字都是某個詞的開頭，單字查詢以前綴比對即可找到。
+    """
+    if text is None:
+        return []
+    tokens = []
+    for run, ascii_run in _runs(text):
+        if ascii_run or len(run) == 1:
+            tokens.append(run)
+            continue
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        tokens.append(run[-1])
+    return tokens
+
+
+def query_terms(text):
+    """查詢用的詞，返回 (詞, 是否前綴比對) 的列表
+
+    中文兩字以上只比對相鄰兩字；單一中文字與英數字詞以前綴比對，方便邊輸入邊搜尋。
+    """
+    terms = []
+    seen = set()
+    for run, ascii_run in _runs(text):
+        if ascii_run or len(run) == 1:
+            candidates = [(run, True)]
+        else:
+            candidates = [(run[i:i + 2], False) for i in range(len(run) - 1)]
+        for term in candidates:
+            if term not in seen:
+                seen.add(term)
+                terms.append(term)
+    return terms
+
+
+class TaskSearch:
+    """任務的全文搜尋索引
+
+    SQLite使用FTS5虛擬表（rowid為任務ID），PostgreSQL使用tsvector欄位與GIN索引。
+    斷詞在Python中完成，兩種資料庫的索引內容一致。每次寫入在同一交易中
+    依變更序號重新索引被修改的任務並移除已刪除的任務。封存活動的任務不在索引中。
+    """
+
+    def create_schema(self, cursor):
+        """建立索引表；新建立時以現有任務填入"""
+        if db.use_sqlite:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'task_search'")
+            exists = cursor.fetchone() is not None
+            cursor.execute(f'''
+                CREATE VIRTUAL TABLE IF NOT EXISTS task_search
+                USING fts5({', '.join(SEARCH_COLUMNS)}, tokenize = 'unicode61 remove_diacritics 0')
+            ''')
+        else:
+            cursor.execute("SELECT to_regclass('task_search') IS NOT NULL AS present")
+            exists = cursor.fetchone()['present']
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS task_search (
+                    id INTEGER PRIMARY KEY REFERENCES tasks (id) ON DELETE CASCADE,
+                    document TSVECTOR NOT NULL
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_task_search_document ON task_search USING gin (document)')
+        if not exists:
+            self.rebuild(cursor)
+
+    def rebuild(self, cursor):
+        """重新索引所有任務"""
+        cursor.execute('DELETE FROM task_search')
+        cursor.execute(f"SELECT id, {', '.join(SEARCH_COLUMNS)} FROM tasks")
+        rows = cursor.fetchall()
+        self._index_rows(cursor, rows)
+
+    def sync(self, event_id, seq):
+        """在寫入交易中呼叫：重新索引活動中變更序號為seq的任務，移除該序號刪除的任務"""
+        p = db.placeholder
+        with db.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT id FROM task_tombstones WHERE event_id = {p} AND change_seq = {p}",
+                           (event_id, seq))
+            deleted = [row['id'] for row in cursor.fetchall()]
+            cursor.execute(f"SELECT id, {', '.join(SEARCH_COLUMNS)} FROM tasks "
+                           f"WHERE event_id = {p} AND change_seq = {p}", (event_id, seq))
+            rows = cursor.fetchall()
+            if deleted:
+                self._delete_ids(cursor, deleted)
+            self._index_rows(cursor, rows)
+
+    def remove_event(self, cursor, event_id):
+        """在封存活動的交易中移除活動所有任務的索引"""
+        key = 'rowid' if db.use_sqlite else 'id'
+        cursor.execute(f"DELETE FROM task_search WHERE {key} IN "
+                       f"(SELECT id FROM tasks WHERE event_id = {db.placeholder})", (event_id,))
+
+    def index_event(self, cursor, event_id):
+        """在還原活動的交易中重新索引活動的所有任務"""
+        cursor.execute(f"SELECT id, {', '.join(SEARCH_COLUMNS)} FROM tasks WHERE event_id = {db.placeholder}",
+                       (event_id,))
+        self._index_rows(cursor, cursor.fetchall())
+
+    def _delete_ids(self, cursor, ids):
+        condition, params = db.any_of('rowid' if db.use_sqlite else 'id', ids)
+        cursor.execute(f"DELETE FROM task_search WHERE {condition}", params)
+
+    def _index_rows(self, cursor, rows):
+        if not rows:
+            return
+        documents = [(row['id'],) + tuple(' '.join(document_tokens(row[column])) for column in SEARCH_COLUMNS)
+                     for row in rows]
+        if db.use_sqlite:
+            condition, params = db.any_of('rowid', [document[0] for document in documents])
+            cursor.execute(f"DELETE FROM task_search WHERE {condition}", params)
+            cursor.executemany(
+                f"INSERT INTO task_search (rowid, {', '.join(SEARCH_COLUMNS)}) "
+                f"VALUES (?{', ?' * len(SEARCH_COLUMNS)})", documents)
+        else:
+            vector = ' || '.join(f"setweight(to_tsvector('simple', %s), '{weight}')" for weight in TSVECTOR_WEIGHTS)
+            cursor.executemany(f'''
+                INSERT INTO task_search (id, document) VALUES (%s, {vector})
+                ON CONFLICT (id) DO UPDATE SET document = excluded.document
+            ''', documents)
+
+    def search(self, event_id, text, limit=20, offset=0):
+        """依相關度排序搜尋活動的任務，返回 (資料列列表, 是否還有更多)；每筆資料列附帶score"""
+        query, params = self.search_query(event_id, text, limit, offset)
+        rows = db.execute_query(query, params)
+        return rows[:limit], len(rows) > limit
+
+    def search_query(self, event_id, text, limit, offset):
+        """組合搜尋查詢，返回 (SQL, 參數)；多取一筆用來判斷是否還有更多"""
+        terms = query_terms(text)
+        if not terms:
+            raise ValueError("Search query must contain letters or digits")
+        if db.use_sqlite:
+            match = ' '.join('"{}"'.format(term) + ('*' if prefix else '') for term, prefix in terms)
+            weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+            # 先在索引內排序取出一頁，再與tasks合併；bm25越小越相關，轉為越大越相關的分數
+            query = f'''
+                SELECT tasks.*, -s.rank AS score
+                FROM (
+                    SELECT task_search.rowid, bm25(task_search, {weights}) AS rank
+                    FROM task_search
+                    JOIN tasks ON tasks.id = task_search.rowid
+                    WHERE task_search MATCH ? AND tasks.event_id = ?
+                    ORDER BY rank, task_search.rowid
+                    LIMIT ? OFFSET ?
+                ) AS s
+                JOIN tasks ON tasks.id = s.rowid
+                ORDER BY s.rank, tasks.id
+            '''
+        else:
+            match = ' & '.join(f"'{term}'" + (':*' if prefix else '') for term, prefix in terms)
+            query = '''
+                SELECT tasks.*, ts_rank_cd(s.document, q) AS score
+                FROM task_search AS s
+                JOIN tasks ON tasks.id = s.id,
+                     to_tsquery('simple', %s) AS q
+                WHERE s.document @@ q AND tasks.event_id = %s
+                ORDER BY score DESC, tasks.id
+                LIMIT %s OFFSET %s
+            '''
+        return query, (match, event_id, limit + 1, offset)
+
+
+# 全域任務搜尋索引
+task_search = TaskSearch()
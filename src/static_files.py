@@ -0,0 +1,130 @@
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from collections import namedtuple
+from flask import request, send_file
+
+# 建置工具（Vite）輸出到 assets/ 的檔案名稱帶有8字元的內容雜湊，例如 assets/index-u5qcqU_E.js；
+# 其他檔案（例如 apple-touch-icon.png）即使名稱中有連字號也不視為帶雜湊
+ASSETS_DIR = 'assets/'
+FINGERPRINT = re.compile(r'-[A-Za-z0-9_-]{8}\.(?:js|mjs|css|map|wasm|woff2?|ttf|otf|eot|'
+                         r'png|jpe?g|gif|svg|webp|avif|ico)$')
+
+# 預先壓縮檔的副檔名與對應的Content-Encoding，依偏好順序排列
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# 值得壓縮的檔案類型
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json',
+                      'image/svg+xml', 'image/vnd.microsoft.icon', 'image/x-icon')
+
+# 有檔名雜湊的檔案內容不會變，可長期快取
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+DEFAULT_CACHE = 'public, max-age=3600'
+NO_CACHE = 'no-cache'
+
+StaticFile = namedtuple('StaticFile', ['path', 'mimetype', 'size', 'mtime', 'etag', 'immutable', 'variants'])
+
+
+def is_compressible(mimetype):
+    return mimetype is not None and mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+def is_fingerprinted(relative):
+    """相對路徑是否為建置工具輸出、檔名帶內容雜湊的檔案"""
+    return relative.startswith(ASSETS_DIR) and FINGERPRINT.search(relative) is not None
+
+
+def _file_etag(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:20]
+
+
+class StaticManifest:
+    """啟動時掃描靜態檔案目錄建立的清單
+
+    每個檔案記錄類型、大小與預先壓縮的版本（.br/.gz），請求時只查表，
+    不再呼叫檔案系統判斷檔案是否存在。內容雜湊的ETag在第一次請求該檔案時才計算（以鎖保護寫回），
+    啟動時只需讀取目錄。
+    """
+
+    def __init__(self, root, index='index.html'):
+        self.root = os.path.abspath(root) if root else None
+        self.index = index
+        self.files = {}
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        """重新掃描目錄"""
+        files = {}
+        if self.root and os.path.isdir(self.root):
+            for directory, _, names in os.walk(self.root):
+                names = set(names)
+                for name in names:
+                    if name.endswith(tuple(suffix for _, suffix in ENCODINGS)):
+                        continue
+                    path = os.path.join(directory, name)
+                    relative = os.path.relpath(path, self.root).replace(os.sep, '/')
+                    stat = os.stat(path)
+                    mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                    variants = {encoding: os.path.join(directory, name + suffix)
+                                for encoding, suffix in ENCODINGS if name + suffix in names}
+                    files[relative] = StaticFile(
+                        path=path, mimetype=mimetype, size=stat.st_size, mtime=stat.st_mtime,
+                        etag=None, immutable=is_fingerprinted(relative),
+                        variants=variants)
+        self.files = files
+
+    def get(self, path):
+        return self.files.get(path)
+
+    def _load_etag(self, path, entry):
+        """計算並記錄檔案的ETag；同時請求同一檔案的執行緒只計算一次"""
+        with self._lock:
+            files = self.files
+            current = files.get(path, entry)
+            if current.etag is None:
+                current = current._replace(etag=_file_etag(current.path))
+                if path in files:
+                    files[path] = current
+            return current
+
+    def response(self, path):
+        """產生靜態檔案回應；找不到檔案時回傳 index.html（前端路由），都沒有時返回None"""
+        entry = self.files.get(path) if path else None
+        if entry is None:
+            entry = self.files.get(self.index)
+            path = self.index
+            if entry is None:
+                return None
+
+        if entry.etag is None:
+            entry = self._load_etag(path, entry)
+
+        file_path, etag, encoding = entry.path, entry.etag, None
+        accepted = request.accept_encodings
+        for candidate, _ in ENCODINGS:
+            if candidate in entry.variants and accepted[candidate]:
+                file_path, etag, encoding = entry.variants[candidate], f'{entry.etag}-{candidate}', candidate
+                break
+
+        # send_file處理If-None-Match/If-Modified-Since與Range，並在伺服器支援時使用sendfile
+        response = send_file(file_path, mimetype=entry.mimetype, conditional=True,
+                             etag=etag, last_modified=entry.mtime, max_age=None)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        if entry.variants:
+            response.vary.add('Accept-Encoding')
+
+        if path == self.index:
+            response.headers['Cache-Control'] = NO_CACHE
+        elif entry.immutable:
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE
+        else:
+            response.headers['Cache-Control'] = DEFAULT_CACHE
+        return response
@@ -0,0 +1,23 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def stream_json_array(batches, to_items, dumps):
+    """將批次資料列逐批編碼為JSON陣列，每批產生一段UTF-8位元組
+
+    記憶體中同時只有一批資料列與其編碼結果。回應標頭送出後已無法
+    改回錯誤狀態碼，因此讀取中途失敗時記錄錯誤並中止輸出，
+    客戶端會收到不完整的JSON。
+    """
+    yield b'['
+    separator = ''
+    try:
+        for rows in batches:
+            chunk = ','.join(dumps(item) for item in to_items(rows))
+            yield (separator + chunk).encode('utf-8')
+            separator = ','
+    except Exception:
+        logger.exception("串流回應中途失敗")
+        raise
+    yield b']\n'
@@ -5,8 +5,8 @@ import sys
 # 添加專案路徑
 sys.path.insert(0, os.path.dirname(__file__))
 
-from src.main import app
+from src.main import create_app
 
 if __name__ == '__main__':
+    app = create_app()
     app.run(host='0.0.0.0', port=5001, debug=True)
-